@@ -0,0 +1,141 @@
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+
+def normalize_query(query: str) -> str:
+    """Chuẩn hoá câu hỏi để so khớp chính xác: NFC, chữ thường, bỏ dấu câu, gộp khoảng trắng"""
+    query = unicodedata.normalize("NFC", query).lower()
+    query = re.sub(r"[^\w\s]", " ", query)
+    return " ".join(query.split())
+
+
+class AnswerCache:
+    """Cache câu trả lời của CVChatBot.chat.
+
+    Tra theo câu hỏi đã chuẩn hoá, nếu không có thì theo độ tương đồng cosine của
+    embedding câu hỏi (>= `similarity_threshold`), chỉ trong cùng `scope` (bộ lọc CV của
+    request). Mỗi entry gắn với phiên bản index;
+    khi index thay đổi thì toàn bộ cache bị xoá, và `put` với phiên bản khác phiên bản hiện tại
+    (câu trả lời tính trên index cũ) bị bỏ qua. Có TTL và giới hạn số entry (LRU).
+    """
+
+    def __init__(self,
+                 max_entries: int = 1000,
+                 ttl_seconds: float = 3600,
+                 similarity_threshold: float = 0.92):
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self._entries: "OrderedDict[Tuple[str, int, str], Dict[str, Any]]" = OrderedDict()
+        self._index_version = None
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _unit(embedding: Optional[np.ndarray]) -> Optional[np.ndarray]:
+        if embedding is None:
+            return None
+        vector = np.asarray(embedding, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else None
+
+    def _sync_version(self, index_version: Any):
+        if index_version != self._index_version:
+            self._entries.clear()
+            self._index_version = index_version
+
+    def _expire(self):
+        now = time.time()
+        expired = [key for key, entry in self._entries.items()
+                   if now - entry["created_at"] > self.ttl_seconds]
+        for key in expired:
+            del self._entries[key]
+
+    def get(self,
+            query: str,
+            top_k: int,
+            index_version: Any,
+            query_embedding: Optional[np.ndarray] = None,
+            scope: str = "",
+            exact_only: bool = False) -> Optional[Dict[str, Any]]:
+        """Câu trả lời đã cache cho câu hỏi, None nếu không có.
+
+        Với `exact_only=True` chỉ tra theo câu hỏi chuẩn hoá (không cần embedding) và không tính
+        là miss, để caller chỉ phải embed câu hỏi khi lần tra chính xác không trúng.
+        """
+        with self._lock:
+            self._sync_version(index_version)
+            self._expire()
+
+            key = (normalize_query(query), top_k, scope)
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return entry["result"]
+            if exact_only:
+                return None
+
+            vector = self._unit(query_embedding)
+            if vector is not None:
+                best_key, best_score = None, self.similarity_threshold
+                for other_key, other in self._entries.items():
+                    if other_key[1:] != key[1:] or other["embedding"] is None:
+                        continue
+                    score = float(np.dot(vector, other["embedding"]))
+                    if score >= best_score:
+                        best_key, best_score = other_key, score
+                if best_key is not None:
+                    self._entries.move_to_end(best_key)
+                    self.semantic_hits += 1
+                    return self._entries[best_key]["result"]
+
+            self.misses += 1
+            return None
+
+    def put(self,
+            query: str,
+            top_k: int,
+            index_version: Any,
+            result: Dict[str, Any],
+            query_embedding: Optional[np.ndarray] = None,
+            scope: str = ""):
+        with self._lock:
+            if self._index_version is None:
+                self._index_version = index_version
+            if index_version != self._index_version:
+                # Index đã đổi sau khi câu trả lời này được tìm kiếm
+                return
+            key = (normalize_query(query), top_k, scope)
+            self._entries[key] = {
+                "result": result,
+                "embedding": self._unit(query_embedding),
+                "created_at": time.time(),
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self.exact_hits + self.semantic_hits
+            total = hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": hits / total if total else 0.0,
+            }
@@ -1,11 +1,20 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Union
+from datetime import datetime
 import os
+import json
 import shutil
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from model_infer import CVChatBot
 from process_store_class import CVProcessor, FAISSVectorStore
+from ingest import IngestionPipeline
+from jobs import IngestionJob, JobQueue
 
 app = FastAPI(title="CV ChatBot API", version="1.0.0")
 
@@ -20,22 +29,101 @@ app.add_middleware(
 
 # Global chatbot instance
 chatbot = None
+_chatbot_lock = threading.Lock()
 
 def get_chatbot():
     global chatbot
-    if chatbot is None:
-        chatbot = CVChatBot()
+    with _chatbot_lock:
+        if chatbot is None:
+            chatbot = CVChatBot()
     return chatbot
 
+# Blocking work (Gemini, Ollama, FAISS, file I/O) runs in a thread pool so the event loop
+# stays responsive; each endpoint group has its own concurrency limit.
+executor = ThreadPoolExecutor(max_workers=int(os.getenv("API_WORKER_THREADS", "16")),
+                              thread_name_prefix="api-worker")
+concurrency_limits = {
+    "chat": int(os.getenv("API_CHAT_CONCURRENCY", "8")),
+    "search": int(os.getenv("API_SEARCH_CONCURRENCY", "16")),
+    "upload": int(os.getenv("API_UPLOAD_CONCURRENCY", "2")),
+    "default": int(os.getenv("API_DEFAULT_CONCURRENCY", "16")),
+}
+_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+# Ingestion (upload, rebuild) runs as background jobs, polled through GET /jobs/{id}
+job_queue = JobQueue(workers=int(os.getenv("INGEST_JOB_WORKERS", "2")))
+
+def get_semaphore(group: str) -> asyncio.Semaphore:
+    semaphore = _semaphores.get(group)
+    if semaphore is None:
+        semaphore = _semaphores[group] = asyncio.Semaphore(concurrency_limits[group])
+    return semaphore
+
+async def run_blocking(group: str, func, *args, **kwargs):
+    """Run a blocking call in the worker pool, limited by the endpoint group's concurrency"""
+    async with get_semaphore(group):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
+
+_STREAM_END = object()
+
+async def iterate_blocking(group: str, iterator):
+    """Consume a blocking iterator from the worker pool, holding the group's slot until it ends"""
+    async with get_semaphore(group):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await loop.run_in_executor(executor, next, iterator, _STREAM_END)
+            if item is _STREAM_END:
+                break
+            yield item
+
+def parse_timestamp(value: Union[float, str, None]) -> Optional[float]:
+    """Unix timestamp hoặc ngày/giờ ISO 8601 (vd. "2024-05-01") -> unix timestamp"""
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return datetime.fromisoformat(str(value)).timestamp()
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid date: {value}")
+
+def build_filters(sources: Optional[List[str]] = None,
+                  uploaded_after: Union[float, str, None] = None,
+                  uploaded_before: Union[float, str, None] = None) -> Optional[Dict[str, Any]]:
+    """Bộ lọc CV cho FAISSVectorStore.search (None nếu không lọc gì)"""
+    filters = {
+        "sources": sources or None,
+        "uploaded_after": parse_timestamp(uploaded_after),
+        "uploaded_before": parse_timestamp(uploaded_before),
+    }
+    return filters if any(value is not None for value in filters.values()) else None
+
 # Pydantic models
-class ChatRequest(BaseModel):
+class SearchFilters(BaseModel):
+    sources: Optional[List[str]] = None
+    uploaded_after: Optional[Union[float, str]] = None
+    uploaded_before: Optional[Union[float, str]] = None
+
+    def to_filters(self) -> Optional[Dict[str, Any]]:
+        return build_filters(self.sources, self.uploaded_after, self.uploaded_before)
+
+class ChatRequest(SearchFilters):
     query: str
     top_k: Optional[int] = 5
+    group_by_candidate: bool = False
 
 class ChatResponse(BaseModel):
     answer: str
     context: str
     sources: List[Dict[str, Any]]
+    stats: Optional[Dict[str, Any]] = None
+
+class BatchSearchRequest(SearchFilters):
+    queries: List[str]
+    top_k: Optional[int] = 5
 
 class CVSummaryResponse(BaseModel):
     total_cvs: int
@@ -53,24 +141,45 @@ async def health_check():
 @app.post("/chat", response_model=ChatResponse)
 async def chat(request: ChatRequest):
     """Chat endpoint"""
+    filters = request.to_filters()
     try:
-        bot = get_chatbot()
-        result = bot.chat(request.query, request.top_k)
+        bot = await run_blocking("default", get_chatbot)
+        result = await run_blocking("chat", bot.chat, request.query, request.top_k, filters,
+                                    request.group_by_candidate)
         
         return ChatResponse(
             answer=result["answer"],
             context=result["context"], 
-            sources=result["sources"]
+            sources=result["sources"],
+            stats=result.get("stats")
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing chat: {str(e)}")
 
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """Chat endpoint streaming the answer as Server-Sent Events (sources, token..., done)"""
+    filters = request.to_filters()
+    bot = await run_blocking("default", get_chatbot)
+
+    async def event_stream():
+        try:
+            events = bot.chat_stream(request.query, request.top_k, filters, request.group_by_candidate)
+            async for event in iterate_blocking("chat", events):
+                yield f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+        except Exception as e:
+            error = {"type": "error", "detail": f"Error processing chat: {str(e)}"}
+            yield f"event: error\ndata: {json.dumps(error, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @app.get("/cv-summary", response_model=CVSummaryResponse)
 async def get_cv_summary():
     """Get CV summary information"""
     try:
-        bot = get_chatbot()
-        summary = bot.get_cv_summary()
+        bot = await run_blocking("default", get_chatbot)
+        summary = await run_blocking("default", bot.get_cv_summary)
         
         return CVSummaryResponse(
             total_cvs=summary["total_cvs"],
@@ -80,46 +189,100 @@ async def get_cv_summary():
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting CV summary: {str(e)}")
 
-@app.post("/upload-cv")
+def save_uploaded_cvs(uploads: List[UploadFile]) -> List[str]:
+    """Save uploaded PDFs into the cv folder (blocking), returns their filenames"""
+    # Tạo thư mục cv nếu chưa có
+    cv_folder = "cv"
+    os.makedirs(cv_folder, exist_ok=True)
+    
+    filenames = []
+    for upload in uploads:
+        # Lưu file
+        file_path = os.path.join(cv_folder, upload.filename)
+        with open(file_path, "wb") as buffer:
+            shutil.copyfileobj(upload.file, buffer)
+        filenames.append(upload.filename)
+    return filenames
+
+def ingest_uploaded_cvs(job: IngestionJob) -> Dict[str, Any]:
+    """Job handler: parse, chunk, embed and index the uploaded CVs with per-file progress"""
+    bot = get_chatbot()
+    holder = bot.index_holder
+    filenames = list(job.files)
+    # Parse / embed chạy ngoài khoá; chỉ upsert từng file và commit mới đi qua holder.modifying()
+    # (rebuild đang chạy sẽ chép lại các file này từ store hiện hành trước khi swap index)
+    pipeline = IngestionPipeline(CVProcessor(), holder.current,
+                                 parse_workers=int(os.getenv("PARSE_WORKERS", "4")),
+                                 profile_store=bot.profile_store,
+                                 modifying=holder.modifying)
+    try:
+        indexed = pipeline.run("cv", filenames, on_progress=job.update_file)
+        if indexed:
+            with holder.modifying([]) as vector_store:
+                vector_store.commit(holder.index_path, holder.metadata_path)
+    finally:
+        # Xóa file nếu không đọc được
+        for filename in pipeline.failed:
+            file_path = os.path.join("cv", filename)
+            if os.path.exists(file_path):
+                os.remove(file_path)
+    
+    return {"indexed": indexed, "failed": pipeline.failed}
+
+def rebuild_vector_store(job: IngestionJob) -> Dict[str, Any]:
+    """Job handler: incremental rebuild from the cv folder, then hot-swap the new index in"""
+    from main import build_vector_store
+    
+    # Requests keep being served from the current index until the new one is fully loaded
+    bot = get_chatbot()
+    if not bot.index_holder.rebuild(lambda index_path, metadata_path: build_vector_store(
+            index_path=index_path, metadata_path=metadata_path, on_progress=job.update_file)):
+        raise RuntimeError("Failed to rebuild vector store")
+    return {"message": "Successfully rebuilt vector store", "generation": bot.index_holder.generation}
+
+def delete_indexed_cv(filename: str) -> int:
+    """Remove the CV file and its chunks from the index (blocking)"""
+    bot = get_chatbot()
+    holder = bot.index_holder
+    with holder.modifying([filename]) as vector_store:
+        os.remove(os.path.join("cv", filename))
+        removed = vector_store.remove_source(filename)
+        if removed:
+            vector_store.commit(holder.index_path, holder.metadata_path)
+        if bot.profile_store is not None:
+            bot.profile_store.remove([filename])
+    return removed
+
+@app.get("/cache-stats")
+async def get_cache_stats():
+    """Hit-rate metrics of the answer and embedding caches"""
+    try:
+        bot = await run_blocking("default", get_chatbot)
+        return bot.get_cache_stats()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting cache stats: {str(e)}")
+
+@app.post("/upload-cv", status_code=202)
 async def upload_cv(file: UploadFile = File(...)):
-    """Upload new CV file"""
+    """Upload new CV file; processing runs as a background job"""
+    return await upload_cvs([file])
+
+@app.post("/upload-cvs", status_code=202)
+async def upload_cvs(files: List[UploadFile] = File(...)):
+    """Upload several CV files as one background ingestion job"""
     try:
         # Kiểm tra file type
-        if not file.filename.lower().endswith('.pdf'):
-            raise HTTPException(status_code=400, detail="Only PDF files are allowed")
-        
-        # Tạo thư mục cv nếu chưa có
-        cv_folder = "cv"
-        os.makedirs(cv_folder, exist_ok=True)
-        
-        # Lưu file
-        file_path = os.path.join(cv_folder, file.filename)
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        for file in files:
+            if not file.filename.lower().endswith('.pdf'):
+                raise HTTPException(status_code=400, detail=f"Only PDF files are allowed: {file.filename}")
         
-        # Process file và update vector store
-        cv_processor = CVProcessor()
-        
-        # Parse CV
-        text = cv_processor.parse_cv_to_markdown(file_path)
-        if not text.strip():
-            os.remove(file_path)  # Xóa file nếu không đọc được
-            raise HTTPException(status_code=400, detail="Cannot parse CV content")
-        
-        # Chunk text
-        docs = cv_processor.chunk_text(text, source=file.filename)
-        
-        # Generate embeddings
-        embeddings = cv_processor.get_embeddings([doc.page_content for doc in docs])
-        
-        # Update vector store
-        bot = get_chatbot()
-        bot.vector_store.add_documents(docs, embeddings)
-        bot.vector_store.save("cv_index.faiss", "cv_metadata.json")
+        filenames = await run_blocking("upload", save_uploaded_cvs, files)
+        job = job_queue.submit("upload", ingest_uploaded_cvs, filenames)
         
         return {
-            "message": f"Successfully uploaded and processed {file.filename}",
-            "chunks_created": len(docs)
+            "message": f"Queued {len(filenames)} CV file(s) for processing",
+            "job_id": job.id,
+            "status_url": f"/jobs/{job.id}"
         }
         
     except HTTPException:
@@ -127,19 +290,33 @@ async def upload_cv(file: UploadFile = File(...)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error uploading CV: {str(e)}")
 
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Status and per-file progress of an ingestion job"""
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+@app.get("/jobs")
+async def list_jobs(limit: int = 50):
+    """Most recent ingestion jobs"""
+    return [job.to_dict() for job in job_queue.list(limit)]
+
 @app.delete("/cv/{filename}")
 async def delete_cv(filename: str):
-    """Delete CV file (note: requires rebuilding vector store)"""
+    """Delete CV file and its vectors from the index"""
     try:
         file_path = os.path.join("cv", filename)
         
         if not os.path.exists(file_path):
             raise HTTPException(status_code=404, detail="CV file not found")
         
-        os.remove(file_path)
+        removed = await run_blocking("upload", delete_indexed_cv, filename)
         
         return {
-            "message": f"Successfully deleted {filename}. Please rebuild vector store to update search index."
+            "message": f"Successfully deleted {filename}",
+            "chunks_removed": removed
         }
         
     except HTTPException:
@@ -147,33 +324,29 @@ async def delete_cv(filename: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error deleting CV: {str(e)}")
 
-@app.post("/rebuild-index")
+@app.post("/rebuild-index", status_code=202)
 async def rebuild_index():
-    """Rebuild vector store from CV folder"""
-    try:
-        from main import build_vector_store
-        
-        # Rebuild vector store
-        success = build_vector_store()
-        
-        if success:
-            # Reload chatbot
-            global chatbot
-            chatbot = CVChatBot()
-            
-            return {"message": "Successfully rebuilt vector store"}
-        else:
-            raise HTTPException(status_code=500, detail="Failed to rebuild vector store")
-            
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error rebuilding index: {str(e)}")
+    """Rebuild vector store from CV folder as a background job"""
+    # Chỉ một rebuild tại một thời điểm: trả về job đang chờ/đang chạy nếu có
+    job = job_queue.active("rebuild") or job_queue.submit("rebuild", rebuild_vector_store)
+    return {
+        "message": "Rebuild queued",
+        "job_id": job.id,
+        "status_url": f"/jobs/{job.id}"
+    }
 
 @app.get("/search")
-async def search_cvs(q: str, top_k: int = 5):
-    """Direct search endpoint"""
+async def search_cvs(q: str, top_k: int = 5,
+                     sources: Optional[List[str]] = Query(None),
+                     uploaded_after: Optional[str] = None,
+                     uploaded_before: Optional[str] = None,
+                     group_by_candidate: bool = False):
+    """Direct search endpoint, optionally restricted to some CV files / an upload date range"""
+    filters = build_filters(sources, uploaded_after, uploaded_before)
     try:
-        bot = get_chatbot()
-        context, sources = bot.search_relevant_context(q, top_k)
+        bot = await run_blocking("default", get_chatbot)
+        context, sources = await run_blocking("search", bot.search_relevant_context, q, top_k,
+                                              None, filters, group_by_candidate)
         
         return {
             "query": q,
@@ -185,6 +358,29 @@ async def search_cvs(q: str, top_k: int = 5):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error searching: {str(e)}")
 
+@app.post("/search/batch")
+async def search_cvs_batch(request: BatchSearchRequest):
+    """Search many queries at once (one embedding batch, one FAISS search)"""
+    filters = request.to_filters()
+    try:
+        bot = await run_blocking("default", get_chatbot)
+        batch = await run_blocking("search", bot.search_many, request.queries, request.top_k, filters)
+        
+        return {
+            "results": [
+                {
+                    "query": query,
+                    "context": context,
+                    "sources": sources,
+                    "total_results": len(sources)
+                }
+                for query, (context, sources) in zip(request.queries, batch)
+            ]
+        }
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error searching: {str(e)}")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -174,28 +174,45 @@ def main():
             
             with col_k:
                 top_k = st.number_input("Top K:", min_value=1, max_value=20, value=5)
+                group_by_candidate = st.checkbox("Theo ứng viên", help="Top K là số CV, mỗi CV lấy các đoạn liên quan nhất")
                 submitted = st.form_submit_button("📤 Gửi", type="primary")
         
         if submitted and user_input:
             # Add user message
             st.session_state.messages.append({"role": "user", "content": user_input})
             
-            # Get bot response
-            with st.spinner("🤔 Đang suy nghĩ..."):
-                try:
-                    result = st.session_state.chatbot.chat(user_input, top_k)
-                    
-                    # Add bot message
-                    st.session_state.messages.append({
-                        "role": "assistant", 
-                        "content": result["answer"]
-                    })
-                    
-                    # Store sources for display
-                    st.session_state.last_sources = result["sources"]
-                    
-                except Exception as e:
-                    st.error(f"Lỗi: {str(e)}")
+            # Get bot response (streaming: hiển thị từng đoạn ngay khi Gemini trả về)
+            answer_placeholder = st.empty()
+            try:
+                answer = ""
+                with st.spinner("🤔 Đang suy nghĩ..."):
+                    events = st.session_state.chatbot.chat_stream(user_input, top_k,
+                                                                  group_by_candidate=group_by_candidate)
+                    first_event = next(events)
+                
+                # Store sources for display
+                st.session_state.last_sources = first_event["sources"]
+                
+                for event in events:
+                    if event["type"] == "token":
+                        answer += event["text"]
+                        answer_placeholder.markdown(f"""
+                        <div class="chat-message bot-message">
+                            <strong>🤖 Bot:</strong><br>
+                            {answer}▌
+                        </div>
+                        """, unsafe_allow_html=True)
+                    elif event["type"] == "done":
+                        answer = event["answer"]
+                
+                # Add bot message
+                st.session_state.messages.append({
+                    "role": "assistant", 
+                    "content": answer
+                })
+                
+            except Exception as e:
+                st.error(f"Lỗi: {str(e)}")
             
             st.rerun()
     
@@ -278,11 +295,10 @@ def show_analytics_page():
             with col2:
                 # CV files distribution
                 if summary["cv_files"]:
+                    chunk_counts = st.session_state.chatbot.vector_store.metadata.source_counts()
                     cv_data = []
                     for cv_file in summary["cv_files"]:
-                        chunk_count = sum(1 for meta in st.session_state.chatbot.vector_store.metadata 
-                                        if meta['metadata']['source'] == cv_file)
-                        cv_data.append({"CV": cv_file, "Chunks": chunk_count})
+                        cv_data.append({"CV": cv_file, "Chunks": chunk_counts.get(cv_file, 0)})
                     
                     df = pd.DataFrame(cv_data)
                     st.bar_chart(df.set_index("CV"))
@@ -345,13 +361,19 @@ def show_settings_page():
     if st.button("🗑️ Xóa tất cả CV"):
         if st.checkbox("Tôi xác nhận muốn xóa tất cả CV"):
             try:
+                import glob
                 import shutil
                 if os.path.exists("cv"):
                     shutil.rmtree("cv")
-                if os.path.exists("cv_index.faiss"):
-                    os.remove("cv_index.faiss")
-                if os.path.exists("cv_metadata.json"):
-                    os.remove("cv_metadata.json")
+                # Index, metadata và mọi file đi kèm: delta log, .npy, shard (cv_index.shard{n}.faiss,
+                # cv_index.shards.json), bản nháp rebuild (cv_index.rebuild.*), file tạm
+                for path in glob.glob("cv_index.*") + glob.glob("cv_metadata.*"):
+                    if os.path.isfile(path):
+                        os.remove(path)
+                # Hồ sơ có cấu trúc (kèm file -wal / -shm của SQLite) và manifest
+                for path in glob.glob("cv_profiles.db*") + ["cv_manifest.json"]:
+                    if os.path.isfile(path):
+                        os.remove(path)
                 st.success("✅ Đã xóa tất cả dữ liệu CV!")
                 st.session_state.chatbot = None
             except Exception as e:
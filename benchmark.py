@@ -0,0 +1,897 @@
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib import request as urlrequest
+from typing import List
+
+import numpy as np
+import faiss
+import ollama
+
+from process_store_class import BatchEmbedder, CVProcessor, FAISSVectorStore
+from ingest import IngestionPipeline
+from index_holder import IndexHolder
+from context_builder import ContextBuilder
+
+
+def fake_vector(text: str, dimension: int = 1024) -> List[float]:
+    """Vector giả, cố định theo nội dung text"""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:4], "little")
+    return np.random.default_rng(seed).standard_normal(dimension).astype(np.float32).tolist()
+
+
+def start_fake_embed_server(request_latency: float = 0.02,
+                            per_item_latency: float = 0.002,
+                            dimension: int = 1024):
+    """Chạy server giả lập /api/embed của Ollama trên một port ngẫu nhiên"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+            time.sleep(request_latency + per_item_latency * len(texts))
+            payload = json.dumps({
+                "model": body["model"],
+                "embeddings": [fake_vector(t, dimension) for t in texts],
+            }).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def bench_embed(n_texts: int, batch_size: int, max_workers: int):
+    """So sánh embedding tuần tự từng chunk với BatchEmbedder"""
+    server, host = start_fake_embed_server()
+    texts = [f"chunk {i} " + "Python FastAPI MLflow " * 20 for i in range(n_texts)]
+
+    try:
+        client = ollama.Client(host=host)
+        start = time.perf_counter()
+        serial = [client.embed(model="mxbai-embed-large", input=t)["embeddings"][0] for t in texts]
+        serial_time = time.perf_counter() - start
+
+        embedder = BatchEmbedder(batch_size=batch_size, max_workers=max_workers, host=host)
+        start = time.perf_counter()
+        batched = embedder.embed(texts)
+        batched_time = time.perf_counter() - start
+    finally:
+        server.shutdown()
+
+    assert np.allclose(np.array(serial, dtype=np.float32), batched), "thứ tự embedding không khớp"
+
+    print(f"📊 Embedding {n_texts} chunks (batch_size={batch_size}, max_workers={max_workers})")
+    print(f"   - Tuần tự:  {serial_time:.2f}s ({n_texts / serial_time:.0f} chunks/s)")
+    print(f"   - Batch:    {batched_time:.2f}s ({n_texts / batched_time:.0f} chunks/s)")
+    print(f"   - Tăng tốc: x{serial_time / batched_time:.1f}")
+
+
+class StubGenAIClient:
+    """Thay cho genai.Client: trả về markdown cố định sau một độ trễ giả lập"""
+
+    def __init__(self, latency: float = 0.5):
+        self.latency = latency
+        self.models = self
+
+    def generate_content(self, model, contents, config=None):
+        time.sleep(self.latency)
+        pdf_bytes = contents[0].inline_data.data
+        text = "## Skills\n" + ("Python, FastAPI, MLflow. " * 40) + "\n\n" + pdf_bytes.decode("utf-8", "ignore")
+        return type("Response", (), {"text": text})()
+
+
+def bench_ingest(n_files: int, parse_workers: int, parse_latency: float):
+    """Ingest n_files PDF giả: tuần tự (1 parse worker) so với pipeline song song"""
+    server, host = start_fake_embed_server()
+    cv_folder = tempfile.mkdtemp()
+    filenames = []
+    for i in range(n_files):
+        filename = f"cv_{i}.pdf"
+        with open(os.path.join(cv_folder, filename), "w", encoding="utf-8") as f:
+            f.write(f"Candidate {i}")
+        filenames.append(filename)
+
+    try:
+        timings = {}
+        for workers in (1, parse_workers):
+            # Tắt cache để cả hai lần chạy đều phải parse và embed
+            cv_processor = CVProcessor(parse_cache_dir="", local_parse_min_quality=2.0)
+            cv_processor.embedding_cache = None
+            cv_processor.client = StubGenAIClient(parse_latency)
+            cv_processor.embedder.client = ollama.Client(host=host)
+
+            pipeline = IngestionPipeline(cv_processor, FAISSVectorStore(), parse_workers=workers)
+            pipeline.run(cv_folder, filenames)
+            pipeline.report()
+            timings[workers] = pipeline.wall_seconds
+    finally:
+        server.shutdown()
+
+    print(f"📊 Ingest {n_files} CV: x{timings[1] / timings[parse_workers]:.1f} "
+          f"với {parse_workers} parse workers")
+
+
+def clustered_vectors(n: int, dimension: int, n_clusters: int = 200, seed: int = 0) -> np.ndarray:
+    """Vector giả có cấu trúc cụm (giống embedding thật hơn nhiễu đều)"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_clusters, dimension)).astype(np.float32)
+    labels = rng.integers(0, n_clusters, n)
+    vectors = centers[labels] + 0.5 * rng.standard_normal((n, dimension)).astype(np.float32)
+    return vectors.astype(np.float32)
+
+
+def bench_ann(n_vectors: int, dimension: int, n_queries: int, k: int, specs: List[str]):
+    """So sánh recall@k và độ trễ mỗi query của các loại index với Flat"""
+    from langchain.schema import Document
+
+    vectors = clustered_vectors(n_vectors, dimension)
+    queries = clustered_vectors(n_queries, dimension, seed=1)
+    docs = [Document(page_content=str(i), metadata={"source": f"cv_{i // 20}.pdf", "chunk_id": i % 20})
+            for i in range(n_vectors)]
+
+    ground_truth = None
+    print(f"📊 {n_vectors} vectors x {dimension} dims, {n_queries} queries, recall@{k}")
+    for spec in ["Flat"] + [s for s in specs if s != "Flat"]:
+        store = FAISSVectorStore(dimension=dimension, index_factory=spec)
+        start = time.perf_counter()
+        store.add_documents(docs, vectors.copy())
+        build_time = time.perf_counter() - start
+
+        latencies, found = [], []
+        for query in queries:
+            start = time.perf_counter()
+            results = store.search(query.copy(), k=k)
+            latencies.append(time.perf_counter() - start)
+            found.append({int(r["content"]) for r in results})
+
+        if ground_truth is None:
+            ground_truth = found
+        recall = np.mean([len(f & g) / k for f, g in zip(found, ground_truth)])
+        print(f"   - {spec:<16} build {build_time:6.2f}s | "
+              f"p50 {np.percentile(latencies, 50) * 1000:6.2f} ms | "
+              f"p99 {np.percentile(latencies, 99) * 1000:6.2f} ms | recall {recall:.3f}")
+
+
+def bench_metadata(n_chunks: int):
+    """So sánh thời gian load metadata: JSON (cũ) với SQLite đọc lười"""
+    from metadata_store import MetadataStore
+
+    folder = tempfile.mkdtemp()
+    entries = [
+        {"content": f"chunk {i} " + "Python FastAPI MLflow " * 40,
+         "metadata": {"source": f"cv_{i // 5}.pdf", "chunk_id": i % 5, "chunk_size": 900}}
+        for i in range(n_chunks)
+    ]
+    json_path = os.path.join(folder, "cv_metadata.json")
+    db_path = os.path.join(folder, "cv_metadata.db")
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(entries, f, ensure_ascii=False, indent=2)
+    store = MetadataStore()
+    store.append(entries)
+    store.save(db_path)
+
+    start = time.perf_counter()
+    with open(json_path, "r", encoding="utf-8") as f:
+        loaded = json.load(f)
+    json_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    lazy = MetadataStore(db_path)
+    n = len(lazy)
+    sqlite_time = time.perf_counter() - start
+
+    positions = list(np.random.default_rng(0).integers(0, n, 10))
+    start = time.perf_counter()
+    rows = lazy.get_many(positions)
+    fetch_time = time.perf_counter() - start
+    assert rows[0] == loaded[positions[0]]
+
+    print(f"📊 Metadata {n_chunks} chunks")
+    print(f"   - JSON load:        {json_time * 1000:8.1f} ms ({os.path.getsize(json_path) / 1e6:.1f} MB)")
+    print(f"   - SQLite open+len:  {sqlite_time * 1000:8.1f} ms ({os.path.getsize(db_path) / 1e6:.1f} MB)")
+    print(f"   - SQLite fetch k=10:{fetch_time * 1000:8.2f} ms")
+
+
+STARTUP_PROBE = """
+import json, sys, time
+import numpy as np
+from process_store_class import FAISSVectorStore
+
+start = time.perf_counter()
+store = FAISSVectorStore(dimension={dimension}, index_factory="{spec}", mmap={mmap})
+store.load("{index_path}", "{metadata_path}")
+load_ms = (time.perf_counter() - start) * 1000
+start = time.perf_counter()
+store.search(np.ones({dimension}, dtype=np.float32), k=5)
+search_ms = (time.perf_counter() - start) * 1000
+
+status = dict(line.split(":", 1) for line in open("/proc/self/status") if ":" in line)
+mb = lambda key: int(status.get(key, "0 kB").split()[0]) / 1024
+print(json.dumps({{"load_ms": load_ms, "search_ms": search_ms, "rss": mb("VmRSS"),
+                  "anon": mb("RssAnon"), "file": mb("RssFile"), "type": type(store.index).__name__}}))
+"""
+
+
+def bench_startup(n_vectors: int, dimension: int, specs: List[str]):
+    """Đo thời gian khởi động và RSS của process mới khi load index: chép vào RAM vs mmap"""
+    from langchain.schema import Document
+
+    vectors = clustered_vectors(n_vectors, dimension)
+    docs = [Document(page_content=str(i), metadata={"source": f"cv_{i // 20}.pdf", "chunk_id": i % 20})
+            for i in range(n_vectors)]
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+
+    print(f"📊 Startup {n_vectors} vectors x {dimension} dims (process mới cho mỗi lần đo)")
+    for spec in ["Flat"] + [s for s in specs if s != "Flat"]:
+        folder = tempfile.mkdtemp()
+        index_path = os.path.join(folder, "cv_index.faiss")
+        metadata_path = os.path.join(folder, "cv_metadata.db")
+        store = FAISSVectorStore(dimension=dimension, index_factory=spec, mmap=True)
+        store.add_documents(docs, vectors.copy())
+        store.save(index_path, metadata_path)
+
+        for mmap in (False, True):
+            code = STARTUP_PROBE.format(dimension=dimension, spec=spec, mmap=mmap,
+                                        index_path=index_path, metadata_path=metadata_path)
+            output = subprocess.run([sys.executable, "-c", code], cwd=repo_dir,
+                                    capture_output=True, text=True, check=True).stdout
+            stats = json.loads(output.strip().splitlines()[-1])
+            print(f"   - {spec:<12} {'mmap' if mmap else 'copy':<4} ({stats['type']}): "
+                  f"load {stats['load_ms']:8.1f} ms | first search {stats['search_ms']:7.1f} ms | "
+                  f"RSS {stats['rss']:7.1f} MB (anon {stats['anon']:7.1f}, file {stats['file']:7.1f})")
+
+
+def bench_batch_search(n_vectors: int, n_queries: int, k: int):
+    """So sánh search_relevant_context từng query với search_many (embed qua server giả)"""
+    from langchain.schema import Document
+    from model_infer import CVChatBot
+
+    server, host = start_fake_embed_server()
+    try:
+        bot = CVChatBot.__new__(CVChatBot)
+        bot.cv_processor = CVProcessor(parse_cache_dir="")
+        bot.cv_processor.embedding_cache = None
+        bot.cv_processor.embedder.client = ollama.Client(host=host)
+        bot.index_holder = IndexHolder(store=FAISSVectorStore())
+        bot.hybrid_search = False
+        bot.context_builder = ContextBuilder()
+        bot.reranker = None
+        docs = [Document(page_content=f"chunk {i}", metadata={"source": f"cv_{i // 20}.pdf", "chunk_id": i % 20})
+                for i in range(n_vectors)]
+        bot.vector_store.add_documents(docs, clustered_vectors(n_vectors, 1024))
+        queries = [f"Ứng viên có kinh nghiệm yêu cầu số {i}" for i in range(n_queries)]
+
+        start = time.perf_counter()
+        single = [bot.search_relevant_context(q, k) for q in queries]
+        single_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        batch = bot.search_many(queries, k)
+        batch_time = time.perf_counter() - start
+    finally:
+        server.shutdown()
+
+    assert [[r["content"] for r in s[1]] for s in single] == [[r["content"] for r in b[1]] for b in batch]
+    print(f"📊 {n_queries} queries, top_k={k}, {n_vectors} chunks")
+    print(f"   - Từng query:  {single_time * 1000:8.1f} ms ({single_time * 1000 / n_queries:.2f} ms/query)")
+    print(f"   - search_many: {batch_time * 1000:8.1f} ms ({batch_time * 1000 / n_queries:.2f} ms/query)")
+
+
+class StubChatBot:
+    """Thay CVChatBot trong api.py: chat() / chat_stream() ngủ `latency` giây như đang chờ Gemini"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def chat(self, query: str, top_k: int = 5, filters=None, group_by_candidate: bool = False):
+        time.sleep(self.latency)
+        return {"answer": f"stub answer for {query}", "context": "", "sources": []}
+
+    def chat_stream(self, query: str, top_k: int = 5, filters=None, group_by_candidate: bool = False):
+        yield {"type": "sources", "context": "", "sources": []}
+        time.sleep(self.latency)
+        answer = f"stub answer for {query}"
+        yield {"type": "token", "text": answer}
+        yield {"type": "done", "answer": answer}
+
+
+def start_stub_api(chat_latency: float) -> str:
+    """Chạy api.app (với StubChatBot) bằng uvicorn trong thread nền, trả về base URL"""
+    import socket
+    import uvicorn
+    import api
+
+    api.chatbot = StubChatBot(chat_latency)
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(api.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}"
+
+
+def timed_request(url: str, payload: dict = None) -> float:
+    data = json.dumps(payload).encode("utf-8") if payload is not None else None
+    req = urlrequest.Request(url, data=data, headers={"Content-Type": "application/json"})
+    start = time.perf_counter()
+    with urlrequest.urlopen(req, timeout=300) as response:
+        response.read()
+    return time.perf_counter() - start
+
+
+def bench_load_test(url: str, concurrency_levels: List[int], requests_per_user: int, chat_latency: float):
+    """Đo p50/p99 của /chat theo số user đồng thời, kèm độ trễ /health trong lúc tải"""
+    if not url:
+        url = start_stub_api(chat_latency)
+        print(f"🌐 API stub tại {url} (chat latency {chat_latency:.2f}s)")
+
+    payload = {"query": "Có ứng viên nào có kinh nghiệm về Python không?", "top_k": 5}
+    print(f"📊 Load test {url}/chat, {requests_per_user} requests/user")
+    for users in concurrency_levels:
+        health_latencies = []
+        stop = threading.Event()
+
+        def probe_health():
+            while not stop.is_set():
+                health_latencies.append(timed_request(f"{url}/health"))
+                time.sleep(0.05)
+
+        prober = threading.Thread(target=probe_health, daemon=True)
+        prober.start()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=users) as pool:
+            latencies = list(pool.map(lambda _: timed_request(f"{url}/chat", payload),
+                                      range(users * requests_per_user)))
+        wall = time.perf_counter() - start
+        stop.set()
+        prober.join()
+
+        print(f"   - {users:3d} users: p50 {np.percentile(latencies, 50) * 1000:8.1f} ms | "
+              f"p99 {np.percentile(latencies, 99) * 1000:8.1f} ms | "
+              f"{len(latencies) / wall:6.1f} req/s | "
+              f"/health p99 {np.percentile(health_latencies, 99) * 1000:7.1f} ms")
+
+
+def bench_upload(n_vectors: int, dimension: int, n_files: int):
+    """Độ trễ mỗi lần upload một CV: lưu toàn bộ index (save) so với ghi delta log (commit)"""
+    from langchain.schema import Document
+
+    print(f"📊 Upload {n_files} CV x 10 chunks, {dimension} dims")
+    for corpus in (n_vectors // 10, n_vectors):
+        vectors = clustered_vectors(corpus, dimension)
+        docs = [Document(page_content=str(i), metadata={"source": f"cv_{i // 20}.pdf"})
+                for i in range(corpus)]
+        for wal in (False, True):
+            folder = tempfile.mkdtemp()
+            index_path = os.path.join(folder, "cv_index.faiss")
+            metadata_path = os.path.join(folder, "cv_metadata.db")
+            seed = FAISSVectorStore(dimension=dimension, wal=False)
+            seed.add_documents(docs, vectors.copy())
+            seed.save(index_path, metadata_path)
+
+            store = FAISSVectorStore(dimension=dimension, wal=wal)
+            store.load(index_path, metadata_path)
+            latencies = []
+            for i in range(n_files):
+                new_docs = [Document(page_content=f"new {i} {j}", metadata={"source": f"new_{i}.pdf"})
+                            for j in range(10)]
+                start = time.perf_counter()
+                store.upsert_source(f"new_{i}.pdf", new_docs, clustered_vectors(10, dimension, seed=i))
+                store.commit(index_path, metadata_path)
+                latencies.append(time.perf_counter() - start)
+            print(f"   - {corpus:>7} chunks {'delta log' if wal else 'full save':<9}: "
+                  f"p50 {np.percentile(latencies, 50) * 1000:8.2f} ms | "
+                  f"p99 {np.percentile(latencies, 99) * 1000:8.2f} ms")
+
+
+def bench_hot_swap(n_vectors: int, dimension: int, users: int):
+    """Độ trễ search của các reader khi không rebuild và trong lúc rebuild + hot swap"""
+    from langchain.schema import Document
+
+    folder = tempfile.mkdtemp()
+    index_path = os.path.join(folder, "cv_index.faiss")
+    metadata_path = os.path.join(folder, "cv_metadata.db")
+    vectors = clustered_vectors(n_vectors, dimension)
+    docs = [Document(page_content=str(i), metadata={"source": f"cv_{i // 20}.pdf"}) for i in range(n_vectors)]
+    store = FAISSVectorStore(dimension=dimension, wal=False)
+    store.add_documents(docs, vectors.copy())
+    store.save(index_path, metadata_path)
+
+    holder = IndexHolder(index_path, metadata_path,
+                         store_factory=lambda: FAISSVectorStore(dimension=dimension, wal=False))
+    queries = clustered_vectors(200, dimension, seed=1)
+
+    def measure(seconds: float, during=None):
+        latencies, writes, stop = [], [], threading.Event()
+
+        def reader(offset: int):
+            i = offset
+            while not stop.is_set():
+                start = time.perf_counter()
+                results = holder.current.search(queries[i % len(queries)], k=5)
+                latencies.append(time.perf_counter() - start)
+                assert len(results) == 5
+                i += 1
+
+        def writer():
+            # Upload / xoá qua API trong lúc rebuild: chỉ bị chặn lúc chép lại thay đổi + swap
+            i = 0
+            while not stop.is_set():
+                source = f"upload_{i % 5}.pdf"
+                start = time.perf_counter()
+                with holder.modifying([source]) as current:
+                    current.upsert_source(source, docs[:5], clustered_vectors(5, dimension, seed=3))
+                writes.append(time.perf_counter() - start)
+                i += 1
+                time.sleep(0.01)
+
+        threads = [threading.Thread(target=reader, args=(u,), daemon=True) for u in range(users)]
+        threads.append(threading.Thread(target=writer, daemon=True))
+        for thread in threads:
+            thread.start()
+        if during is not None:
+            during()
+        else:
+            time.sleep(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        return latencies, writes
+
+    def rebuild():
+        # Giả lập build_vector_store: ghi index mới (thêm 1 CV) rồi để holder load và swap
+        def build(staging_index: str, staging_metadata: str) -> bool:
+            new_store = FAISSVectorStore(dimension=dimension, wal=False)
+            new_store.load(staging_index, staging_metadata)
+            new_store.upsert_source("new.pdf", docs[:10], clustered_vectors(10, dimension, seed=2))
+            new_store.save(staging_index, staging_metadata)
+            return True
+
+        for _ in range(3):
+            start = time.perf_counter()
+            holder.rebuild(build)
+            print(f"   - rebuild + swap: {time.perf_counter() - start:6.2f}s (generation {holder.generation})")
+
+    print(f"📊 Hot swap {n_vectors} vectors x {dimension} dims, {users} reader threads")
+    idle = measure(2.0)
+    busy = measure(0, during=rebuild)
+    for name, (latencies, writes) in (("idle", idle), ("rebuild", busy)):
+        print(f"   - {name:<8} search p50 {np.percentile(latencies, 50) * 1000:7.2f} ms | "
+              f"p99 {np.percentile(latencies, 99) * 1000:7.2f} ms | {len(latencies)} searches | "
+              f"upsert p50 {np.percentile(writes, 50) * 1000:7.2f} ms, max {max(writes) * 1000:7.2f} ms")
+
+
+TECH_KEYWORDS = ["Python", "FastAPI", "Spring Boot", "MLflow", "Docker", "Kubernetes", "React", "Node.js",
+                 "C++", "C#", "PostgreSQL", "Redis", "Kafka", "TensorFlow", "PyTorch", "AWS", "GCP", "Airflow"]
+
+
+def bench_lexical(n_chunks: int, n_queries: int, k: int):
+    """Độ trễ tìm kiếm BM25 và thời gian nạp inverted index từ file metadata"""
+    from metadata_store import MetadataStore
+
+    rng = np.random.default_rng(0)
+    filler = "kinh nghiệm phát triển hệ thống dự án làm việc nhóm team backend frontend data".split()
+    entries = []
+    for i in range(n_chunks):
+        words = list(rng.choice(filler, 120)) + list(rng.choice(TECH_KEYWORDS, 4))
+        rng.shuffle(words)
+        entries.append({"content": " ".join(words), "metadata": {"source": f"cv_{i // 5}.pdf"}})
+
+    folder = tempfile.mkdtemp()
+    db_path = os.path.join(folder, "cv_metadata.db")
+    start = time.perf_counter()
+    store = MetadataStore()
+    store.append(entries)
+    build_time = time.perf_counter() - start
+    store.save(db_path)
+
+    start = time.perf_counter()
+    index = MetadataStore(db_path).lexical_index()
+    load_time = time.perf_counter() - start
+
+    queries = [" ".join(rng.choice(TECH_KEYWORDS, 2)) for _ in range(n_queries)]
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        index.search(query, k)
+        latencies.append(time.perf_counter() - start)
+
+    print(f"📊 BM25 {n_chunks} chunks, {n_queries} queries, top_k={k}")
+    print(f"   - append (metadata + postings): {build_time:6.2f}s")
+    print(f"   - nạp inverted index từ file:   {load_time:6.2f}s")
+    print(f"   - search p50 {np.percentile(latencies, 50) * 1000:6.3f} ms | "
+          f"p99 {np.percentile(latencies, 99) * 1000:6.3f} ms")
+
+
+def bench_filter(n_vectors: int, dimension: int, n_queries: int, k: int, specs: List[str]):
+    """Tìm kiếm có lọc theo CV: lọc trong index (IDSelector / chấm điểm trực tiếp) so với lọc sau khi search"""
+    from langchain.schema import Document
+
+    vectors = clustered_vectors(n_vectors, dimension)
+    queries = clustered_vectors(n_queries, dimension, seed=1)
+    n_sources = max(1, n_vectors // 20)
+    docs = [Document(page_content=str(i), metadata={"source": f"cv_{i // 20}.pdf", "uploaded_at": i // 20})
+            for i in range(n_vectors)]
+    oversample = 20
+
+    print(f"📊 {n_vectors} vectors x {dimension} dims, {n_queries} queries, top_k={k}, "
+          f"lọc sau khi search lấy top {k * oversample}")
+    for spec in ["Flat"] + [s for s in specs if s != "Flat"]:
+        store = FAISSVectorStore(dimension=dimension, index_factory=spec, wal=False)
+        store.add_documents(docs, vectors.copy())
+        for fraction in (0.001, 0.01, 0.1, 0.5):
+            cutoff = n_sources - max(1, int(n_sources * fraction))
+            filters = {"uploaded_after": cutoff}
+            in_index, post, post_found = [], [], []
+            for query in queries:
+                start = time.perf_counter()
+                store.search(query.copy(), k=k, filters=filters)
+                in_index.append(time.perf_counter() - start)
+
+                start = time.perf_counter()
+                results = store.search(query.copy(), k=k * oversample)
+                results = [r for r in results if r["metadata"]["uploaded_at"] >= cutoff][:k]
+                post.append(time.perf_counter() - start)
+                post_found.append(len(results))
+            print(f"   - {spec:<12} {fraction * 100:5.1f}% CV | trong index p50 "
+                  f"{np.percentile(in_index, 50) * 1000:6.2f} ms | lọc sau p50 "
+                  f"{np.percentile(post, 50) * 1000:6.2f} ms, đủ {k} kết quả: "
+                  f"{np.mean([n == k for n in post_found]) * 100:5.1f}% query")
+
+
+def bench_context(n_files: int, n_queries: int):
+    """Kích thước context/prompt: nối nguyên các chunk (cũ) so với ContextBuilder theo ngân sách token"""
+    from model_infer import CVChatBot
+
+    rng = np.random.default_rng(0)
+    splitter = CVProcessor(parse_cache_dir="").text_splitter
+    filler = "kinh nghiệm phát triển hệ thống dự án làm việc nhóm backend frontend data".split()
+    chunks = []
+    for f in range(n_files):
+        sentences = [" ".join(rng.choice(filler + TECH_KEYWORDS, 14)) for _ in range(80)]
+        for i, chunk in enumerate(splitter.split_text(". ".join(sentences))):
+            chunks.append({"content": chunk, "metadata": {"source": f"cv_{f}.pdf", "chunk_id": i}})
+
+    print(f"📊 {n_files} CV ({len(chunks)} chunks), {n_queries} queries")
+    for top_k in (5, 10, 20):
+        for budget in (None, 3000, 1500):
+            sizes, latencies = [], []
+            for _ in range(n_queries):
+                # Kết quả giả lập: các chunk liền nhau của vài CV, thêm vài bản sao gần trùng
+                picked = [dict(chunks[i], score=float(rng.random()))
+                          for i in rng.choice(len(chunks), top_k, replace=False)]
+                start_ids = rng.choice(len(chunks) - 1, max(1, top_k // 4), replace=False)
+                for i in start_ids:
+                    picked += [dict(chunks[i], score=float(rng.random())),
+                               dict(chunks[i + 1], score=float(rng.random()))]
+                picked = sorted(picked, key=lambda r: r["score"], reverse=True)[:top_k]
+
+                start = time.perf_counter()
+                if budget is None:
+                    context = "\n".join(f"(Score: {r['score']:.3f}):\n{r['content']}\n" for r in picked)
+                else:
+                    context = ContextBuilder(max_tokens=budget).build(picked)[0]
+                latencies.append(time.perf_counter() - start)
+                sizes.append(CVChatBot._prompt_stats("Ứng viên nào biết Python?", context, {})["prompt_tokens"])
+            label = "nối nguyên" if budget is None else f"budget {budget}"
+            print(f"   - top_k={top_k:<3} {label:<12}: prompt ~{np.mean(sizes):7.0f} tokens | "
+                  f"dựng context p50 {np.percentile(latencies, 50) * 1000:6.2f} ms")
+
+
+def bench_quantization(n_vectors: int, dimension: int, n_queries: int, k: int, specs: List[str]):
+    """Bộ nhớ, độ trễ và recall@k của các kiểu lưu vector (sq8, fp16, binary + rerank) so với float32"""
+    from langchain.schema import Document
+
+    vectors = clustered_vectors(n_vectors, dimension)
+    queries = clustered_vectors(n_queries, dimension, seed=1)
+    docs = [Document(page_content=str(i), metadata={"source": f"cv_{i // 20}.pdf", "chunk_id": i % 20})
+            for i in range(n_vectors)]
+
+    print(f"📊 {n_vectors} vectors x {dimension} dims, {n_queries} queries, recall@{k} so với Flat float32")
+    ground_truth = None
+    for spec in ["Flat"] + [s for s in specs if s != "Flat"]:
+        for quantization in ("none", "sq8", "fp16", "binary"):
+            if quantization == "binary" and spec != "Flat":
+                continue
+            folder = tempfile.mkdtemp()
+            index_path = os.path.join(folder, "cv_index.faiss")
+            store = FAISSVectorStore(dimension=dimension, index_factory=spec, quantization=quantization, wal=False)
+            if quantization != "none" and store._factory() == spec:
+                continue
+            store.add_documents(docs, vectors.copy())
+            store.save(index_path, os.path.join(folder, "cv_metadata.db"))
+            store = FAISSVectorStore(dimension=dimension, index_factory=spec, quantization=quantization, wal=False)
+            store.load(index_path, os.path.join(folder, "cv_metadata.db"))
+            memory = len(faiss.serialize_index(store.index))
+            if store._rerank is not None:
+                memory += store._rerank.memory_bytes()
+
+            for rerank_factor in ((10, 50) if quantization == "binary" else (None,)):
+                store.rerank_factor = rerank_factor or store.rerank_factor
+                latencies, found = [], []
+                for query in queries:
+                    start = time.perf_counter()
+                    results = store.search(query.copy(), k=k)
+                    latencies.append(time.perf_counter() - start)
+                    found.append({int(r["content"]) for r in results})
+                if ground_truth is None:
+                    ground_truth = found
+                recall = np.mean([len(f & g) / k for f, g in zip(found, ground_truth)])
+                label = f"{spec} / {quantization}" + (f" x{rerank_factor}" if rerank_factor else "")
+                print(f"   - {label:<20} RAM {memory / 2 ** 20:8.1f} MB ({memory / n_vectors:6.0f} B/vector) | "
+                      f"p50 {np.percentile(latencies, 50) * 1000:6.2f} ms | recall {recall:.3f}")
+
+
+def bench_matryoshka(n_vectors: int, dimension: int, n_queries: int, k: int,
+                     coarse_dims: List[int], specs: List[str]):
+    """Độ trễ và recall@k của tìm kiếm hai tầng (index `coarse_dim` chiều + rerank đầy đủ chiều) so với Flat"""
+    from langchain.schema import Document
+
+    # Embedding Matryoshka dồn phần lớn thông tin vào các chiều đầu: mô phỏng bằng trọng số giảm dần
+    weights = (1 + np.arange(dimension, dtype=np.float32) / 64) ** -0.5
+    vectors = clustered_vectors(n_vectors, dimension) * weights
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.integers(0, n_vectors, n_queries)] \
+        + 0.5 * rng.standard_normal((n_queries, dimension)).astype(np.float32) * weights
+    docs = [Document(page_content=str(i), metadata={"source": f"cv_{i // 20}.pdf", "chunk_id": i % 20})
+            for i in range(n_vectors)]
+
+    print(f"📊 {n_vectors} vectors x {dimension} dims, {n_queries} queries, recall@{k} so với Flat đầy đủ chiều")
+    ground_truth = None
+    for spec in ["Flat"] + [s for s in specs if s != "Flat"]:
+        for coarse_dim in [None] + [c for c in coarse_dims if c < dimension]:
+            store = FAISSVectorStore(dimension=dimension, index_factory=spec, coarse_dim=coarse_dim or 0, wal=False)
+            store.add_documents(docs, vectors.copy())
+            memory = len(faiss.serialize_index(store.index))
+
+            for rerank_factor in ((5, 10, 20) if coarse_dim else (None,)):
+                store.rerank_factor = rerank_factor or store.rerank_factor
+                latencies, found = [], []
+                for query in queries:
+                    start = time.perf_counter()
+                    results = store.search(query.copy(), k=k)
+                    latencies.append(time.perf_counter() - start)
+                    found.append({int(r["content"]) for r in results})
+                if ground_truth is None:
+                    ground_truth = found
+                recall = np.mean([len(f & g) / k for f, g in zip(found, ground_truth)])
+                label = f"{spec} / {coarse_dim or dimension}d" + (f" x{rerank_factor}" if rerank_factor else "")
+                print(f"   - {label:<22} index {memory / 2 ** 20:8.1f} MB | "
+                      f"p50 {np.percentile(latencies, 50) * 1000:6.2f} ms | recall {recall:.3f}")
+
+
+def bench_shards(n_vectors: int, dimension: int, n_queries: int, k: int, shard_counts: List[int]):
+    """Độ trễ search của một store so với store chia shard (process riêng, query song song)"""
+    from langchain.schema import Document
+    from sharded_store import ShardedVectorStore
+
+    vectors = clustered_vectors(n_vectors, dimension)
+    queries = clustered_vectors(n_queries, dimension, seed=1)
+    docs = [Document(page_content=str(i), metadata={"source": f"cv_{i // 20}.pdf", "chunk_id": i % 20})
+            for i in range(n_vectors)]
+
+    print(f"📊 {n_vectors} vectors x {dimension} dims, {n_queries} queries, k={k}, {os.cpu_count()} CPU")
+    stores = [("1 store", FAISSVectorStore(dimension=dimension, wal=False))]
+    stores += [(f"{n} shards", ShardedVectorStore(n)) for n in shard_counts]
+    for label, store in stores:
+        start = time.perf_counter()
+        store.add_documents(docs, vectors.copy())
+        add_seconds = time.perf_counter() - start
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            store.search(query.copy(), k=k)
+            latencies.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        store.search_batch(queries.copy(), k=k)
+        batch_seconds = time.perf_counter() - start
+        print(f"   - {label:<10} add {add_seconds:6.2f}s | search p50 {np.percentile(latencies, 50) * 1000:7.2f} ms, "
+              f"p99 {np.percentile(latencies, 99) * 1000:7.2f} ms | batch {batch_seconds * 1000:8.1f} ms")
+        if isinstance(store, ShardedVectorStore):
+            start = time.perf_counter()
+            moved = store.add_shard()
+            print(f"     thêm 1 shard: chuyển {moved} chunks trong {time.perf_counter() - start:.2f}s")
+            store.close()
+
+
+def bench_rerank(n_queries: int, k: int, budget_ms: float):
+    """Độ trễ của cross-encoder rerank theo số ứng viên / batch size, khi cache trúng và tỉ lệ vượt ngân sách"""
+    from reranker import CrossEncoderReranker, DEFAULT_RERANK_MODEL
+
+    try:
+        from sentence_transformers import CrossEncoder
+    except ImportError:
+        print("❌ Cần cài sentence-transformers để chạy benchmark rerank")
+        return
+    model_name = os.getenv("RERANK_MODEL", DEFAULT_RERANK_MODEL)
+    model = CrossEncoder(model_name, max_length=512, device="cpu")
+
+    rng = np.random.default_rng(0)
+    splitter = CVProcessor(parse_cache_dir="").text_splitter
+    filler = "kinh nghiệm phát triển hệ thống dự án làm việc nhóm backend frontend data".split()
+    chunks = []
+    for _ in range(20):
+        sentences = [" ".join(rng.choice(filler + TECH_KEYWORDS, 14)) for _ in range(80)]
+        chunks += splitter.split_text(". ".join(sentences))
+    queries = [f"Ứng viên nào có kinh nghiệm {' '.join(rng.choice(TECH_KEYWORDS, 2))}?" for _ in range(n_queries)]
+
+    print(f"📊 {model_name}, {n_queries} queries, top_k={k}, ngân sách {budget_ms:.0f} ms")
+    for factor in (2, 4, 8):
+        for batch_size in (8, 16, 32):
+            reranker = CrossEncoderReranker(model_name, batch_size=batch_size, budget_ms=budget_ms, model=model)
+            pools = [[{"content": chunks[i], "score": 0.0} for i in rng.choice(len(chunks), k * factor, replace=False)]
+                     for _ in queries]
+            cold, warm, fallbacks = [], [], 0
+            for query, pool in zip(queries, pools):
+                stats = reranker.rerank(query, pool, k)[1]
+                cold.append(stats["rerank_ms"])
+                fallbacks += stats["rerank_fallback"]
+                warm.append(reranker.rerank(query, pool, k)[1]["rerank_ms"])
+            print(f"   - {k * factor:>3} ứng viên, batch {batch_size:<3}: p50 {np.percentile(cold, 50):7.1f} ms, "
+                  f"p99 {np.percentile(cold, 99):7.1f} ms | cache {np.percentile(warm, 50):5.2f} ms | "
+                  f"giữ thứ tự FAISS {fallbacks}/{n_queries}")
+
+
+def bench_profiles(n_files: int, n_queries: int):
+    """Trích xuất hồ sơ lúc ingest và độ trễ tra cứu bảng hồ sơ so với tìm kiếm BM25 trên chunk"""
+    from metadata_store import MetadataStore
+    from profiles import ProfileStore, extract_profile, parse_profile_query
+
+    rng = np.random.default_rng(0)
+    splitter = CVProcessor(parse_cache_dir="").text_splitter
+    filler = "kinh nghiệm phát triển hệ thống dự án làm việc nhóm backend frontend data".split()
+    documents = []
+    for f in range(n_files):
+        jobs = []
+        for j in range(int(rng.integers(1, 4))):
+            start_year = int(rng.integers(2012, 2022))
+            jobs.append(f"### Công ty {j} ({start_year} - {start_year + int(rng.integers(1, 4))})\n"
+                        + " ".join(list(rng.choice(filler, 40)) + list(rng.choice(TECH_KEYWORDS, 2))))
+        degree = rng.choice(["Cử nhân Công nghệ thông tin", "Kỹ sư Khoa học máy tính", "Thạc sĩ Kinh tế"])
+        documents.append(f"# Ứng viên {f}\n## Kỹ năng\n{', '.join(rng.choice(TECH_KEYWORDS, 5, replace=False))}\n"
+                         f"## Kinh nghiệm làm việc\n" + "\n".join(jobs) + f"\n## Học vấn\n{degree}\n")
+
+    start = time.perf_counter()
+    profiles = [extract_profile(text, f"cv_{f}.pdf") for f, text in enumerate(documents)]
+    extract_time = time.perf_counter() - start
+
+    store = ProfileStore(None)
+    start = time.perf_counter()
+    for profile in profiles:
+        store.upsert(profile)
+    upsert_time = time.perf_counter() - start
+
+    chunks = MetadataStore()
+    chunks.append([{"content": chunk, "metadata": {"source": f"cv_{f}.pdf"}}
+                   for f, text in enumerate(documents) for chunk in splitter.split_text(text)])
+    index = chunks.lexical_index()
+
+    templates = ["Ai biết {0}?", "Ứng viên có kinh nghiệm {0} và {1}", "Ai có trên 3 năm kinh nghiệm {0}?"]
+    queries = [templates[i % len(templates)].format(*rng.choice(TECH_KEYWORDS, 2, replace=False))
+               for i in range(n_queries)]
+    lookup, lexical, found = [], [], []
+    for query in queries:
+        start = time.perf_counter()
+        parsed = parse_profile_query(query)
+        found.append(len(store.find(parsed["terms"], parsed["min_years"])) if parsed else 0)
+        lookup.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        index.search(query, 10)
+        lexical.append(time.perf_counter() - start)
+
+    print(f"📊 {n_files} CV ({len(chunks)} chunks), {n_queries} queries")
+    print(f"   - trích xuất hồ sơ: {extract_time / n_files * 1000:6.2f} ms/CV | ghi bảng: "
+          f"{upsert_time / n_files * 1000:6.2f} ms/CV")
+    print(f"   - tra cứu hồ sơ  p50 {np.percentile(lookup, 50) * 1000:6.3f} ms | "
+          f"p99 {np.percentile(lookup, 99) * 1000:6.3f} ms | trung bình {np.mean(found):.1f} ứng viên (đủ danh sách)")
+    print(f"   - BM25 top 10    p50 {np.percentile(lexical, 50) * 1000:6.3f} ms | "
+          f"p99 {np.percentile(lexical, 99) * 1000:6.3f} ms (chưa tính embedding + Gemini)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CV ChatBot benchmarks")
+    parser.add_argument("--mode", choices=["embed", "ingest", "ann", "metadata", "startup", "batch_search", "load_test", "upload", "hot_swap", "lexical", "filter", "context", "quantization", "matryoshka", "shards", "rerank", "profiles"], default="embed", help="Benchmark cần chạy")
+    parser.add_argument("--n_texts", type=int, default=500)
+    parser.add_argument("--batch_size", type=int, default=32)
+    parser.add_argument("--max_workers", type=int, default=4)
+    parser.add_argument("--n_files", type=int, default=40)
+    parser.add_argument("--parse_workers", type=int, default=8)
+    parser.add_argument("--parse_latency", type=float, default=0.5,
+                        help="Độ trễ giả lập của một request parse tới LLM (giây)")
+    parser.add_argument("--n_vectors", type=int, default=50000)
+    parser.add_argument("--dimension", type=int, default=1024)
+    parser.add_argument("--n_queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--n_chunks", type=int, default=200000)
+    parser.add_argument("--url", default="",
+                        help="URL của API cần load test (để trống: chạy api.py với chatbot giả lập)")
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    parser.add_argument("--requests_per_user", type=int, default=4)
+    parser.add_argument("--chat_latency", type=float, default=0.5,
+                        help="Độ trễ giả lập của /chat khi dùng API stub (giây)")
+    parser.add_argument("--rerank_budget_ms", type=float, default=300.0,
+                        help="Ngân sách thời gian rerank mỗi query (mode rerank)")
+    parser.add_argument("--shards", type=int, nargs="+", default=[2, 4],
+                        help="Số shard cần so sánh với một store (mode shards)")
+    parser.add_argument("--coarse_dims", type=int, nargs="+", default=[128, 256, 512],
+                        help="Số chiều của index tầng thô cần so sánh (mode matryoshka)")
+    parser.add_argument("--index_factories", nargs="+",
+                        default=["HNSW32", "IVF256,Flat", "IVF256,PQ64"],
+                        help="Các chuỗi index_factory của FAISS cần so sánh với Flat")
+
+    args = parser.parse_args()
+
+    if args.mode == "embed":
+        bench_embed(args.n_texts, args.batch_size, args.max_workers)
+
+    elif args.mode == "ingest":
+        bench_ingest(args.n_files, args.parse_workers, args.parse_latency)
+
+    elif args.mode == "ann":
+        bench_ann(args.n_vectors, args.dimension, args.n_queries, args.k, args.index_factories)
+
+    elif args.mode == "metadata":
+        bench_metadata(args.n_chunks)
+
+    elif args.mode == "startup":
+        bench_startup(args.n_vectors, args.dimension, [s for s in args.index_factories if "IVF" in s])
+
+    elif args.mode == "batch_search":
+        bench_batch_search(args.n_vectors, args.n_queries, args.k)
+
+    elif args.mode == "load_test":
+        bench_load_test(args.url, args.users, args.requests_per_user, args.chat_latency)
+
+    elif args.mode == "upload":
+        bench_upload(args.n_vectors, args.dimension, args.n_files)
+
+    elif args.mode == "hot_swap":
+        bench_hot_swap(args.n_vectors, args.dimension, max(args.users))
+
+    elif args.mode == "lexical":
+        bench_lexical(args.n_chunks, args.n_queries, args.k)
+
+    elif args.mode == "filter":
+        bench_filter(args.n_vectors, args.dimension, args.n_queries, args.k, args.index_factories)
+
+    elif args.mode == "context":
+        bench_context(args.n_files, args.n_queries)
+
+    elif args.mode == "quantization":
+        bench_quantization(args.n_vectors, args.dimension, args.n_queries, args.k, args.index_factories)
+
+    elif args.mode == "matryoshka":
+        bench_matryoshka(args.n_vectors, args.dimension, args.n_queries, args.k, args.coarse_dims,
+                         args.index_factories)
+
+    elif args.mode == "shards":
+        bench_shards(args.n_vectors, args.dimension, args.n_queries, args.k, args.shards)
+
+    elif args.mode == "rerank":
+        bench_rerank(args.n_queries, args.k, args.rerank_budget_ms)
+
+    elif args.mode == "profiles":
+        bench_profiles(args.n_files, args.n_queries)
+
+
+if __name__ == "__main__":
+    main()
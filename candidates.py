@@ -0,0 +1,47 @@
+from typing import Any, Dict, List
+
+CANDIDATE_SCORE_MODES = ("max", "sum")
+
+
+def aggregate_candidates(results: List[Dict],
+                         top_n: int,
+                         chunks_per_candidate: int = 3,
+                         score_mode: str = "max") -> List[Dict[str, Any]]:
+    """Gom các chunk theo `metadata.source` (một CV = một ứng viên) và xếp hạng ứng viên.
+
+    Điểm ứng viên là điểm cao nhất ("max") hoặc tổng điểm ("sum") của tối đa
+    `chunks_per_candidate` chunk tốt nhất, nên một CV dài có nhiều chunk trung bình không lấn át
+    CV có ít chunk nhưng rất khớp. Trả về tối đa `top_n` ứng viên:
+    [{"source", "score", "chunks": [chunk theo điểm giảm dần]}].
+    """
+    if score_mode not in CANDIDATE_SCORE_MODES:
+        raise ValueError(f"score_mode phải là một trong {CANDIDATE_SCORE_MODES}")
+    groups: Dict[str, Dict[str, Any]] = {}
+    for result in sorted(results, key=lambda r: r["score"], reverse=True):
+        source = result["metadata"].get("source", "")
+        group = groups.setdefault(source, {"source": source, "chunks": []})
+        if len(group["chunks"]) < chunks_per_candidate:
+            group["chunks"].append(result)
+
+    candidates = list(groups.values())
+    for candidate in candidates:
+        scores = [chunk["score"] for chunk in candidate["chunks"]]
+        candidate["score"] = max(scores) if score_mode == "max" else sum(scores)
+    candidates.sort(key=lambda c: c["score"], reverse=True)
+    return candidates[:top_n]
+
+
+def interleave_candidates(candidates: List[Dict[str, Any]]) -> List[Dict]:
+    """Xếp chunk của các ứng viên theo vòng: chunk tốt nhất của mọi ứng viên trước, rồi chunk thứ hai, ...
+
+    Dùng làm thứ tự ưu tiên cho ContextBuilder để mỗi ứng viên trong top-N đều có mặt trong
+    context nếu ngân sách token cho phép. Mỗi chunk được gắn `candidate_rank` / `candidate_score`.
+    """
+    ordered = []
+    depth = max((len(c["chunks"]) for c in candidates), default=0)
+    for level in range(depth):
+        for rank, candidate in enumerate(candidates, 1):
+            if level < len(candidate["chunks"]):
+                ordered.append({**candidate["chunks"][level],
+                                "candidate_rank": rank, "candidate_score": candidate["score"]})
+    return ordered
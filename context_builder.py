@@ -0,0 +1,132 @@
+import re
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+
+def estimate_tokens(text: str) -> int:
+    """Ước lượng số token của đoạn text (~4 ký tự / token), đủ để giới hạn kích thước prompt"""
+    return max(1, len(text) // 4) if text else 0
+
+
+def _shingles(text: str, size: int = 3) -> Set[Tuple[str, ...]]:
+    words = re.findall(r"\w+", text.lower())
+    if len(words) <= size:
+        return {tuple(words)}
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def overlap_length(previous: str, following: str, max_chars: int, min_chars: int = 10) -> int:
+    """Độ dài đoạn cuối của `previous` lặp lại ở đầu `following` (phần chunk_overlap của text splitter)"""
+    for size in range(min(max_chars, len(previous), len(following)), min_chars - 1, -1):
+        if following.startswith(previous[-size:]):
+            return size
+    return 0
+
+
+class ContextBuilder:
+    """Ghép các chunk tìm được thành context cho prompt trong giới hạn `max_tokens`.
+
+    Chunk được xét theo thứ tự ưu tiên do caller đưa vào (điểm giảm dần, hoặc xen kẽ theo
+    ứng viên): bỏ chunk gần trùng với chunk đã chọn (Jaccard trên 3-gram từ >= `dedup_threshold`
+    trong cùng CV, hoặc trùng hoàn toàn giữa hai CV khác nhau, vd. CV được upload hai lần),
+    bỏ chunk không còn vừa ngân sách. Các chunk liền nhau của cùng một CV được nối lại
+    và cắt phần lặp do `chunk_overlap` (tối đa `overlap_chars` ký tự). Context được nhóm theo CV
+    để model biết thông tin thuộc file nào; header và dấu phân cách cũng được tính vào ngân sách.
+    """
+
+    def __init__(self, max_tokens: int = 3000, overlap_chars: int = 100, dedup_threshold: float = 0.85):
+        self.max_tokens = max_tokens
+        self.overlap_chars = overlap_chars
+        self.dedup_threshold = dedup_threshold
+
+    @staticmethod
+    def _position(result: Dict) -> Tuple[str, Optional[int]]:
+        metadata = result.get("metadata", {})
+        return metadata.get("source", ""), metadata.get("chunk_id")
+
+    def _render_group(self, source: str, chunks: List[Dict]) -> Tuple[str, int]:
+        """Phần context của một CV: header kèm điểm cao nhất, chunk liền nhau được nối và bỏ phần lặp"""
+        score = max(chunk.get("candidate_score", chunk["score"]) for chunk in chunks)
+        ordered = sorted(chunks, key=lambda c: (self._position(c)[1] is None, self._position(c)[1] or 0))
+        texts, previous, removed = [], None, 0
+        for chunk in ordered:
+            content = chunk["content"]
+            chunk_id = self._position(chunk)[1]
+            if previous is not None and chunk_id is not None and self._position(previous)[1] == chunk_id - 1:
+                overlap = overlap_length(previous["content"], content, self.overlap_chars)
+                removed += overlap
+                texts[-1] += content[overlap:]
+            else:
+                texts.append(content)
+            previous = chunk
+        body = "\n...\n".join(texts)
+        return f"### {source} (Score: {score:.3f}):\n{body}\n", removed
+
+    def select(self, results: List[Dict]) -> Tuple[List[Dict], Dict[str, Any]]:
+        """Chọn các chunk đưa vào context, trả về (chunk đã chọn theo thứ tự ưu tiên, thống kê).
+
+        Ngân sách được so với độ dài context sau khi render (header từng CV, dấu `...` giữa
+        các đoạn không liền nhau), chỉ render lại nhóm của CV chứa chunk đang xét.
+        """
+        groups: Dict[str, List[Dict]] = {}
+        group_chars: Dict[str, int] = {}
+        kept_shingles: List[Tuple[str, Set[Tuple[str, ...]]]] = []
+        selected: List[Dict] = []
+        used_chars = 0
+        duplicates = dropped = 0
+        budget_chars = self.max_tokens * 4
+
+        for result in results:
+            source = self._position(result)[0]
+            shingles = _shingles(result["content"])
+            if any(len(shingles & other) >= (self.dedup_threshold if source == other_source else 1.0)
+                   * len(shingles | other) for other_source, other in kept_shingles):
+                duplicates += 1
+                continue
+            chunks = groups.get(source, []) + [result]
+            chars = len(self._render_group(source, chunks)[0])
+            # Các nhóm được nối bằng "\n": nhóm mới tốn thêm một ký tự
+            cost = chars - group_chars[source] if source in groups else chars + (1 if groups else 0)
+            if used_chars + cost > budget_chars:
+                if selected:
+                    dropped += 1
+                    continue
+                # Chunk tốt nhất đã vượt ngân sách: cắt bớt thay vì trả về context rỗng
+                overflow = used_chars + cost - budget_chars
+                result = {**result, "content": result["content"][:max(0, len(result["content"]) - overflow)]}
+                chunks = [result]
+                chars = cost = len(self._render_group(source, chunks)[0])
+            groups[source] = chunks
+            group_chars[source] = chars
+            kept_shingles.append((source, shingles))
+            selected.append(result)
+            used_chars += cost
+
+        return selected, {
+            "chunks_retrieved": len(results),
+            "chunks_used": len(selected),
+            "near_duplicates_removed": duplicates,
+            "dropped_for_budget": dropped,
+            "max_tokens": self.max_tokens,
+        }
+
+    def render(self, selected: List[Dict]) -> Tuple[str, int]:
+        """Context nhóm theo CV (theo thứ tự xuất hiện), chunk liền nhau được nối và bỏ phần lặp"""
+        groups: Dict[str, List[Dict]] = {}
+        for result in selected:
+            groups.setdefault(self._position(result)[0], []).append(result)
+
+        parts, removed = [], 0
+        for source, chunks in groups.items():
+            part, group_removed = self._render_group(source, chunks)
+            parts.append(part)
+            removed += group_removed
+        return "\n".join(parts), removed
+
+    def build(self, results: List[Dict]) -> Tuple[str, List[Dict], Dict[str, Any]]:
+        """(context, chunk đã dùng, thống kê) cho danh sách chunk theo thứ tự ưu tiên"""
+        selected, stats = self.select(results)
+        context, removed = self.render(selected)
+        stats["overlap_chars_removed"] = removed
+        stats["context_chars"] = len(context)
+        stats["context_tokens"] = estimate_tokens(context)
+        return context, selected, stats
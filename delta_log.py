@@ -0,0 +1,142 @@
+import base64
+import json
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: không có flock, chỉ khoá trong process
+    fcntl = None
+
+
+class DeltaLog:
+    """Log append-only (write-ahead) cho các thay đổi của FAISSVectorStore.
+
+    Mỗi bản ghi là một dòng JSON, được fsync trước khi thay đổi được áp dụng, nên chi phí
+    ghi chỉ phụ thuộc vào kích thước thay đổi chứ không phụ thuộc vào kích thước corpus.
+    Khi compaction, log hiện tại được đổi tên thành `<path>.compacting` và log mới bắt đầu
+    rỗng; file `.compacting` chỉ bị xoá sau khi snapshot mới đã được ghi xong.
+    Dòng cuối bị ghi dở (process chết giữa chừng) được bỏ qua khi đọc; việc đọc không sửa file.
+    Phần ghi dở chỉ bị cắt đi bởi process ghi log, dưới file lock (`flock`), ngay trước lần ghi đầu tiên.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.rotated_path = f"{path}.compacting"
+        self._lock = threading.Lock()
+        self._file = open(path, "ab")
+        self._tail_checked = False
+
+    @staticmethod
+    def encode_vectors(vectors: np.ndarray) -> str:
+        return base64.b64encode(np.ascontiguousarray(vectors, dtype=np.float32).tobytes()).decode("ascii")
+
+    @staticmethod
+    def decode_vectors(data: str, dimension: int) -> np.ndarray:
+        return np.frombuffer(base64.b64decode(data), dtype=np.float32).reshape(-1, dimension).copy()
+
+    @staticmethod
+    def _scan(path: str) -> Tuple[List[Dict[str, Any]], int]:
+        """(các bản ghi đầy đủ, số byte hợp lệ tính từ đầu file)"""
+        if not os.path.exists(path):
+            return [], 0
+        records, valid_bytes = [], 0
+        with open(path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    break
+                valid_bytes += len(line)
+        return records, valid_bytes
+
+    @classmethod
+    def _read_file(cls, path: str) -> List[Dict[str, Any]]:
+        records, valid_bytes = cls._scan(path)
+        if os.path.exists(path) and valid_bytes < os.path.getsize(path):
+            print(f"⚠️ Bỏ qua phần ghi dở ở cuối {path}")
+        return records
+
+    @contextmanager
+    def _file_lock(self):
+        """Khoá file log giữa các process cùng ghi (gọi khi đã giữ `self._lock`)"""
+        if fcntl is None:
+            yield
+            return
+        fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+
+    def _truncate_torn_tail(self):
+        """Cắt dòng ghi dở ở cuối log trước khi ghi tiếp (gọi khi đã giữ file lock)"""
+        if self._tail_checked:
+            return
+        _, valid_bytes = self._scan(self.path)
+        if valid_bytes < os.path.getsize(self.path):
+            print(f"⚠️ Cắt phần ghi dở ở cuối {self.path}")
+            self._file.truncate(valid_bytes)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        self._tail_checked = True
+
+    def read(self) -> List[Dict[str, Any]]:
+        """Đọc toàn bộ bản ghi chưa được compaction, theo thứ tự ghi"""
+        with self._lock:
+            self._file.flush()
+            return self._read_file(self.rotated_path) + self._read_file(self.path)
+
+    def append(self, record: Dict[str, Any]):
+        line = json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n"
+        with self._lock, self._file_lock():
+            self._truncate_torn_tail()
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def size(self) -> int:
+        with self._lock:
+            return self._file.tell()
+
+    def rotate(self):
+        """Chuyển log hiện tại sang `.compacting` để compaction, ghi tiếp vào log rỗng"""
+        with self._lock:
+            self._file.close()
+            if os.path.exists(self.rotated_path):
+                # Lần compaction trước chưa xong: nối tiếp để không mất bản ghi nào
+                with open(self.path, "rb") as src, open(self.rotated_path, "ab") as dst:
+                    dst.write(src.read())
+                    dst.flush()
+                    os.fsync(dst.fileno())
+                os.remove(self.path)
+            elif os.path.exists(self.path):
+                os.replace(self.path, self.rotated_path)
+            self._file = open(self.path, "ab")
+            self._tail_checked = False
+
+    def drop_rotated(self):
+        with self._lock:
+            if os.path.exists(self.rotated_path):
+                os.remove(self.rotated_path)
+
+    def clear(self):
+        """Xoá toàn bộ log (sau khi đã lưu snapshot đầy đủ)"""
+        with self._lock, self._file_lock():
+            self._file.truncate(0)
+            self._file.seek(0)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._tail_checked = True
+            if os.path.exists(self.rotated_path):
+                os.remove(self.rotated_path)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
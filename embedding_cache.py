@@ -0,0 +1,172 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+class EmbeddingCache:
+    """Cache embedding theo (model, hash nội dung): tầng LRU trong RAM + tầng SQLite trên đĩa.
+
+    `model` là tag do caller đặt và phải đổi khi vector đổi hình dạng (CVProcessor dùng
+    "<tên model>@<số chiều>"). Số dòng trên đĩa được đếm tăng dần khi ghi; chỉ đếm lại bằng
+    `COUNT(*)` khi có vẻ vượt giới hạn (process khác dùng chung file có thể đã ghi/dọn thêm).
+    """
+
+    def __init__(self,
+                 path: Optional[str] = "embedding_cache.sqlite",
+                 max_memory_items: int = 10000,
+                 max_disk_items: int = 200000):
+        self.max_memory_items = max(0, max_memory_items)
+        self.max_disk_items = max(0, max_disk_items)
+        self._memory: "OrderedDict[Tuple[str, str], np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        self._conn = None
+        self._disk_items = 0
+        if path:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS embeddings (
+                       model TEXT NOT NULL,
+                       text_hash TEXT NOT NULL,
+                       vector BLOB NOT NULL,
+                       last_access REAL NOT NULL,
+                       PRIMARY KEY (model, text_hash)
+                   )"""
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings(last_access)"
+            )
+            self._conn.commit()
+            self._disk_items = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _remember(self, key: Tuple[str, str], vector: np.ndarray):
+        if not self.max_memory_items:
+            return
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def get_many(self, model: str, texts: List[str]) -> Dict[int, np.ndarray]:
+        """Trả về {vị trí trong texts: vector} cho các text đã có trong cache"""
+        found: Dict[int, np.ndarray] = {}
+        pending: Dict[str, List[int]] = {}
+
+        with self._lock:
+            for i, text in enumerate(texts):
+                key = (model, self.text_hash(text))
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[i] = vector
+                else:
+                    pending.setdefault(key[1], []).append(i)
+
+            if pending and self._conn is not None:
+                hashes = list(pending)
+                now = time.time()
+                # SQLite giới hạn số tham số mỗi câu lệnh
+                for start in range(0, len(hashes), 500):
+                    part = hashes[start:start + 500]
+                    rows = self._conn.execute(
+                        f"SELECT text_hash, vector FROM embeddings WHERE model = ? "
+                        f"AND text_hash IN ({','.join('?' * len(part))})",
+                        [model, *part],
+                    ).fetchall()
+                    for text_hash, blob in rows:
+                        vector = np.frombuffer(blob, dtype=np.float32)
+                        self._remember((model, text_hash), vector)
+                        for i in pending.pop(text_hash):
+                            found[i] = vector
+                    self._conn.executemany(
+                        "UPDATE embeddings SET last_access = ? WHERE model = ? AND text_hash = ?",
+                        [(now, model, text_hash) for text_hash, _ in rows],
+                    )
+                self._conn.commit()
+
+            self.hits += len(found)
+            self.misses += len(texts) - len(found)
+        return found
+
+    def put_many(self, model: str, texts: List[str], vectors: np.ndarray):
+        """Lưu embedding vào cả hai tầng, rồi dọn tầng đĩa nếu vượt giới hạn"""
+        now = time.time()
+        rows = []
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                vector = np.ascontiguousarray(vector, dtype=np.float32)
+                text_hash = self.text_hash(text)
+                self._remember((model, text_hash), vector)
+                rows.append((model, text_hash, vector.tobytes(), now))
+
+            if rows and self._conn is not None:
+                before = self._conn.total_changes
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO embeddings (model, text_hash, vector, last_access) "
+                    "VALUES (?, ?, ?, ?)",
+                    rows,
+                )
+                added = self._conn.total_changes - before
+                if added < len(rows):
+                    # Một số text đã có (cùng model thì cùng vector): chỉ cập nhật thời điểm truy cập
+                    self._conn.executemany(
+                        "UPDATE embeddings SET last_access = ? WHERE model = ? AND text_hash = ?",
+                        [(now, model, row[1]) for row in rows],
+                    )
+                self._disk_items += added
+                self._evict_disk()
+                self._conn.commit()
+
+    def _evict_disk(self):
+        """Xoá các dòng truy cập lâu nhất khi vượt max_disk_items (xoá dư 10% để đỡ xoá liên tục)"""
+        if self._disk_items <= self.max_disk_items:
+            return
+        count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        if count > self.max_disk_items:
+            excess = count - int(self.max_disk_items * 0.9)
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE rowid IN "
+                "(SELECT rowid FROM embeddings ORDER BY last_access LIMIT ?)",
+                (excess,),
+            )
+            count -= excess
+        self._disk_items = count
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "memory_items": len(self._memory),
+        }
+
+
+def default_embedding_cache() -> Optional[EmbeddingCache]:
+    """Cache mặc định dùng chung trong process, cấu hình qua biến môi trường"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None and os.getenv("EMBED_CACHE_PATH", "embedding_cache.sqlite"):
+            _default_cache = EmbeddingCache(
+                path=os.getenv("EMBED_CACHE_PATH", "embedding_cache.sqlite"),
+                max_memory_items=int(os.getenv("EMBED_CACHE_MEMORY_ITEMS", "10000")),
+                max_disk_items=int(os.getenv("EMBED_CACHE_MAX_ITEMS", "200000")),
+            )
+        return _default_cache
+
+
+_default_cache: Optional[EmbeddingCache] = None
+_default_cache_lock = threading.Lock()
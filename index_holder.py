@@ -0,0 +1,167 @@
+import os
+import threading
+from contextlib import contextmanager
+from typing import Callable, Iterable, Optional, Set, Tuple
+
+from process_store_class import FAISSVectorStore
+from sharded_store import create_vector_store
+
+
+class ReadWriteLock:
+    """Nhiều bên giữ chung (read) hoặc một bên giữ riêng (write); writer được ưu tiên để không bị đói"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+class IndexHolder:
+    """Giữ vector store đang phục vụ và thay bằng bản mới một cách nguyên tử (hot swap).
+
+    Request đọc chỉ lấy tham chiếu `current` (không khoá) nên không bao giờ bị chặn và luôn thấy
+    một store đã load xong; request đang chạy dùng tiếp store cũ cho tới khi kết thúc.
+    Thay đổi lên store hiện hành (upload, xoá) đi qua `modifying(sources)` (giữ `lock.read()`).
+
+    Rebuild chạy trên bản nháp (`staging_paths()`, chép từ store hiện hành) mà không khoá, nên
+    upload / xoá vẫn chạy bình thường trong lúc build; các source bị thay đổi trong lúc đó được
+    ghi lại. `lock.write()` chỉ được giữ để chép lại các source đó từ store hiện hành sang store
+    mới rồi swap. Store cũ được đóng (delta log ngay, kết nối SQLite sau `retire_seconds` để
+    request đang dùng nó kết thúc).
+    """
+
+    def __init__(self,
+                 index_path: str = "cv_index.faiss",
+                 metadata_path: str = "cv_metadata.db",
+                 store_factory: Callable[[], FAISSVectorStore] = create_vector_store,
+                 store: Optional[FAISSVectorStore] = None,
+                 retire_seconds: Optional[float] = None):
+        self.index_path = index_path
+        self.metadata_path = metadata_path
+        self.store_factory = store_factory
+        self.retire_seconds = retire_seconds if retire_seconds is not None \
+            else float(os.getenv("INDEX_RETIRE_SECONDS", "30"))
+        self.lock = ReadWriteLock()
+        self.generation = 0
+        self._swap_lock = threading.Lock()
+        self._rebuild_lock = threading.Lock()
+        # Source bị upload / xoá trong lúc rebuild (None khi không rebuild)
+        self._touched: Optional[Set[str]] = None
+        if store is not None:
+            self._current, self.loaded = store, True
+        else:
+            self._current = store_factory()
+            self.loaded = self._current.load(index_path, metadata_path)
+
+    @property
+    def current(self) -> FAISSVectorStore:
+        return self._current
+
+    @property
+    def version(self) -> Tuple[int, int]:
+        """Đổi khi swap sang store khác hoặc khi store hiện hành thay đổi (dùng cho cache)"""
+        store = self._current
+        return self.generation, store.version
+
+    def staging_paths(self) -> Tuple[str, str]:
+        """Đường dẫn bản nháp mà rebuild ghi vào, cạnh file của store đang phục vụ"""
+        index_stem, index_ext = os.path.splitext(self.index_path)
+        metadata_stem, metadata_ext = os.path.splitext(self.metadata_path)
+        return f"{index_stem}.rebuild{index_ext}", f"{metadata_stem}.rebuild{metadata_ext}"
+
+    @contextmanager
+    def modifying(self, sources: Iterable[str]):
+        """Giữ `lock.read()` trong lúc thay đổi `sources` trên store hiện hành (yield store đó)"""
+        with self.lock.read():
+            with self._swap_lock:
+                if self._touched is not None:
+                    self._touched.update(sources)
+            yield self._current
+
+    def _retire(self, store: FAISSVectorStore):
+        store.close_log()
+        timer = threading.Timer(self.retire_seconds, store.close)
+        timer.daemon = True
+        timer.start()
+
+    def swap(self, store: FAISSVectorStore):
+        with self._swap_lock:
+            old = self._current
+            self._current = store
+            self.generation += 1
+            self.loaded = True
+        if old is not store:
+            self._retire(old)
+
+    def reload(self) -> bool:
+        """Load store mới từ file (ngoài luồng request) rồi swap; giữ store cũ nếu không load được"""
+        store = self.store_factory()
+        if not store.load(self.index_path, self.metadata_path):
+            return False
+        self.swap(store)
+        return True
+
+    def rebuild(self, build: Callable[[str, str], bool]) -> bool:
+        """Chạy `build(index_path, metadata_path)` trên bản nháp rồi hot swap sang store mới.
+
+        Bản nháp được chép từ store hiện hành để `build` có thể cập nhật tăng dần. Sau khi swap,
+        store mới được lưu vào `index_path` / `metadata_path` của holder.
+        """
+        with self._rebuild_lock:
+            staging_index, staging_metadata = self.staging_paths()
+            with self._swap_lock:
+                self._touched = set()
+            try:
+                self._current.snapshot_to(staging_index, staging_metadata)
+                if not build(staging_index, staging_metadata):
+                    return False
+                store = self.store_factory()
+                if not store.load(staging_index, staging_metadata):
+                    return False
+                with self.lock.write():
+                    current = self._current
+                    touched = sorted(self._touched)
+                    for source in touched:
+                        documents, embeddings = current.export_sources([source])
+                        if documents:
+                            store.upsert_source(source, documents, embeddings)
+                        else:
+                            store.remove_sources([source])
+                    if touched:
+                        print(f"♻️ Áp dụng lại {len(touched)} CV thay đổi trong lúc rebuild")
+                    self.swap(store)
+            finally:
+                with self._swap_lock:
+                    self._touched = None
+            store.save(self.index_path, self.metadata_path)
+            return True
@@ -0,0 +1,229 @@
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, ContextManager, Dict, Iterable, List, Optional
+
+from process_store_class import CVProcessor, FAISSVectorStore
+from profiles import ProfileStore, extract_profile
+
+_DONE = object()
+
+
+class StageStats:
+    """Số item và thời gian xử lý (cộng dồn qua các worker) của một stage"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.busy_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, items: int, seconds: float):
+        with self._lock:
+            self.items += items
+            self.busy_seconds += seconds
+
+    def summary(self, unit: str) -> str:
+        rate = self.items / self.busy_seconds if self.busy_seconds else 0.0
+        return f"{self.name}: {self.items} {unit}, {self.busy_seconds:.2f}s, {rate:.1f} {unit}/s"
+
+
+class IngestionPipeline:
+    """Pipeline parse -> chunk -> embed -> index với hàng đợi giới hạn giữa các stage.
+
+    - parse: `parse_workers` thread gọi `CVProcessor.parse_cv_to_markdown` song song
+    - chunk: 1 thread tách đoạn văn
+    - embed: 1 thread gom chunk của nhiều file thành batch rồi gọi `get_embeddings`
+    - index: thread gọi `run()` ghi vào `FAISSVectorStore` theo từng file (store tự khoá nên các stage
+      khác và các thread search vẫn chạy song song)
+
+    Nếu có `profile_store`, hồ sơ có cấu trúc của mỗi CV được trích xuất ở stage chunk và ghi vào
+    bảng hồ sơ ngay sau khi file vào index.
+
+    `modifying(sources)` (vd. `IndexHolder.modifying`) bao quanh việc ghi từng file vào store và yield
+    store cần ghi; parse / chunk / embed chạy ngoài nó nên không giữ khoá của holder trong lúc gọi model.
+    """
+
+    def __init__(self,
+                 cv_processor: CVProcessor,
+                 vector_store: FAISSVectorStore,
+                 parse_workers: int = 4,
+                 embed_batch_size: int = 64,
+                 queue_size: int = 16,
+                 profile_store: Optional[ProfileStore] = None,
+                 modifying: Optional[Callable[[Iterable[str]], ContextManager[FAISSVectorStore]]] = None):
+        self.cv_processor = cv_processor
+        self.vector_store = vector_store
+        self.modifying = modifying or self._own_store
+        self.profile_store = profile_store
+        self._profiles: Dict[str, Dict] = {}
+        self.parse_workers = max(1, parse_workers)
+        self.embed_batch_size = max(1, embed_batch_size)
+        self.queue_size = max(1, queue_size)
+        self.stats: Dict[str, StageStats] = {}
+        self.failed: List[str] = []
+        self.wall_seconds = 0.0
+        self._on_progress: Optional[Callable[[str, str], None]] = None
+
+    def _parse_stage(self, cv_folder: str, files: "queue.Queue", out: "queue.Queue"):
+        while True:
+            try:
+                filename = files.get_nowait()
+            except queue.Empty:
+                break
+            start = time.perf_counter()
+            path = os.path.join(cv_folder, filename)
+            try:
+                text = self.cv_processor.parse_cv_to_markdown(path)
+                # Thời điểm file được lưu vào thư mục CV (lúc upload) dùng cho bộ lọc theo ngày
+                uploaded_at = os.path.getmtime(path)
+            except Exception as e:
+                print(f"   ❌ Lỗi khi xử lý {filename}: {str(e)}")
+                text = ""
+            self.stats["parse"].record(1, time.perf_counter() - start)
+            if not text.strip():
+                print(f"⚠️ Bỏ qua file {filename} vì không đọc được nội dung.")
+                self._fail(filename)
+                continue
+            self._progress(filename, "parsed")
+            out.put((filename, text, uploaded_at))
+        out.put(_DONE)
+
+    def _chunk_stage(self, inp: "queue.Queue", out: "queue.Queue"):
+        remaining = self.parse_workers
+        while remaining:
+            item = inp.get()
+            if item is _DONE:
+                remaining -= 1
+                continue
+            filename, text, uploaded_at = item
+            start = time.perf_counter()
+            try:
+                docs = self.cv_processor.chunk_text(text, source=filename, uploaded_at=uploaded_at)
+                if self.profile_store is not None:
+                    self._profiles[filename] = extract_profile(text, filename, uploaded_at)
+            except Exception as e:
+                print(f"   ❌ Lỗi khi xử lý {filename}: {str(e)}")
+                self._fail(filename)
+                continue
+            self.stats["chunk"].record(1, time.perf_counter() - start)
+            self._progress(filename, "chunked")
+            out.put((filename, docs))
+        out.put(_DONE)
+
+    def _embed_stage(self, inp: "queue.Queue", out: "queue.Queue"):
+        pending = []
+
+        def flush():
+            if not pending:
+                return
+            texts = [doc.page_content for _, docs in pending for doc in docs]
+            start = time.perf_counter()
+            try:
+                embeddings = self.cv_processor.get_embeddings(texts)
+            except Exception as e:
+                print(f"   ❌ Lỗi khi tạo embedding: {str(e)}")
+                for filename, _ in pending:
+                    self._fail(filename)
+                pending.clear()
+                return
+            self.stats["embed"].record(len(texts), time.perf_counter() - start)
+            offset = 0
+            for filename, docs in pending:
+                self._progress(filename, "embedded")
+                out.put((filename, docs, embeddings[offset:offset + len(docs)]))
+                offset += len(docs)
+            pending.clear()
+
+        while True:
+            item = inp.get()
+            if item is _DONE:
+                break
+            pending.append(item)
+            if sum(len(docs) for _, docs in pending) >= self.embed_batch_size:
+                flush()
+        flush()
+        out.put(_DONE)
+
+    @contextmanager
+    def _own_store(self, sources: Iterable[str]):
+        yield self.vector_store
+
+    def _progress(self, filename: str, stage: str):
+        if self._on_progress is not None:
+            self._on_progress(filename, stage)
+
+    def _fail(self, filename: str):
+        self.failed.append(filename)
+        self._progress(filename, "failed")
+
+    def run(self,
+            cv_folder: str,
+            filenames: List[str],
+            on_indexed: Optional[Callable[[str], None]] = None,
+            on_progress: Optional[Callable[[str, str], None]] = None) -> int:
+        """Chạy pipeline cho danh sách file, trả về số file đã đưa vào index.
+
+        Chunk cũ của mỗi file được thay thế; `on_indexed(filename)` được gọi sau khi file vào index.
+        `on_progress(filename, stage)` được gọi khi file qua mỗi stage
+        ("parsed", "chunked", "embedded", "indexed" hoặc "failed").
+        """
+        self.stats = {name: StageStats(name) for name in ("parse", "chunk", "embed", "index")}
+        self.failed = []
+        self._on_progress = on_progress
+
+        files: "queue.Queue" = queue.Queue()
+        for filename in filenames:
+            files.put(filename)
+        parsed: "queue.Queue" = queue.Queue(maxsize=self.queue_size)
+        chunked: "queue.Queue" = queue.Queue(maxsize=self.queue_size)
+        embedded: "queue.Queue" = queue.Queue(maxsize=self.queue_size)
+
+        threads = [
+            threading.Thread(target=self._parse_stage, args=(cv_folder, files, parsed), daemon=True)
+            for _ in range(self.parse_workers)
+        ]
+        threads.append(threading.Thread(target=self._chunk_stage, args=(parsed, chunked), daemon=True))
+        threads.append(threading.Thread(target=self._embed_stage, args=(chunked, embedded), daemon=True))
+
+        wall_start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+
+        indexed = 0
+        while True:
+            item = embedded.get()
+            if item is _DONE:
+                break
+            filename, docs, embeddings = item
+            start = time.perf_counter()
+            try:
+                with self.modifying([filename]) as vector_store:
+                    vector_store.upsert_source(filename, docs, embeddings)
+                    profile = self._profiles.pop(filename, None)
+                    if profile is not None:
+                        self.profile_store.upsert(profile)
+                if on_indexed is not None:
+                    on_indexed(filename)
+            except Exception as e:
+                print(f"   ❌ Lỗi khi xử lý {filename}: {str(e)}")
+                self._fail(filename)
+                continue
+            self.stats["index"].record(1, time.perf_counter() - start)
+            self._progress(filename, "indexed")
+            indexed += 1
+            print(f"   ✅ Hoàn thành xử lý {filename} ({len(docs)} chunks)")
+
+        for thread in threads:
+            thread.join()
+        self.wall_seconds = time.perf_counter() - wall_start
+        return indexed
+
+    def report(self):
+        """In throughput của từng stage"""
+        print(f"⏱️ Pipeline: {self.wall_seconds:.2f}s tổng, {self.parse_workers} parse workers")
+        units = {"parse": "files", "chunk": "files", "embed": "chunks", "index": "files"}
+        for name, stage in self.stats.items():
+            print(f"   - {stage.summary(units[name])}")
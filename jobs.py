@@ -0,0 +1,126 @@
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+FILE_STAGES = ("queued", "parsed", "chunked", "embedded", "indexed", "failed")
+
+
+class IngestionJob:
+    """Một job ingest (upload hoặc rebuild) cùng tiến độ của từng file"""
+
+    def __init__(self, kind: str, files: Optional[List[str]] = None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = "queued"
+        self.error: Optional[str] = None
+        self.result: Any = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.files: "OrderedDict[str, str]" = OrderedDict((f, "queued") for f in files or [])
+        self._lock = threading.Lock()
+
+    def update_file(self, filename: str, stage: str):
+        """Callback `on_progress` của IngestionPipeline (file chưa biết trước sẽ được thêm vào)"""
+        with self._lock:
+            # Không lùi trạng thái (ví dụ "failed" đến trước khi stage khác kịp báo)
+            if self.files.get(filename) != "failed":
+                self.files[filename] = stage
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            files = dict(self.files)
+        counts = {stage: 0 for stage in FILE_STAGES}
+        for stage in files.values():
+            counts[stage] += 1
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "error": self.error,
+            "result": self.result,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "progress": {
+                "total": len(files),
+                "done": counts["indexed"] + counts["failed"],
+                **counts,
+            },
+            "files": files,
+        }
+
+
+class JobQueue:
+    """Hàng đợi job trong process: `workers` thread xử lý các job theo thứ tự gửi vào.
+
+    `submit()` trả về ngay; handler nhận job để cập nhật tiến độ và trả về `result`.
+    Chỉ giữ lại `history` job gần nhất đã xong để tra cứu.
+    """
+
+    def __init__(self, workers: int = 2, history: int = 1000):
+        self.workers = max(1, workers)
+        self.history = max(1, history)
+        self._queue: "queue.Queue" = queue.Queue()
+        self._jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+
+    def _ensure_started(self):
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"ingest-job-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _worker(self):
+        while True:
+            job, handler = self._queue.get()
+            job.status = "running"
+            job.started_at = time.time()
+            try:
+                job.result = handler(job)
+                job.status = "failed" if job.files and all(
+                    stage == "failed" for stage in job.files.values()
+                ) else "completed"
+            except Exception as e:
+                job.error = str(e)
+                job.status = "failed"
+            job.finished_at = time.time()
+            self._trim()
+
+    def _trim(self):
+        with self._lock:
+            finished = [job_id for job_id, job in self._jobs.items()
+                        if job.status in ("completed", "failed")]
+            for job_id in finished[:max(0, len(finished) - self.history)]:
+                del self._jobs[job_id]
+
+    def submit(self, kind: str, handler: Callable[[IngestionJob], Any],
+               files: Optional[List[str]] = None) -> IngestionJob:
+        job = IngestionJob(kind, files)
+        with self._lock:
+            self._ensure_started()
+            self._jobs[job.id] = job
+        self._queue.put((job, handler))
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def active(self, kind: str) -> Optional[IngestionJob]:
+        """Job loại `kind` đang chờ hoặc đang chạy (nếu có)"""
+        with self._lock:
+            for job in self._jobs.values():
+                if job.kind == kind and job.status in ("queued", "running"):
+                    return job
+        return None
+
+    def list(self, limit: int = 50) -> List[IngestionJob]:
+        with self._lock:
+            return list(self._jobs.values())[-limit:][::-1]
@@ -0,0 +1,107 @@
+import math
+import re
+import unicodedata
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Giữ nguyên các từ khoá kỹ thuật như "c++", "c#", "node.js", "asp.net"
+TOKEN_PATTERN = re.compile(r"\w[\w+#.]*[\w+#]|\w")
+
+
+def tokenize(text: str) -> List[str]:
+    """Tách từ cho BM25: NFC, chữ thường, bỏ dấu câu nhưng giữ các ký tự của tên công nghệ"""
+    return TOKEN_PATTERN.findall(unicodedata.normalize("NFC", text).lower())
+
+
+def term_counts(text: str) -> Dict[str, int]:
+    return dict(Counter(tokenize(text)))
+
+
+class BM25Index:
+    """Inverted index BM25 trong RAM, thêm/xoá theo id chunk (cùng id với FAISS).
+
+    Postings của mỗi term được gom thành mảng numpy (cache, làm mới khi term thay đổi)
+    nên chấm điểm một query chỉ tốn vài phép toán vector trên các posting liên quan.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._doc_terms: Dict[int, List[str]] = {}
+        self._doc_lengths: Dict[int, int] = {}
+        self._total_length = 0
+        self._arrays: Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+
+    def __len__(self) -> int:
+        return len(self._doc_lengths)
+
+    def add(self, doc_id: int, counts: Dict[str, int]):
+        doc_id = int(doc_id)
+        if doc_id in self._doc_lengths:
+            self.remove([doc_id])
+        length = sum(counts.values())
+        self._doc_terms[doc_id] = list(counts)
+        self._doc_lengths[doc_id] = length
+        self._total_length += length
+        for term, tf in counts.items():
+            self._postings.setdefault(term, {})[doc_id] = tf
+            self._arrays.pop(term, None)
+
+    def remove(self, doc_ids: Iterable[int]):
+        for doc_id in doc_ids:
+            doc_id = int(doc_id)
+            terms = self._doc_terms.pop(doc_id, None)
+            if terms is None:
+                continue
+            self._total_length -= self._doc_lengths.pop(doc_id)
+            for term in terms:
+                postings = self._postings[term]
+                del postings[doc_id]
+                if not postings:
+                    del self._postings[term]
+                self._arrays.pop(term, None)
+
+    def _term_arrays(self, term: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        arrays = self._arrays.get(term)
+        if arrays is None:
+            postings = self._postings[term]
+            ids = np.fromiter(postings.keys(), dtype=np.int64, count=len(postings))
+            tfs = np.fromiter(postings.values(), dtype=np.float32, count=len(postings))
+            lengths = np.fromiter((self._doc_lengths[i] for i in postings), dtype=np.float32,
+                                  count=len(postings))
+            arrays = self._arrays[term] = (ids, tfs, lengths)
+        return arrays
+
+    def search(self, query: str, k: int = 5,
+               allowed_ids: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """Trả về [(id, điểm BM25)] theo điểm giảm dần, chỉ trong `allowed_ids` nếu có"""
+        n_docs = len(self._doc_lengths)
+        terms = [t for t in dict.fromkeys(tokenize(query)) if t in self._postings]
+        if not n_docs or not terms or k <= 0:
+            return []
+        avg_length = self._total_length / n_docs
+
+        all_ids, all_scores = [], []
+        for term in terms:
+            ids, tfs, lengths = self._term_arrays(term)
+            idf = math.log(1 + (n_docs - len(ids) + 0.5) / (len(ids) + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * lengths / avg_length)
+            all_ids.append(ids)
+            all_scores.append(idf * tfs * (self.k1 + 1) / (tfs + norm))
+
+        ids = np.concatenate(all_ids)
+        scores = np.concatenate(all_scores)
+        unique, inverse = np.unique(ids, return_inverse=True)
+        totals = np.bincount(inverse, weights=scores)
+        if allowed_ids is not None:
+            keep = np.isin(unique, allowed_ids)
+            unique, totals = unique[keep], totals[keep]
+            if not len(unique):
+                return []
+        k = min(k, len(unique))
+        top = np.argpartition(-totals, k - 1)[:k]
+        top = top[np.argsort(-totals[top])]
+        return [(int(unique[i]), float(totals[i])) for i in top]
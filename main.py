@@ -1,17 +1,44 @@
 import os
 import argparse
-from process_store_class import CVProcessor, FAISSVectorStore
+from process_store_class import CVProcessor
+from sharded_store import create_vector_store
 from model_infer import CVChatBot
+from manifest import IndexManifest
+from ingest import IngestionPipeline
+from profiles import ProfileStore, extract_profile
+from context_builder import overlap_length
+
+def join_chunks(chunks, overlap_chars: int) -> str:
+    """Ghép lại nội dung CV từ các chunk (theo chunk_id), bỏ phần lặp do chunk_overlap"""
+    text = ""
+    for chunk in chunks:
+        content = chunk["content"]
+        overlap = overlap_length(text, content, overlap_chars) if text else 0
+        text += content[overlap:] if overlap else ("\n" if text else "") + content
+    return text
 
 def build_vector_store(cv_folder: str = "cv", 
                       index_path: str = "cv_index.faiss", 
-                      metadata_path: str = "cv_metadata.json"):
-    """Xây dựng vector store từ thư mục CV"""
+                      metadata_path: str = "cv_metadata.db",
+                      manifest_path: str = "cv_manifest.json",
+                      profile_path: str = "cv_profiles.db",
+                      incremental: bool = True,
+                      parse_workers: int = int(os.getenv("PARSE_WORKERS", "4")),
+                      on_progress=None):
+    """Xây dựng vector store từ thư mục CV.
+
+    Ở chế độ incremental, chỉ xử lý các file mới hoặc đã thay đổi so với manifest,
+    xoá vector của các file không còn trong thư mục và giữ nguyên phần còn lại.
+    `on_progress(filename, stage)` được chuyển cho IngestionPipeline để theo dõi từng file.
+    Hồ sơ có cấu trúc của từng CV (kỹ năng, học vấn, kinh nghiệm) được cập nhật cùng lúc.
+    """
     
     print("🚀 Bắt đầu xử lý và embedding CV...")
     
     cv_processor = CVProcessor()
-    vector_store = FAISSVectorStore()
+    vector_store = create_vector_store()
+    manifest = IndexManifest(manifest_path)
+    profile_store = ProfileStore(profile_path)
     
     if not os.path.exists(cv_folder):
         print(f"❌ Không tìm thấy thư mục {cv_folder}")
@@ -25,45 +52,71 @@ def build_vector_store(cv_folder: str = "cv",
     
     print(f"📁 Tìm thấy {len(pdf_files)} file PDF")
     
-    processed_count = 0
-    
-    for filename in pdf_files:
-        file_path = os.path.join(cv_folder, filename)
-        print(f"🔍 Đang xử lý file: {filename}")
-        
+    # Chỉ cập nhật tăng dần khi có cả manifest lẫn index cũ, ngược lại build lại từ đầu
+    if incremental and manifest.load() and vector_store.load(index_path, metadata_path):
+        to_process, unchanged, deleted = manifest.diff(cv_folder, pdf_files)
+        # Các source có trong index nhưng không còn file (ví dụ xoá qua API) cũng bị xoá
+        current = set(pdf_files)
+        deleted = sorted(set(deleted) | {source for source in vector_store.metadata.sources()
+                                         if source not in current})
+        print(f"♻️ Cập nhật tăng dần: {len(to_process)} mới/thay đổi, "
+              f"{len(unchanged)} giữ nguyên, {len(deleted)} đã xoá")
+    else:
+        manifest.files = {}
+        to_process, unchanged, deleted = pdf_files, [], []
+    
+    # Hồ sơ của file không còn trong thư mục bị xoá; file giữ nguyên mà chưa có hồ sơ (index cũ)
+    # hoặc hồ sơ trích xuất bằng luật cũ được trích xuất lại từ nội dung chunk đã lưu trong index
+    # (không parse lại PDF / gọi Gemini)
+    current = set(pdf_files)
+    profile_store.remove([source for source in profile_store.sources() if source not in current])
+    missing = sorted((set(unchanged) - set(profile_store.sources())) | (set(unchanged) & set(profile_store.outdated())))
+    extracted = 0
+    for filename in missing:
         try:
-            # 1. Đọc và chuyển đổi PDF sang markdown
-            text = cv_processor.parse_cv_to_markdown(file_path)
+            text = join_chunks(vector_store.source_chunks(filename), cv_processor.chunk_overlap)
             if not text.strip():
-                print(f"⚠️ Bỏ qua file {filename} vì không đọc được nội dung.")
+                # Không có nội dung: giữ hồ sơ cũ (nếu có) để lần sau thử lại
+                print(f"⚠️ Không có nội dung để trích xuất hồ sơ {filename}")
                 continue
-            
-            # 2. Tách đoạn văn
-            docs = cv_processor.chunk_text(text, source=filename)
-            print(f"   📝 Tạo {len(docs)} chunks")
-            
-            # 3. Tạo embedding
-            embeddings = cv_processor.get_embeddings([doc.page_content for doc in docs])
-            print(f"   🔗 Tạo embeddings thành công")
-            
-            # 4. Thêm vào FAISS
-            vector_store.add_documents(docs, embeddings)
-            processed_count += 1
-            print(f"   ✅ Hoàn thành xử lý {filename}")
-            
+            profile_store.upsert(extract_profile(text, filename, os.path.getmtime(os.path.join(cv_folder, filename))))
+            extracted += 1
         except Exception as e:
-            print(f"   ❌ Lỗi khi xử lý {filename}: {str(e)}")
-            continue
-    
-    if processed_count > 0:
-        # 5. Lưu FAISS và metadata
-        print(f"💾 Lưu vector store...")
-        vector_store.save(index_path, metadata_path)
-        print(f"✅ Hoàn thành! Đã xử lý {processed_count}/{len(pdf_files)} file CV")
+            print(f"   ❌ Lỗi khi trích xuất hồ sơ {filename}: {str(e)}")
+    if extracted:
+        print(f"🗂️ Đã trích xuất hồ sơ cho {extracted} CV có sẵn trong index")
+    
+    if deleted:
+        removed = vector_store.remove_sources(deleted)
+        for filename in deleted:
+            manifest.forget(filename)
+        print(f"🗑️ Đã xoá {removed} chunks của {len(deleted)} file không còn tồn tại")
+    
+    # Parse song song -> chunk -> embed theo batch -> thêm vào index
+    pipeline = IngestionPipeline(cv_processor, vector_store, parse_workers=parse_workers,
+                                 profile_store=profile_store)
+    processed_count = pipeline.run(
+        cv_folder, to_process,
+        on_indexed=lambda filename: manifest.record(cv_folder, filename),
+        on_progress=on_progress
+    )
+    if to_process:
+        pipeline.report()
+    
+    if processed_count == 0 and not deleted:
+        if to_process and not vector_store.metadata:
+            print("❌ Không có file nào được xử lý thành công")
+            return False
+        print("✅ Vector store đã cập nhật, không có thay đổi")
+        manifest.save()
         return True
-    else:
-        print("❌ Không có file nào được xử lý thành công")
-        return False
+    
+    # 5. Lưu FAISS, metadata và manifest
+    print(f"💾 Lưu vector store...")
+    vector_store.save(index_path, metadata_path)
+    manifest.save()
+    print(f"✅ Hoàn thành! Đã xử lý {processed_count}/{len(to_process)} file CV")
+    return True
 
 def test_chat():
     """Test chức năng chat"""
@@ -126,12 +179,17 @@ def main():
                        default="ui", help="Chế độ chạy")
     parser.add_argument("--cv_folder", default="cv", 
                        help="Thư mục chứa CV PDF")
+    parser.add_argument("--full", action="store_true",
+                       help="Build lại toàn bộ vector store thay vì cập nhật tăng dần")
+    parser.add_argument("--parse_workers", type=int, default=int(os.getenv("PARSE_WORKERS", "4")),
+                       help="Số file PDF được parse song song")
     
     args = parser.parse_args()
     
     if args.mode == "build":
         print("🔨 Chế độ: Xây dựng Vector Store")
-        build_vector_store(args.cv_folder)
+        build_vector_store(args.cv_folder, incremental=not args.full,
+                           parse_workers=args.parse_workers)
     
     elif args.mode == "test":
         print("🧪 Chế độ: Test ChatBot")
@@ -0,0 +1,73 @@
+import hashlib
+import json
+import os
+from typing import Dict, List, Tuple
+
+
+def file_sha256(path: str, chunk_size: int = 1 << 20) -> str:
+    """Hash nội dung file theo từng khối để không phải đọc cả file vào RAM"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class IndexManifest:
+    """Ghi nhận các file PDF đã được đưa vào index: {filename: {size, mtime, sha256}}"""
+
+    def __init__(self, path: str = "cv_manifest.json"):
+        self.path = path
+        self.files: Dict[str, Dict] = {}
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def load(self) -> bool:
+        if not self.exists():
+            return False
+        with open(self.path, "r", encoding="utf-8") as f:
+            self.files = json.load(f)
+        return True
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.files, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def diff(self, cv_folder: str, filenames: List[str]) -> Tuple[List[str], List[str], List[str]]:
+        """So sánh thư mục với manifest, trả về (new_or_changed, unchanged, deleted).
+
+        Chỉ hash lại file khi size/mtime thay đổi; nếu hash vẫn trùng thì coi là không đổi
+        và cập nhật lại size/mtime trong manifest.
+        """
+        changed, unchanged = [], []
+        for filename in filenames:
+            stat = os.stat(os.path.join(cv_folder, filename))
+            entry = self.files.get(filename)
+            if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+                unchanged.append(filename)
+                continue
+
+            if entry and entry["sha256"] == file_sha256(os.path.join(cv_folder, filename)):
+                entry["size"], entry["mtime"] = stat.st_size, stat.st_mtime
+                unchanged.append(filename)
+            else:
+                changed.append(filename)
+
+        current = set(filenames)
+        deleted = [filename for filename in self.files if filename not in current]
+        return changed, unchanged, deleted
+
+    def record(self, cv_folder: str, filename: str):
+        path = os.path.join(cv_folder, filename)
+        stat = os.stat(path)
+        self.files[filename] = {
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "sha256": file_sha256(path),
+        }
+
+    def forget(self, filename: str):
+        self.files.pop(filename, None)
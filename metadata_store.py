@@ -0,0 +1,390 @@
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from lexical_index import BM25Index, term_counts
+
+
+class MetadataStore:
+    """Metadata của các chunk lưu trong SQLite, khoá theo id của vector trong FAISS.
+
+    Id được cấp tăng dần khi `append` và không bao giờ dùng lại, kể cả sau khi xoá các dòng
+    có id lớn nhất (bộ đếm lưu trong bảng `meta`), nên delta log và cache theo id không bao giờ
+    trỏ nhầm sang chunk khác. Xoá một file chỉ xoá đúng các dòng của file đó (tra nhanh qua
+    index trên cột `source`).
+
+    Khi mở từ file, store chỉ đọc (read-only) và đọc lười: mở file là O(1), `search`
+    chỉ lấy đúng k dòng cần thiết. Lần ghi đầu tiên sẽ chép dữ liệu sang SQLite trong RAM
+    (copy-on-write) để file đang được process khác đọc không bị thay đổi giữa chừng;
+    `save()` ghi ra file tạm rồi `os.replace` để các reader luôn thấy một bản hoàn chỉnh.
+
+    File định dạng cũ (cột `position`, chưa có bảng `postings`) được chuyển và ghi lại xuống
+    file một lần khi mở, sau đó mở lại ở chế độ chỉ đọc như bình thường.
+
+    Bảng `postings` (term frequency của từng chunk) được cập nhật cùng lúc với `chunks`,
+    nên inverted index BM25 luôn khớp với metadata và được lưu trong cùng một file.
+    `preload_lexical()` nạp postings vào RAM ở thread nền (theo từng khoảng id, chỉ giữ lock
+    trong lúc đọc một khoảng); `lexical_index()` chờ lần nạp đó hoặc tự nạp nếu chưa có.
+    """
+
+    LEXICAL_LOAD_BATCH = 5000
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._lock = threading.RLock()
+        self._lexical: Optional[BM25Index] = None
+        self._lexical_loading: Optional[threading.Event] = None
+        # Thay đổi postings trong lúc đang nạp BM25, áp dụng lại khi nạp xong
+        self._lexical_changes: Optional[List[tuple]] = None
+        self._source_index: Optional[Dict[str, Dict[str, Any]]] = None
+        if path is None:
+            self._conn = sqlite3.connect(":memory:", check_same_thread=False)
+            self._create_schema(self._conn)
+            self._readonly = False
+        else:
+            self._open_readonly(path)
+            if self._needs_migration():
+                self._migrate(path)
+
+    def _open_readonly(self, path: str):
+        self._conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        self._readonly = True
+
+    def _needs_migration(self) -> bool:
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(chunks)")]
+        tables = {row[0] for row in self._conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        return "position" in columns or "postings" not in tables
+
+    def _migrate(self, path: str):
+        """Chuyển file cũ sang schema hiện tại, ghi lại xuống file rồi mở lại chỉ đọc"""
+        self._ensure_writable()
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(chunks)")]
+        if "position" in columns:
+            # File cũ khoá theo vị trí (0..n-1, trùng với id khi nạp index cũ)
+            self._conn.execute("ALTER TABLE chunks RENAME COLUMN position TO id")
+        tables = {row[0] for row in self._conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        if "postings" not in tables:
+            # File cũ chưa có inverted index: dựng từ nội dung chunk
+            self._create_schema(self._conn)
+            rows = self._conn.execute("SELECT id, content FROM chunks").fetchall()
+            self._insert_postings([(chunk_id, content) for chunk_id, content in rows])
+        self._conn.commit()
+        try:
+            self.save(path)
+        except OSError as e:
+            print(f"⚠️ Không ghi được {path} sau khi chuyển định dạng ({e}), dùng bản trong RAM")
+            return
+        print(f"♻️ Đã chuyển {path} sang định dạng mới")
+        self._conn.close()
+        self._open_readonly(path)
+
+    @staticmethod
+    def _create_schema(conn: sqlite3.Connection):
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS chunks (
+                   id INTEGER PRIMARY KEY,
+                   source TEXT NOT NULL,
+                   content TEXT NOT NULL,
+                   metadata TEXT NOT NULL
+               )"""
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_source ON chunks(source)")
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS postings (
+                   id INTEGER NOT NULL,
+                   term TEXT NOT NULL,
+                   tf INTEGER NOT NULL,
+                   PRIMARY KEY (id, term)
+               ) WITHOUT ROWID"""
+        )
+
+    @classmethod
+    def from_json(cls, path: str) -> "MetadataStore":
+        """Chuyển file cv_metadata.json (định dạng cũ) sang store mới"""
+        store = cls()
+        with open(path, "r", encoding="utf-8") as f:
+            store.append(json.load(f))
+        return store
+
+    def _ensure_writable(self):
+        if self._readonly:
+            memory = sqlite3.connect(":memory:", check_same_thread=False)
+            self._conn.backup(memory)
+            self._conn.close()
+            self._conn = memory
+            self._readonly = False
+
+    @staticmethod
+    def _row_to_entry(content: str, metadata: str) -> Dict[str, Any]:
+        return {"content": content, "metadata": json.loads(metadata)}
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def __bool__(self) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM chunks LIMIT 1").fetchone() is not None
+
+    def __getitem__(self, chunk_id: int) -> Dict[str, Any]:
+        entry = self.get_many([chunk_id])[0]
+        if entry is None:
+            raise KeyError(chunk_id)
+        return entry
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute("SELECT content, metadata FROM chunks ORDER BY id").fetchall()
+        for content, metadata in rows:
+            yield self._row_to_entry(content, metadata)
+
+    def next_id(self) -> int:
+        with self._lock:
+            last = self._conn.execute("SELECT MAX(id) FROM chunks").fetchone()[0]
+            try:
+                row = self._conn.execute("SELECT value FROM meta WHERE key = 'next_id'").fetchone()
+            except sqlite3.OperationalError:
+                # File cũ chưa có bảng meta: bộ đếm bắt đầu từ id lớn nhất hiện có
+                row = None
+        return max(0 if last is None else last + 1, row[0] if row else 0)
+
+    def _reserve_ids(self, next_id: int):
+        """Ghi bộ đếm id (chỉ tăng), gọi khi đang giữ lock và store đã ghi được"""
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self._conn.execute(
+            "INSERT INTO meta (key, value) VALUES ('next_id', ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = MAX(value, excluded.value)",
+            (int(next_id),),
+        )
+
+    def id_range(self) -> Tuple[int, Optional[int], Optional[int]]:
+        """(số chunk, id nhỏ nhất, id lớn nhất) mà không đọc toàn bộ id"""
+        with self._lock:
+            count, first, last = self._conn.execute("SELECT COUNT(*), MIN(id), MAX(id) FROM chunks").fetchone()
+        return count, first, last
+
+    def ids(self) -> List[int]:
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT id FROM chunks ORDER BY id")]
+
+    def get_many(self, ids: List[int]) -> List[Optional[Dict[str, Any]]]:
+        """Lấy metadata theo danh sách id (giữ thứ tự), None nếu không tồn tại"""
+        if not ids:
+            return []
+        unique = sorted({int(i) for i in ids})
+        rows = []
+        with self._lock:
+            # SQLite giới hạn số tham số mỗi câu lệnh
+            for start in range(0, len(unique), 500):
+                part = unique[start:start + 500]
+                rows.extend(self._conn.execute(
+                    f"SELECT id, content, metadata FROM chunks "
+                    f"WHERE id IN ({','.join('?' * len(part))})",
+                    part,
+                ).fetchall())
+        found = {chunk_id: self._row_to_entry(content, metadata) for chunk_id, content, metadata in rows}
+        return [found.get(int(i)) for i in ids]
+
+    def append(self, entries: List[Dict[str, Any]], ids: Optional[List[int]] = None) -> List[int]:
+        """Thêm các chunk, trả về id đã cấp (dùng làm id của vector trong FAISS)"""
+        with self._lock:
+            self._ensure_writable()
+            if ids is None:
+                start = self.next_id()
+                ids = list(range(start, start + len(entries)))
+            self._conn.executemany(
+                "INSERT INTO chunks (id, source, content, metadata) VALUES (?, ?, ?, ?)",
+                [
+                    (int(chunk_id), entry["metadata"]["source"], entry["content"],
+                     json.dumps(entry["metadata"], ensure_ascii=False))
+                    for chunk_id, entry in zip(ids, entries)
+                ],
+            )
+            self._insert_postings([(chunk_id, entry["content"]) for chunk_id, entry in zip(ids, entries)])
+            if ids:
+                self._reserve_ids(max(int(chunk_id) for chunk_id in ids) + 1)
+            self._conn.commit()
+            if self._source_index is not None:
+                for chunk_id, entry in zip(ids, entries):
+                    self._index_source(entry["metadata"]["source"], [chunk_id],
+                                       entry["metadata"].get("uploaded_at", 0.0))
+            return ids
+
+    def _index_source(self, source: str, ids: List[int], uploaded_at: float):
+        info = self._source_index.setdefault(
+            source, {"ids": np.zeros(0, dtype=np.int64), "uploaded_at": 0.0}
+        )
+        info["ids"] = np.union1d(info["ids"], np.asarray(ids, dtype=np.int64))
+        info["uploaded_at"] = max(info["uploaded_at"], uploaded_at or 0.0)
+
+    def source_index(self) -> Dict[str, Dict[str, Any]]:
+        """source -> {"ids": mảng id đã sắp xếp, "uploaded_at": thời điểm upload}, dựng sẵn để lọc khi search"""
+        with self._lock:
+            if self._source_index is None:
+                self._source_index = {}
+                grouped: Dict[str, List[int]] = {}
+                uploaded: Dict[str, float] = {}
+                for source, chunk_id, uploaded_at in self._conn.execute(
+                    "SELECT source, id, json_extract(metadata, '$.uploaded_at') FROM chunks"
+                ):
+                    grouped.setdefault(source, []).append(chunk_id)
+                    uploaded[source] = max(uploaded.get(source, 0.0), uploaded_at or 0.0)
+                for source, ids in grouped.items():
+                    self._index_source(source, ids, uploaded[source])
+            return self._source_index
+
+    def _insert_postings(self, docs: List[tuple]):
+        """Ghi term frequency của các chunk (id, content) vào bảng postings và index trong RAM"""
+        rows = []
+        for chunk_id, content in docs:
+            counts = term_counts(content)
+            rows.extend((int(chunk_id), term, tf) for term, tf in counts.items())
+            if self._lexical is not None:
+                self._lexical.add(chunk_id, counts)
+            elif self._lexical_changes is not None:
+                self._lexical_changes.append(("add", chunk_id, counts))
+        self._conn.executemany("INSERT OR REPLACE INTO postings (id, term, tf) VALUES (?, ?, ?)", rows)
+
+    def _start_lexical_load(self) -> Optional[threading.Event]:
+        with self._lock:
+            if self._lexical is not None or self._lexical_loading is not None:
+                return None
+            self._lexical_loading = threading.Event()
+            self._lexical_changes = []
+            return self._lexical_loading
+
+    def _load_lexical(self, loading: threading.Event):
+        """Đọc postings theo từng khoảng id (chỉ giữ lock lúc đọc), dựng BM25 ngoài lock"""
+        index = BM25Index()
+        start = 0
+        try:
+            while True:
+                with self._lock:
+                    last = self._conn.execute("SELECT MAX(id) FROM postings").fetchone()[0]
+                    if last is None or start > last:
+                        # Áp dụng các thay đổi xảy ra trong lúc nạp rồi mới dùng index
+                        for change in self._lexical_changes:
+                            if change[0] == "add":
+                                index.add(change[1], change[2])
+                            else:
+                                index.remove(change[1])
+                        self._lexical = index
+                        return
+                    rows = self._conn.execute(
+                        "SELECT id, term, tf FROM postings WHERE id >= ? AND id < ?",
+                        (start, start + self.LEXICAL_LOAD_BATCH),
+                    ).fetchall()
+                docs: Dict[int, Dict[str, int]] = {}
+                for chunk_id, term, tf in rows:
+                    docs.setdefault(chunk_id, {})[term] = tf
+                for chunk_id, counts in docs.items():
+                    index.add(chunk_id, counts)
+                start += self.LEXICAL_LOAD_BATCH
+        finally:
+            with self._lock:
+                self._lexical_loading = None
+                self._lexical_changes = None
+            loading.set()
+
+    def preload_lexical(self):
+        """Nạp inverted index BM25 ở thread nền để query hybrid đầu tiên không phải chờ"""
+        loading = self._start_lexical_load()
+        if loading is None:
+            return
+
+        def run():
+            try:
+                self._load_lexical(loading)
+            except Exception as e:
+                print(f"❌ Lỗi khi nạp inverted index BM25: {str(e)}")
+
+        threading.Thread(target=run, name="bm25-load", daemon=True).start()
+
+    def lexical_index(self) -> BM25Index:
+        """Inverted index BM25 của toàn bộ chunk (chờ lần nạp nền đang chạy, hoặc tự nạp)"""
+        while True:
+            with self._lock:
+                if self._lexical is not None:
+                    return self._lexical
+                loading = self._lexical_loading
+            if loading is not None:
+                loading.wait()
+                continue
+            loading = self._start_lexical_load()
+            if loading is not None:
+                self._load_lexical(loading)
+
+    def ids_for_sources(self, sources: List[str]) -> List[int]:
+        sources = list(sources)
+        ids = []
+        with self._lock:
+            for start in range(0, len(sources), 500):
+                part = sources[start:start + 500]
+                ids.extend(row[0] for row in self._conn.execute(
+                    f"SELECT id FROM chunks WHERE source IN ({','.join('?' * len(part))})",
+                    part,
+                ))
+        return sorted(ids)
+
+    def remove_ids(self, ids: List[int]):
+        if not ids:
+            return
+        with self._lock:
+            self._ensure_writable()
+            # Giữ bộ đếm trước khi xoá: file cũ chưa có bảng meta vẫn không dùng lại id vừa xoá
+            self._reserve_ids(self.next_id())
+            removed = [(int(i),) for i in set(ids)]
+            if self._source_index is not None:
+                removed_ids = np.asarray(sorted(set(int(i) for i in ids)), dtype=np.int64)
+                for source in list(self._source_index):
+                    info = self._source_index[source]
+                    info["ids"] = np.setdiff1d(info["ids"], removed_ids, assume_unique=True)
+                    if not len(info["ids"]):
+                        del self._source_index[source]
+            self._conn.executemany("DELETE FROM chunks WHERE id = ?", removed)
+            self._conn.executemany("DELETE FROM postings WHERE id = ?", removed)
+            if self._lexical is not None:
+                self._lexical.remove(ids)
+            elif self._lexical_changes is not None:
+                self._lexical_changes.append(("remove", [int(i) for i in ids]))
+            self._conn.commit()
+
+    def sources(self) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT DISTINCT source FROM chunks")]
+
+    def source_counts(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._conn.execute("SELECT source, COUNT(*) FROM chunks GROUP BY source"))
+
+    def copy(self) -> "MetadataStore":
+        """Bản sao trong RAM (dùng làm snapshot để ghi ra file mà không giữ lock)"""
+        store = MetadataStore()
+        with self._lock:
+            self._conn.backup(store._conn)
+        return store
+
+    def save(self, path: str):
+        """Ghi ra file tạm rồi thay thế nguyên tử"""
+        with self._lock:
+            if self._readonly and self.path and os.path.abspath(path) == os.path.abspath(self.path):
+                return
+            # File tạm riêng cho mỗi lần ghi: nhiều process có thể cùng chuyển / lưu một file
+            tmp_path = f"{path}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+            try:
+                target = sqlite3.connect(tmp_path)
+                self._conn.backup(target)
+                target.close()
+                os.replace(tmp_path, path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
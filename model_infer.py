@@ -1,54 +1,202 @@
 import os
-from typing import List, Dict, Any, Tuple
+import time
+from typing import List, Dict, Any, Tuple, Iterator, Optional
 import json
+import numpy as np
 from google import genai
 from google.genai import types
 from process_store_class import CVProcessor, FAISSVectorStore
+from index_holder import IndexHolder
 from prompts import system_prompt, get_answer_prompt
+from answer_cache import AnswerCache
+from candidates import aggregate_candidates, interleave_candidates
+from context_builder import ContextBuilder, estimate_tokens
+from reranker import CrossEncoderReranker, DEFAULT_RERANK_MODEL
+from profiles import ProfileStore, parse_profile_query, format_profile
 
+ANSWER_ERROR_PREFIX = "Lỗi khi sinh câu trả lời"
 
 
 class CVChatBot:
     def __init__(self, 
                  index_path: str = "cv_index.faiss",
-                 metadata_path: str = "cv_metadata.json",
-                 model_name: str = "gemini-2.0-flash-exp"):
+                 metadata_path: str = "cv_metadata.db",
+                 model_name: str = "gemini-2.0-flash-exp",
+                 profile_path: str = "cv_profiles.db"):
         
         self.google_api_key = os.getenv("GOOGLE_API_KEY")
         self.client = genai.Client(api_key=self.google_api_key)
         self.model_name = model_name
         
-        # Khởi tạo processor và vector store
+        # Khởi tạo processor và vector store (qua IndexHolder để có thể hot swap khi rebuild)
         self.cv_processor = CVProcessor()
-        self.vector_store = FAISSVectorStore()
+        self.index_holder = IndexHolder(index_path, metadata_path)
         
         # Load vector store nếu có
-        if not self.vector_store.load(index_path, metadata_path):
+        if not self.index_holder.loaded:
             print("⚠️ Không tìm thấy vector store. Vui lòng chạy script embedding trước.")
+        
+        # Hybrid retrieval: lấy top_k * HYBRID_CANDIDATES từ FAISS và BM25 rồi gộp (HYBRID_SEARCH=0 để tắt)
+        self.hybrid_search = os.getenv("HYBRID_SEARCH", "1") == "1"
+        self.hybrid_candidates = max(1, int(os.getenv("HYBRID_CANDIDATES", "4")))
+        self.rrf_k = int(os.getenv("HYBRID_RRF_K", "60"))
+        
+        # Chế độ theo ứng viên: gom chunk theo CV, chấm điểm ứng viên (max/sum)
+        self.candidate_score = os.getenv("CANDIDATE_SCORE", "max")
+        self.candidate_chunks = max(1, int(os.getenv("CANDIDATE_CHUNKS", "3")))
+        self.candidate_overfetch = max(1, int(os.getenv("CANDIDATE_OVERFETCH", "10")))
+        
+        # Context cho prompt: giới hạn token, bỏ phần overlap giữa các chunk liền nhau và chunk gần trùng
+        self.context_builder = ContextBuilder(
+            max_tokens=int(os.getenv("CONTEXT_MAX_TOKENS", "3000")),
+            overlap_chars=self.cv_processor.chunk_overlap,
+            dedup_threshold=float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.85")),
+        )
+        
+        # Rerank bằng cross-encoder local: lấy top_k * RERANK_FACTOR kết quả rồi chấm lại (RERANK=1 để bật)
+        self.rerank_factor = max(1, int(os.getenv("RERANK_FACTOR", "4")))
+        self.reranker = CrossEncoderReranker(
+            model_name=os.getenv("RERANK_MODEL", DEFAULT_RERANK_MODEL),
+            batch_size=int(os.getenv("RERANK_BATCH_SIZE", "16")),
+            budget_ms=float(os.getenv("RERANK_BUDGET_MS", "300")),
+            cache_size=int(os.getenv("RERANK_CACHE_SIZE", "4096")),
+        ) if os.getenv("RERANK", "0") == "1" else None
+        
+        # Câu hỏi tra cứu ("ai biết Python", "trên 3 năm kinh nghiệm") trả lời thẳng từ bảng hồ sơ
+        # trích xuất lúc ingest, không qua embedding / Gemini (STRUCTURED_ANSWERS=0 để tắt)
+        self.max_profile_results = int(os.getenv("STRUCTURED_MAX_RESULTS", "50"))
+        self.profile_store = ProfileStore(profile_path) if os.getenv("STRUCTURED_ANSWERS", "1") == "1" else None
+        
+        # Cache câu trả lời, tự xoá khi vector store thay đổi (ANSWER_CACHE_MAX_ENTRIES=0 để tắt)
+        max_entries = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+        self.answer_cache = AnswerCache(
+            max_entries=max_entries,
+            ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL", "3600")),
+            similarity_threshold=float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.92")),
+        ) if max_entries > 0 else None
+    
+    @property
+    def vector_store(self) -> FAISSVectorStore:
+        """Vector store đang phục vụ (lấy một lần cho mỗi thao tác)"""
+        return self.index_holder.current
+    
+    def _fuse(self, dense: List[Dict], lexical: List[Dict], top_k: int) -> List[Dict]:
+        """Reciprocal rank fusion: score = Σ 1 / (rrf_k + hạng) qua hai danh sách kết quả"""
+        fused: Dict[int, Dict] = {}
+        for key, results in (("dense_score", dense), ("lexical_score", lexical)):
+            for rank, result in enumerate(results, 1):
+                entry = fused.get(result["id"])
+                if entry is None:
+                    entry = fused[result["id"]] = {**result, "score": 0.0}
+                entry[key] = result["score"]
+                entry["score"] += 1.0 / (self.rrf_k + rank)
+        return sorted(fused.values(), key=lambda r: r["score"], reverse=True)[:top_k]
     
-    def search_relevant_context(self, query: str, top_k: int = 5) -> Tuple[str, List[Dict]]:
-        """Tìm kiếm context liên quan từ vector store"""
+    def _retrieve(self, vector_store: FAISSVectorStore, query: str, query_embedding: np.ndarray,
+                  top_k: int, filters: Optional[Dict[str, Any]]) -> List[Dict]:
+        """Tìm kiếm (vector + BM25, gộp bằng reciprocal rank fusion)"""
+        if self.hybrid_search:
+            fetch_k = top_k * self.hybrid_candidates
+            return self._fuse(vector_store.search(query_embedding, k=fetch_k, filters=filters),
+                              vector_store.search_lexical(query, fetch_k, filters=filters), top_k)
+        return vector_store.search(query_embedding, k=top_k, filters=filters)
+    
+    def _retrieve_reranked(self, vector_store: FAISSVectorStore, query: str, query_embedding: np.ndarray,
+                           top_k: int, filters: Optional[Dict[str, Any]]) -> Tuple[List[Dict], Dict[str, Any]]:
+        """`_retrieve` lấy dư `top_k * rerank_factor` kết quả rồi chấm lại bằng cross-encoder (nếu bật)"""
+        if self.reranker is None:
+            return self._retrieve(vector_store, query, query_embedding, top_k, filters), {}
+        results = self._retrieve(vector_store, query, query_embedding, top_k * self.rerank_factor, filters)
+        return self.reranker.rerank(query, results, top_k)
+    
+    def search_candidates(self, query: str, top_n: int = 5,
+                          query_embedding: Optional[np.ndarray] = None,
+                          filters: Optional[Dict[str, Any]] = None) -> List[Dict]:
+        """Top-N ứng viên (CV) cho query, mỗi ứng viên kèm các chunk tốt nhất.
+
+        Lấy dư `top_n * CANDIDATE_OVERFETCH` chunk; nếu vẫn chưa đủ N CV khác nhau (một vài CV
+        chiếm hết kết quả) thì tăng số chunk lấy về gấp 4 cho tới khi đủ hoặc hết dữ liệu.
+        """
+        if query_embedding is None:
+            query_embedding = self.cv_processor.get_embeddings([query])
+        vector_store = self.vector_store
+        total = vector_store.ntotal
+        fetch_k = top_n * self.candidate_chunks * self.candidate_overfetch
+        while True:
+            results = self._retrieve(vector_store, query, query_embedding, fetch_k, filters)
+            candidates = aggregate_candidates(results, top_n, self.candidate_chunks, self.candidate_score)
+            if len(candidates) >= top_n or len(results) < fetch_k or fetch_k >= total:
+                return candidates
+            fetch_k *= 4
+    
+    def _search_context(self, query: str, top_k: int, query_embedding: Optional[np.ndarray],
+                        filters: Optional[Dict[str, Any]],
+                        group_by_candidate: bool) -> Tuple[str, List[Dict], Dict[str, Any]]:
+        """(context, chunk có trong context, thống kê context + thời gian tìm kiếm)"""
+        start = time.perf_counter()
         try:
             # Tạo embedding cho query
-            query_embedding = self.cv_processor.get_embeddings([query])
-            
-            # Tìm kiếm
-            results = self.vector_store.search(query_embedding, k=top_k)
+            if query_embedding is None:
+                query_embedding = self.cv_processor.get_embeddings([query])
             
-            # Tạo context string
-            context_parts = []
-            for i, result in enumerate(results, 1):
-                content = result['content']
-                score = result['score']
-                
-                context_parts.append(f"(Score: {score:.3f}):\n{content}\n")
+            rerank_stats = {}
+            if group_by_candidate:
+                results = interleave_candidates(
+                    self.search_candidates(query, top_k, query_embedding, filters)
+                )
+            else:
+                results, rerank_stats = self._retrieve_reranked(self.vector_store, query, query_embedding,
+                                                                top_k, filters)
             
-            context = "\n".join(context_parts)
-            return context, results
+            # Tạo context string trong giới hạn token
+            context, used, stats = self.context_builder.build(results)
+            stats.update(rerank_stats)
             
         except Exception as e:
             print(f"Error searching context: {e}")
-            return "", []
+            context, used, stats = "", [], {}
+        stats["retrieval_ms"] = (time.perf_counter() - start) * 1000
+        return context, used, stats
+    
+    def search_relevant_context(self, query: str, top_k: int = 5,
+                                query_embedding: Optional[np.ndarray] = None,
+                                filters: Optional[Dict[str, Any]] = None,
+                                group_by_candidate: bool = False) -> Tuple[str, List[Dict]]:
+        """Tìm kiếm context liên quan từ vector store (chỉ trong các CV thoả `filters` nếu có).
+
+        Trả về context (giới hạn `CONTEXT_MAX_TOKENS`) và các chunk có trong context.
+        Với `group_by_candidate=True`, `top_k` là số ứng viên (CV) và mỗi chunk có thêm
+        `candidate_rank` / `candidate_score`.
+        """
+        context, results, _ = self._search_context(query, top_k, query_embedding, filters, group_by_candidate)
+        return context, results
+    
+    def search_many(self, queries: List[str], top_k: int = 5,
+                    filters: Optional[Dict[str, Any]] = None) -> List[Tuple[str, List[Dict]]]:
+        """Tìm kiếm context cho nhiều query: embed một batch, một lần search FAISS"""
+        if not queries:
+            return []
+        try:
+            query_embeddings = self.cv_processor.get_embeddings(queries)
+            vector_store = self.vector_store
+            k = top_k * self.rerank_factor if self.reranker is not None else top_k
+            if self.hybrid_search:
+                fetch_k = k * self.hybrid_candidates
+                batch_results = [
+                    self._fuse(dense, vector_store.search_lexical(query, fetch_k, filters=filters), k)
+                    for query, dense in zip(queries, vector_store.search_batch(query_embeddings, k=fetch_k,
+                                                                               filters=filters))
+                ]
+            else:
+                batch_results = vector_store.search_batch(query_embeddings, k=k, filters=filters)
+            if self.reranker is not None:
+                batch_results = [self.reranker.rerank(query, results, top_k)[0]
+                                 for query, results in zip(queries, batch_results)]
+            return [self.context_builder.build(results)[:2] for results in batch_results]
+        
+        except Exception as e:
+            print(f"Error searching context: {e}")
+            return [("", []) for _ in queries]
     
     def generate_answer(self, query: str, context: str) -> str:
         """Sinh câu trả lời từ Gemini"""
@@ -83,9 +231,177 @@ class CVChatBot:
             return response.text
             
         except Exception as e:
-            return f"Lỗi khi sinh câu trả lời: {str(e)}"
+            return f"{ANSWER_ERROR_PREFIX}: {str(e)}"
+    
+    def generate_answer_stream(self, query: str, context: str) -> Iterator[str]:
+        """Sinh câu trả lời từ Gemini theo kiểu streaming, yield từng đoạn text"""
+        try:
+            prompt = get_answer_prompt(query, context)
+            stream = self.client.models.generate_content_stream(
+                model=self.model_name,
+                contents=f"{system_prompt}\n\n{prompt}",
+                config=types.GenerateContentConfig(
+                    temperature=0.3,
+                    max_output_tokens=2048,
+                )
+            )
+            for chunk in stream:
+                if chunk.text:
+                    yield chunk.text
+            
+        except Exception as e:
+            yield f"{ANSWER_ERROR_PREFIX}: {str(e)}"
+    
+    @staticmethod
+    def _prompt_stats(query: str, context: str, stats: Dict[str, Any]) -> Dict[str, Any]:
+        """Thêm kích thước prompt gửi tới Gemini vào thống kê của request"""
+        prompt = f"{system_prompt}\n\n{get_answer_prompt(query, context)}"
+        stats["prompt_chars"] = len(prompt)
+        stats["prompt_tokens"] = estimate_tokens(prompt)
+        return stats
+    
+    @staticmethod
+    def _log_stats(stats: Dict[str, Any]):
+        print(f"📏 Prompt ~{stats.get('prompt_tokens', 0)} tokens ({stats.get('prompt_chars', 0)} ký tự), "
+              f"context {stats.get('chunks_used', 0)}/{stats.get('chunks_retrieved', 0)} chunk | "
+              f"tìm kiếm {stats.get('retrieval_ms', 0):.0f} ms, sinh câu trả lời {stats.get('generation_ms', 0):.0f} ms"
+              + (f", rerank {stats['rerank_ms']:.0f} ms{' (giữ thứ tự FAISS)' if stats['rerank_fallback'] else ''}"
+                 if "rerank_ms" in stats else ""))
+    
+    def _answer_from_profiles(self, query: str,
+                              filters: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """Trả lời câu hỏi tra cứu bằng bảng hồ sơ; None nếu không phải câu tra cứu hoặc không có kết quả
+        (khi đó dùng luồng RAG như bình thường)"""
+        if self.profile_store is None:
+            return None
+        parsed = parse_profile_query(query)
+        if parsed is None:
+            return None
+        start = time.perf_counter()
+        profiles = self.profile_store.find(parsed["terms"], parsed["min_years"], filters)
+        lookup_ms = (time.perf_counter() - start) * 1000
+        if not profiles:
+            return None
+        
+        criteria = [name for _, name in parsed["terms"]]
+        if parsed["min_years"] is not None:
+            criteria.append(f">= {parsed['min_years']:g} năm kinh nghiệm")
+        shown = profiles[:self.max_profile_results]
+        lines = [f"Tìm thấy {len(profiles)} ứng viên phù hợp ({', '.join(criteria)}):"]
+        lines += [f"- {format_profile(profile)}" for profile in shown]
+        if len(profiles) > len(shown):
+            lines.append(f"... và {len(profiles) - len(shown)} ứng viên khác")
+        answer = "\n".join(lines)
+        sources = [{"content": format_profile(profile),
+                    "metadata": {"source": profile["source"], "chunk_id": "profile"},
+                    "score": 1.0} for profile in shown]
+        print(f"🗂️ Tra cứu hồ sơ: {len(profiles)} ứng viên trong {lookup_ms:.1f} ms (không qua Gemini)")
+        return {
+            "answer": answer,
+            "context": "",
+            "sources": sources,
+            "stats": {"structured": True, "lookup_ms": lookup_ms, "candidates": len(profiles)},
+        }
+    
+    def chat_stream(self, query: str, top_k: int = 5,
+                    filters: Optional[Dict[str, Any]] = None,
+                    group_by_candidate: bool = False) -> Iterator[Dict[str, Any]]:
+        """Chat dạng streaming.
+
+        Yield lần lượt các event: {"type": "sources", "context", "sources"} ngay sau khi tìm kiếm xong,
+        {"type": "token", "text"} cho từng đoạn câu trả lời, cuối cùng {"type": "done", "answer", "stats"}.
+        """
+        if not query.strip():
+            yield {"type": "sources", "context": "", "sources": []}
+            yield {"type": "token", "text": "Vui lòng nhập câu hỏi."}
+            yield {"type": "done", "answer": "Vui lòng nhập câu hỏi."}
+            return
+        
+        structured = self._answer_from_profiles(query, filters)
+        if structured is not None:
+            yield {"type": "sources", "context": structured["context"], "sources": structured["sources"]}
+            yield {"type": "token", "text": structured["answer"]}
+            yield {"type": "done", "answer": structured["answer"], "stats": structured["stats"]}
+            return
+        
+        scope = self._cache_scope(filters, group_by_candidate)
+        index_version = self.index_holder.version
+        cached, query_embedding = self._lookup_cached_answer(query, top_k, scope, index_version)
+        if cached is not None:
+            yield {"type": "sources", "context": cached["context"], "sources": cached["sources"]}
+            yield {"type": "token", "text": cached["answer"]}
+            yield {"type": "done", "answer": cached["answer"], "stats": {**cached.get("stats", {}), "cached": True}}
+            return
+        
+        # Tìm kiếm context
+        context, sources, stats = self._search_context(query, top_k, query_embedding, filters,
+                                                        group_by_candidate)
+        yield {"type": "sources", "context": context, "sources": sources}
+        
+        if not context:
+            answer = "Không tìm thấy thông tin liên quan trong các CV."
+            yield {"type": "token", "text": answer}
+        else:
+            self._prompt_stats(query, context, stats)
+            start = time.perf_counter()
+            parts = []
+            for text in self.generate_answer_stream(query, context):
+                if not parts:
+                    stats["first_token_ms"] = (time.perf_counter() - start) * 1000
+                parts.append(text)
+                yield {"type": "token", "text": text}
+            answer = "".join(parts)
+            stats["generation_ms"] = (time.perf_counter() - start) * 1000
+            self._log_stats(stats)
+            self._cache_answer(query, top_k, query_embedding,
+                               {"answer": answer, "context": context, "sources": sources, "stats": stats},
+                               scope, index_version)
+        
+        yield {"type": "done", "answer": answer, "stats": stats}
+    
+    def _embed_query(self, query: str) -> Optional[np.ndarray]:
+        try:
+            return self.cv_processor.get_embeddings([query])
+        except Exception as e:
+            print(f"Error generating embedding: {e}")
+            return None
+    
+    @staticmethod
+    def _cache_scope(filters: Optional[Dict[str, Any]], group_by_candidate: bool = False) -> str:
+        """Khoá cache cho bộ lọc / chế độ tìm kiếm: câu trả lời trên một tập CV không dùng lại cho tập khác"""
+        scope = {key: value for key, value in (filters or {}).items() if value is not None}
+        if group_by_candidate:
+            scope["group_by_candidate"] = True
+        return json.dumps(scope, sort_keys=True, ensure_ascii=False) if scope else ""
+    
+    def _get_cached_answer(self, query: str, top_k: int, query_embedding: Optional[np.ndarray],
+                           scope: str, index_version: Any,
+                           exact_only: bool = False) -> Optional[Dict[str, Any]]:
+        if self.answer_cache is None:
+            return None
+        return self.answer_cache.get(query, top_k, index_version, query_embedding, scope,
+                                     exact_only=exact_only)
+    
+    def _lookup_cached_answer(self, query: str, top_k: int, scope: str,
+                              index_version: Any) -> Tuple[Optional[Dict[str, Any]], Optional[np.ndarray]]:
+        """(câu trả lời đã cache, embedding câu hỏi): tra câu hỏi chuẩn hoá trước, chỉ embed khi không trúng"""
+        cached = self._get_cached_answer(query, top_k, None, scope, index_version, exact_only=True)
+        if cached is not None:
+            return cached, None
+        query_embedding = self._embed_query(query)
+        return self._get_cached_answer(query, top_k, query_embedding, scope, index_version), query_embedding
+    
+    def _cache_answer(self, query: str, top_k: int, query_embedding: Optional[np.ndarray],
+                      result: Dict[str, Any], scope: str, index_version: Any):
+        """Lưu câu trả lời dưới phiên bản index lấy *trước* khi tìm kiếm: nếu index đổi trong lúc
+        sinh câu trả lời, cache bỏ qua câu trả lời cũ thay vì gắn nó với phiên bản mới"""
+        if self.answer_cache is None or ANSWER_ERROR_PREFIX in result["answer"]:
+            return
+        self.answer_cache.put(query, top_k, index_version, result, query_embedding, scope)
     
-    def chat(self, query: str, top_k: int = 5) -> Dict[str, Any]:
+    def chat(self, query: str, top_k: int = 5,
+             filters: Optional[Dict[str, Any]] = None,
+             group_by_candidate: bool = False) -> Dict[str, Any]:
         """Main chat function"""
         if not query.strip():
             return {
@@ -94,36 +410,64 @@ class CVChatBot:
                 "sources": []
             }
         
+        structured = self._answer_from_profiles(query, filters)
+        if structured is not None:
+            return structured
+        
+        # Câu hỏi giống (hoặc gần giống) đã được trả lời trên cùng phiên bản index
+        scope = self._cache_scope(filters, group_by_candidate)
+        index_version = self.index_holder.version
+        cached, query_embedding = self._lookup_cached_answer(query, top_k, scope, index_version)
+        if cached is not None:
+            return {**cached, "stats": {**cached.get("stats", {}), "cached": True}}
+        
         # Tìm kiếm context
-        context, sources = self.search_relevant_context(query, top_k)
+        context, sources, stats = self._search_context(query, top_k, query_embedding, filters,
+                                                        group_by_candidate)
         
         if not context:
             return {
                 "answer": "Không tìm thấy thông tin liên quan trong các CV.",
                 "context": "",
-                "sources": []
+                "sources": [],
+                "stats": stats
             }
         
         # Sinh câu trả lời
+        self._prompt_stats(query, context, stats)
+        start = time.perf_counter()
         answer = self.generate_answer(query, context)
+        stats["generation_ms"] = (time.perf_counter() - start) * 1000
+        self._log_stats(stats)
         
-        return {
+        result = {
             "answer": answer,
             "context": context,
-            "sources": sources
+            "sources": sources,
+            "stats": stats
+        }
+        self._cache_answer(query, top_k, query_embedding, result, scope, index_version)
+        return result
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """Thống kê hit rate của cache câu trả lời và cache embedding"""
+        embedding_cache = self.cv_processor.embedding_cache
+        return {
+            "answer_cache": self.answer_cache.stats() if self.answer_cache is not None else None,
+            "embedding_cache": embedding_cache.stats() if embedding_cache is not None else None,
+            "rerank_cache": self.reranker.stats() if self.reranker is not None else None,
         }
     
     def get_cv_summary(self) -> Dict[str, Any]:
         """Lấy thông tin tổng quan về các CV"""
-        if not self.vector_store.metadata:
-            return {"total_cvs": 0, "cv_files": []}
+        metadata = self.vector_store.metadata
+        if not metadata:
+            return {"total_cvs": 0, "cv_files": [], "total_chunks": 0}
         
-        cv_files = set()
-        for meta in self.vector_store.metadata:
-            cv_files.add(meta['metadata']['source'])
+        cv_files = metadata.sources()
         
         return {
             "total_cvs": len(cv_files),
             "cv_files": list(cv_files),
-            "total_chunks": len(self.vector_store.metadata)
+            "total_chunks": len(metadata)
         }
\ No newline at end of file
@@ -0,0 +1,101 @@
+import re
+import unicodedata
+from typing import List, Tuple
+
+from PyPDF2 import PdfReader
+
+# Tiêu đề mục thường gặp trong CV IT (tiếng Anh và tiếng Việt), so khớp sau khi lower()
+SECTION_HEADINGS = {
+    "summary", "profile", "about me", "objective", "career objective", "career goal",
+    "education", "work experience", "experience", "professional experience", "employment",
+    "skills", "technical skills", "soft skills", "projects", "personal projects",
+    "certificates", "certifications", "awards", "achievements", "activities",
+    "languages", "interests", "hobbies", "references", "contact", "publications",
+    "mục tiêu", "mục tiêu nghề nghiệp", "giới thiệu", "thông tin cá nhân", "học vấn",
+    "trình độ học vấn", "kinh nghiệm", "kinh nghiệm làm việc", "kỹ năng", "kĩ năng",
+    "dự án", "chứng chỉ", "giải thưởng", "hoạt động", "ngoại ngữ", "sở thích", "liên hệ",
+}
+
+BULLET_PATTERN = re.compile(r"^\s*[•●▪◦■►▶‣∙·\-\*–]\s*")
+
+
+class LocalPDFParser:
+    """Chuyển PDF có text layer thành markdown theo mục, không cần gọi LLM.
+
+    `parse()` trả về cả điểm chất lượng (0..1) để quyết định có cần fallback sang LLM hay không.
+    """
+
+    def __init__(self, min_chars_per_page: int = 300):
+        self.min_chars_per_page = min_chars_per_page
+
+    def extract_pages(self, filepath: str) -> List[str]:
+        reader = PdfReader(filepath)
+        return [page.extract_text() or "" for page in reader.pages]
+
+    @staticmethod
+    def _is_heading(line: str) -> bool:
+        name = line.strip().rstrip(":").strip()
+        if not name or len(name) > 40:
+            return False
+        if name.lower() in SECTION_HEADINGS:
+            return True
+        letters = [c for c in name if c.isalpha()]
+        return len(letters) >= 4 and name.isupper() and not name.endswith((".", ","))
+
+    def to_markdown(self, pages: List[str]) -> str:
+        """Gắn heading cho các mục, chuẩn hoá bullet; dòng đầu tiên (thường là họ tên) thành tiêu đề"""
+        lines = []
+        title_done = False
+        for page in pages:
+            for raw in page.splitlines():
+                line = re.sub(r"[ \t]+", " ", raw).strip()
+                if not line:
+                    continue
+                if not title_done:
+                    title_done = True
+                    if len(line) <= 60 and not self._is_heading(line):
+                        lines.append(f"# {line}")
+                        continue
+                if self._is_heading(line):
+                    lines.extend(["", f"## {line.rstrip(':').strip()}"])
+                elif BULLET_PATTERN.match(line):
+                    lines.append(f"- {BULLET_PATTERN.sub('', line)}")
+                else:
+                    lines.append(line)
+        return "\n".join(lines).strip()
+
+    def quality(self, text: str, page_count: int) -> float:
+        """Ước lượng chất lượng trích xuất (0..1).
+
+        Phạt các trường hợp thường gặp của PDF scan hoặc font lỗi: quá ít chữ mỗi trang,
+        ký tự rác (U+FFFD, "(cid:..)", ký tự điều khiển), từ bị dính liền và chữ bị tách từng dòng.
+        """
+        if not text.strip() or page_count == 0:
+            return 0.0
+
+        visible = [c for c in text if not c.isspace()]
+        density = min(1.0, len(visible) / (page_count * self.min_chars_per_page))
+
+        garbage = text.count("�") + 5 * text.count("(cid:") + sum(
+            1 for c in visible if unicodedata.category(c) in ("Cc", "Co", "Cn")
+        )
+        clean = max(0.0, 1.0 - 10 * garbage / max(1, len(visible)))
+
+        words = text.split()
+        long_words = sum(1 for w in words if len(w) > 30 and "/" not in w and "@" not in w)
+        wording = max(0.0, 1.0 - 5 * long_words / max(1, len(words)))
+
+        lines = [line.strip() for line in text.splitlines() if line.strip()]
+        short_lines = sum(1 for line in lines if len(line) <= 2)
+        layout = max(0.0, 1.0 - 2 * short_lines / max(1, len(lines)))
+
+        sections = sum(1 for line in lines if line.startswith("## "))
+        structure = 1.0 if sections >= 2 else 0.8
+
+        return density * clean * wording * layout * structure
+
+    def parse(self, filepath: str) -> Tuple[str, float]:
+        """Trả về (markdown, điểm chất lượng)"""
+        pages = self.extract_pages(filepath)
+        markdown = self.to_markdown(pages)
+        return markdown, self.quality(markdown, len(pages))
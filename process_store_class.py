@@ -1,7 +1,11 @@
 import os
 import pathlib
-import json
-from typing import List, Dict, Any
+import time
+import hashlib
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional
 import numpy as np
 
 from dotenv import load_dotenv
@@ -15,51 +19,165 @@ from google.genai import types
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.schema import Document
 from prompts import parser_prompt
+from parser import LocalPDFParser
+from embedding_cache import EmbeddingCache, default_embedding_cache
+from metadata_store import MetadataStore
+from delta_log import DeltaLog
 
 load_dotenv()
 
+QUANTIZATION_MODES = ("none", "sq8", "fp16", "binary")
+
+
+class BatchEmbedder:
+    """Sinh embedding theo batch qua Ollama với số request song song có giới hạn"""
+
+    def __init__(self,
+                 model: str = "mxbai-embed-large",
+                 dimension: int = 1024,
+                 batch_size: int = 32,
+                 max_workers: int = 4,
+                 max_retries: int = 3,
+                 retry_backoff: float = 0.5,
+                 host: Optional[str] = None):
+        self.model = model
+        self.dimension = dimension
+        self.batch_size = max(1, batch_size)
+        self.max_workers = max(1, max_workers)
+        self.max_retries = max(1, max_retries)
+        self.retry_backoff = retry_backoff
+        self.client = ollama.Client(host=host)
+
+    def _embed_batch(self, batch: List[str]) -> List[List[float]]:
+        """Gọi /api/embed cho một batch, thử lại với backoff nếu lỗi"""
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                response = self.client.embed(model=self.model, input=batch)
+                embeddings = response['embeddings']
+                if len(embeddings) != len(batch):
+                    raise ValueError(f"expected {len(batch)} embeddings, got {len(embeddings)}")
+                return embeddings
+            except Exception as e:
+                if attempt == self.max_retries:
+                    print(f"Error generating embedding: {e}")
+                    return [[0.0] * self.dimension for _ in batch]
+                time.sleep(self.retry_backoff * (2 ** (attempt - 1)))
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Embedding cho danh sách text, giữ nguyên thứ tự đầu vào"""
+        if not texts:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if len(batches) == 1:
+            results = [self._embed_batch(batches[0])]
+        else:
+            # executor.map trả kết quả theo thứ tự batch, tối đa max_workers request cùng lúc
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(batches))) as executor:
+                results = list(executor.map(self._embed_batch, batches))
+
+        embeddings = [vector for batch_result in results for vector in batch_result]
+        return np.array(embeddings, dtype=np.float32)
+
+
 class CVProcessor:
-    def __init__(self, embedding_model: str = "mxbai-embed-large"):
+    def __init__(self,
+                 embedding_model: str = "mxbai-embed-large",
+                 embed_batch_size: Optional[int] = None,
+                 embed_max_workers: Optional[int] = None,
+                 embedding_cache: Optional[EmbeddingCache] = None,
+                 parse_cache_dir: Optional[str] = None,
+                 local_parse_min_quality: Optional[float] = None):
         self.google_api_key = os.getenv("GOOGLE_API_KEY")
         self.embedding_model = embedding_model
-        self.embedding_dim = 1024
+        self.parser_model = "gemini-2.0-flash-exp"
+        self.parse_cache_dir = (parse_cache_dir if parse_cache_dir is not None
+                                else os.getenv("PARSE_CACHE_DIR", "parse_cache"))
+        # Ngưỡng chất lượng để dùng kết quả trích xuất local thay vì gọi Gemini (> 1 để tắt)
+        self.local_parser = LocalPDFParser()
+        self.local_parse_min_quality = (local_parse_min_quality if local_parse_min_quality is not None
+                                        else float(os.getenv("LOCAL_PARSE_MIN_QUALITY", "0.6")))
+        self.embedding_dim = int(os.getenv("EMBED_DIM", "1024"))
         self.client = genai.Client(api_key=self.google_api_key)
+        self.embedder = BatchEmbedder(
+            model=embedding_model,
+            dimension=self.embedding_dim,
+            batch_size=embed_batch_size or int(os.getenv("EMBED_BATCH_SIZE", "32")),
+            max_workers=embed_max_workers or int(os.getenv("EMBED_MAX_WORKERS", "4")),
+        )
+        self.embedding_cache = embedding_cache or default_embedding_cache()
+        self.chunk_size = 1000
+        self.chunk_overlap = 100
         self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=100,
+            chunk_size=self.chunk_size,
+            chunk_overlap=self.chunk_overlap,
             length_function=len,
             separators=["\n\n", "\n", ". ", " ", ""]
         )
 
+    def _parse_cache_path(self, pdf_bytes: bytes) -> Optional[pathlib.Path]:
+        if not self.parse_cache_dir:
+            return None
+        return pathlib.Path(self.parse_cache_dir) / f"{hashlib.sha256(pdf_bytes).hexdigest()}.md"
+
+    def parse_local(self, filepath: str) -> str:
+        """Trích xuất markdown từ text layer của PDF, trả về "" nếu chất lượng dưới ngưỡng"""
+        if self.local_parse_min_quality > 1:
+            return ""
+        try:
+            text, quality = self.local_parser.parse(filepath)
+        except Exception as e:
+            print(f"Error extracting PDF text: {e}")
+            return ""
+        return text if quality >= self.local_parse_min_quality else ""
+
     def parse_cv_to_markdown(self, filepath: str) -> str:
-        """Chuyển CV PDF thành markdown bằng Gemini"""
+        """Chuyển CV PDF thành markdown: trích xuất local nếu đủ tốt, ngược lại dùng Gemini.
+
+        Kết quả được cache theo hash nội dung PDF.
+        """
         try:
-            file_path = pathlib.Path(filepath)
-            response = self.client.models.generate_content(
-                model="gemini-2.0-flash-exp",
-                contents=[
-                    types.Part.from_bytes(
-                        data=file_path.read_bytes(),
-                        mime_type='application/pdf',
-                    ),
-                    parser_prompt
-                ],
-            )
-            return response.text
+            pdf_bytes = pathlib.Path(filepath).read_bytes()
+            cache_path = self._parse_cache_path(pdf_bytes)
+            if cache_path is not None and cache_path.exists():
+                return cache_path.read_text(encoding="utf-8")
+
+            text = self.parse_local(filepath)
+            if not text:
+                response = self.client.models.generate_content(
+                    model=self.parser_model,
+                    contents=[
+                        types.Part.from_bytes(
+                            data=pdf_bytes,
+                            mime_type='application/pdf',
+                        ),
+                        parser_prompt
+                    ],
+                )
+                text = response.text or ""
+
+            if cache_path is not None and text.strip():
+                cache_path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = cache_path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+                tmp_path.write_text(text, encoding="utf-8")
+                os.replace(tmp_path, cache_path)
+            return text
         except Exception as e:
             print(f"Error parsing CV: {e}")
             return ""
 
-    def chunk_text(self, text: str, source: str) -> List[Document]:
-        """Chia text thành nhiều đoạn nhỏ (chunk)"""
+    def chunk_text(self, text: str, source: str, uploaded_at: Optional[float] = None) -> List[Document]:
+        """Chia text thành nhiều đoạn nhỏ (chunk); `uploaded_at` (unix time) dùng để lọc khi search"""
         chunks = self.text_splitter.split_text(text)
+        uploaded_at = uploaded_at if uploaded_at is not None else time.time()
         documents = [
             Document(
                 page_content=chunk,
                 metadata={
                     "source": source,
                     "chunk_id": i,
-                    "chunk_size": len(chunk)
+                    "chunk_size": len(chunk),
+                    "uploaded_at": uploaded_at
                 }
             )
             for i, chunk in enumerate(chunks)
@@ -67,64 +185,968 @@ class CVProcessor:
         return documents
 
     def get_embeddings(self, texts: List[str]) -> np.ndarray:
-        """Sinh embedding từ văn bản bằng Ollama"""
-        embeddings = []
-        for text in texts:
-            try:
-                response = ollama.embed(
-                    model=self.embedding_model,
-                    input=text
-                )
-                embeddings.append(response['embeddings'][0])
-            except Exception as e:
-                print(f"Error generating embedding: {e}")
-                embeddings.append([0.0] * self.embedding_dim)
-        return np.array(embeddings, dtype=np.float32)
+        """Sinh embedding từ văn bản bằng Ollama (theo batch, song song), có cache"""
+        if self.embedding_cache is None:
+            return self.embedder.embed(texts)
 
+        # Tag cache gồm cả số chiều: đổi EMBED_DIM không trả về vector cũ sai kích thước
+        cache_model = f"{self.embedding_model}@{self.embedding_dim}"
+        cached = self.embedding_cache.get_many(cache_model, texts)
+        embeddings = np.zeros((len(texts), self.embedding_dim), dtype=np.float32)
+        for i, vector in cached.items():
+            embeddings[i] = vector
 
-class FAISSVectorStore:
-    def __init__(self, dimension: int = 1024):
+        missing = [i for i in range(len(texts)) if i not in cached]
+        if missing:
+            fresh = self.embedder.embed([texts[i] for i in missing])
+            embeddings[missing] = fresh
+            # Không cache vector 0 (embedding lỗi) để lần sau gọi lại
+            ok = [j for j in range(len(missing)) if np.any(fresh[j])]
+            self.embedding_cache.put_many(
+                cache_model,
+                [texts[missing[j]] for j in ok],
+                fresh[ok],
+            )
+        return embeddings
+
+
+def _top_k(scores: np.ndarray, ids: np.ndarray, k: int):
+    """Top-k theo từng hàng của ma trận điểm, cùng định dạng (distances, labels) với FAISS"""
+    k_found = min(k, scores.shape[1])
+    distances = np.full((len(scores), k), -np.inf, dtype=np.float32)
+    labels = np.full((len(scores), k), -1, dtype=np.int64)
+    if k_found == 0:
+        return distances, labels
+    top = np.argpartition(-scores, k_found - 1, axis=1)[:, :k_found]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    distances[:, :k_found] = np.take_along_axis(top_scores, order, axis=1)
+    labels[:, :k_found] = ids[np.take_along_axis(top, order, axis=1)]
+    return distances, labels
+
+
+class MmapFlatIndex:
+    """Index Flat (inner product) đọc trực tiếp từ file .npy qua memory map.
+
+    Chỉ dùng để tìm kiếm: nhiều process cùng đọc một file sẽ dùng chung page cache.
+    `ids` là id FAISS của từng dòng (file `.ids.npy`; không có thì là 0..n-1 như index cũ).
+    `to_faiss()` chép dữ liệu vào RAM khi cần thêm/xoá vector.
+    """
+
+    def __init__(self, vectors_path: str, ids_path: Optional[str] = None):
+        self.vectors = np.load(vectors_path, mmap_mode="r")
+        self.ntotal, self.d = self.vectors.shape
+        if ids_path and os.path.exists(ids_path):
+            self.ids = np.load(ids_path)
+        else:
+            self.ids = np.arange(self.ntotal, dtype=np.int64)
+        self.is_trained = True
+
+    def search(self, queries: np.ndarray, k: int, allowed_ids: Optional[np.ndarray] = None):
+        if allowed_ids is None:
+            return _top_k(queries @ self.vectors.T, self.ids, k)
+        mask = np.isin(self.ids, allowed_ids)
+        return _top_k(queries @ self.vectors[mask].T, self.ids[mask], k)
+
+    def to_faiss(self) -> faiss.Index:
+        index = faiss.IndexIDMap2(faiss.IndexFlatIP(self.d))
+        index.add_with_ids(np.ascontiguousarray(self.vectors, dtype=np.float32), self.ids)
+        return index
+
+
+class RerankVectors:
+    """Vector float32 đầy đủ của index nhị phân / rút gọn chiều, dùng để chấm lại shortlist.
+
+    Phần đã có trong snapshot được đọc qua memory map từ `<index_path>.vectors.npy` / `.ids.npy`
+    (chỉ các dòng được rerank nằm trong page cache); vector thêm sau snapshot giữ trong RAM
+    cho tới lần snapshot tiếp theo.
+    """
+
+    def __init__(self, dimension: int):
         self.dimension = dimension
-        self.index = faiss.IndexFlatIP(dimension)
-        self.metadata: List[Dict[str, Any]] = []
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._rows = np.zeros(0, dtype=np.int64)
+        self._vectors: Optional[np.ndarray] = None
+        self._extra: Dict[int, np.ndarray] = {}
 
-    def add_documents(self, documents: List[Document], embeddings: np.ndarray):
-        """Thêm document và embedding vào FAISS"""
+    def attach(self, index_path: str, written: Optional[Dict[int, np.ndarray]] = None):
+        """Dùng file .npy vừa ghi; bỏ khỏi RAM các vector đã nằm trong file (`written`, None = tất cả)"""
+        ids = np.load(f"{index_path}.ids.npy")
+        order = np.argsort(ids, kind="stable")
+        self._ids, self._rows = ids[order], order
+        self._vectors = np.load(f"{index_path}.vectors.npy", mmap_mode="r")
+        if written is None:
+            self._extra = {}
+        else:
+            for chunk_id, vector in written.items():
+                if self._extra.get(chunk_id) is vector:
+                    del self._extra[chunk_id]
+
+    def pending(self) -> Dict[int, np.ndarray]:
+        return dict(self._extra)
+
+    def memory_bytes(self) -> int:
+        return len(self._extra) * self.dimension * 4
+
+    def add(self, ids: np.ndarray, vectors: np.ndarray):
+        for chunk_id, vector in zip(ids, vectors):
+            self._extra[int(chunk_id)] = np.array(vector, dtype=np.float32)
+
+    def remove(self, ids: np.ndarray):
+        for chunk_id in ids:
+            self._extra.pop(int(chunk_id), None)
+
+    def get(self, ids: np.ndarray) -> np.ndarray:
+        ids = np.asarray(ids, dtype=np.int64)
+        out = np.empty((len(ids), self.dimension), dtype=np.float32)
+        in_extra = np.fromiter((int(i) in self._extra for i in ids), dtype=bool, count=len(ids))
+        for i in np.flatnonzero(in_extra):
+            out[i] = self._extra[int(ids[i])]
+        rest = np.flatnonzero(~in_extra)
+        if len(rest):
+            positions = np.searchsorted(self._ids, ids[rest])
+            if self._vectors is None or np.any(positions >= len(self._ids)) \
+                    or np.any(self._ids[positions] != ids[rest]):
+                raise KeyError("Thiếu vector đầy đủ để rerank")
+            rows = self._rows[positions]
+            order = np.argsort(rows)
+            out[rest[order]] = self._vectors[rows[order]]
+        return out
+
+
+class FAISSVectorStore:
+    """Vector store trên FAISS (inner product trên vector đã chuẩn hoá L2).
+
+    `index_factory` là chuỗi index_factory của FAISS, ví dụ "Flat", "HNSW32",
+    "IVF1024,Flat", "IVF1024,PQ64". Index cần train được giữ dạng Flat cho tới khi
+    đủ `min_train_size` vector, sau đó tự train và chuyển sang (kể cả khi load index Flat cũ).
+
+    Mỗi vector có id cố định (trùng với id trong MetadataStore): index IVF dùng id trực tiếp,
+    các loại khác được bọc trong `IndexIDMap2`. Nhờ vậy `remove_source`/`upsert_source`
+    chỉ đụng tới các chunk của file đó. HNSW không hỗ trợ xoá: id bị xoá được đánh dấu (tombstone)
+    và loại ra lúc search bằng `IDSelector`; đồ thị chỉ được dựng lại khi ghi snapshot (ngoài lock)
+    hoặc khi số tombstone vượt `TOMBSTONE_PURGE_RATIO` số vector còn lại.
+
+    `quantization` chọn cách lưu vector trong RAM: "none" (float32), "sq8" (int8, 1/4 bộ nhớ),
+    "fp16" (1/2 bộ nhớ) áp dụng cho phần lưu vector của `index_factory` (Flat, HNSW, IVF..,Flat);
+    "binary" lưu 1 bit mỗi chiều (1/32 bộ nhớ) và quét Hamming toàn bộ, sau đó chấm lại
+    `k * rerank_factor` ứng viên bằng vector float32 đọc qua memory map từ snapshot (RerankVectors).
+
+    Với `coarse_dim` (Matryoshka, vd. 256 hoặc 512 < `dimension`), index chỉ chứa `coarse_dim` chiều
+    đầu của mỗi vector (chuẩn hoá lại) để lọc ứng viên, rồi `k * rerank_factor` ứng viên được chấm lại
+    bằng vector đầy đủ chiều (RerankVectors) như với "binary"; hai chế độ có thể dùng cùng nhau.
+
+    Với `mmap=True`, `load()` không chép index vào RAM: index IVF dùng `IO_FLAG_MMAP`
+    của FAISS, index Flat đọc file `<index_path>.vectors.npy` (được ghi kèm khi `save()`;
+    index cũ chưa có file này được chuyển ở lần `save()`/`commit()` tiếp theo, không phải lúc load).
+    Tương tự, index được chuyển đổi lúc load (index cũ chưa có id, đổi sang loại index đã cấu hình)
+    được ghi lại ở lần `commit()` tiếp theo để không phải chuyển đổi lại ở mỗi lần load.
+    Lần thêm/xoá đầu tiên sẽ chép index vào RAM.
+
+    `filters` của `search` ({"sources", "uploaded_after", "uploaded_before"}) được đổi thành
+    tập id từ bảng source -> ids dựng sẵn trong MetadataStore rồi truyền vào FAISS qua
+    `IDSelector`, nên việc lọc diễn ra ngay trong lúc quét index. Tập id nhỏ
+    (<= `filter_exact_max`) được chấm điểm trực tiếp trên các vector của nó, vừa nhanh hơn
+    vừa không bị IVF/HNSW bỏ sót khi các chunk hợp lệ nằm rải rác.
+
+    Các thao tác đọc/ghi được khoá bằng RLock nên có thể gọi từ nhiều thread (ví dụ worker pool của API).
+    """
+
+    TOMBSTONE_PURGE_RATIO = 0.5
+
+    def __init__(self,
+                 dimension: Optional[int] = None,
+                 index_factory: Optional[str] = None,
+                 nprobe: Optional[int] = None,
+                 ef_search: Optional[int] = None,
+                 min_train_size: Optional[int] = None,
+                 mmap: Optional[bool] = None,
+                 wal: Optional[bool] = None,
+                 quantization: Optional[str] = None,
+                 rerank_factor: Optional[int] = None,
+                 coarse_dim: Optional[int] = None,
+                 lexical_preload: Optional[bool] = None):
+        self.dimension = dimension or int(os.getenv("EMBED_DIM", "1024"))
+        coarse_dim = coarse_dim if coarse_dim is not None else int(os.getenv("FAISS_COARSE_DIM", "0"))
+        self.coarse_dim = coarse_dim if 0 < coarse_dim < self.dimension else None
+        self.index_factory = index_factory or os.getenv("FAISS_INDEX_FACTORY", "Flat")
+        self.quantization = (quantization or os.getenv("FAISS_QUANTIZATION", "none")).lower()
+        if self.quantization not in QUANTIZATION_MODES:
+            raise ValueError(f"quantization phải là một trong {QUANTIZATION_MODES}")
+        self.rerank_factor = rerank_factor or int(os.getenv("FAISS_RERANK_FACTOR", "10"))
+        self._rerank = RerankVectors(self.dimension) if self.coarse_dim else None
+        if self.quantization in ("sq8", "fp16") and self._factory() == self.index_factory:
+            print(f"⚠️ Bỏ qua quantization={self.quantization} cho index {self.index_factory} (đã nén sẵn)")
+        self.nprobe = nprobe or int(os.getenv("FAISS_NPROBE", "16"))
+        self.ef_search = ef_search or int(os.getenv("FAISS_EF_SEARCH", "64"))
+        self.min_train_size = min_train_size
+        self.mmap = mmap if mmap is not None else os.getenv("FAISS_MMAP", "0") == "1"
+        self.filter_exact_max = int(os.getenv("FAISS_FILTER_EXACT_MAX", "4096"))
+        # Nạp inverted index BM25 ở thread nền ngay khi load (chỉ cần khi bật hybrid search)
+        self.lexical_preload = lexical_preload if lexical_preload is not None \
+            else os.getenv("HYBRID_SEARCH", "1") == "1"
+        self._index_mmapped = False
+        self._lock = threading.RLock()
+        # Tăng mỗi khi nội dung index thay đổi (dùng để vô hiệu hoá các cache phía trên)
+        self.version = 0
+        self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(self._index_dim()))
+        self.metadata = MetadataStore()
+        # Delta log: thay đổi sau lần load/save cuối được ghi nối tiếp, compaction nền khi log lớn
+        self.wal = wal if wal is not None else os.getenv("FAISS_WAL", "1") == "1"
+        self.wal_compact_bytes = int(os.getenv("FAISS_WAL_COMPACT_BYTES", str(64 << 20)))
+        self.delta_log: Optional[DeltaLog] = None
+        self._snapshot_paths = None
+        self._compact_lock = threading.Lock()
+        # Snapshot trên đĩa cũ hơn index trong RAM dù không có thay đổi mới (index cũ được chuyển
+        # đổi lúc load, index Flat mmap chưa có file .npy): được ghi đầy đủ ở lần save/commit tiếp theo
+        self._snapshot_outdated = False
+        # Id đã xoá nhưng vẫn còn trong đồ thị HNSW (bị loại khi search)
+        self._tombstones = np.zeros(0, dtype=np.int64)
+        self._tombstone_selector = None
+
+    def _factory(self) -> str:
+        """Chuỗi index_factory thực sự dùng, sau khi áp dụng `quantization`"""
+        if self.quantization == "binary":
+            return "Binary"
+        if self.quantization == "none":
+            return self.index_factory
+        codec = "SQ8" if self.quantization == "sq8" else "SQfp16"
+        if self.index_factory == "Flat":
+            return codec
+        if self.index_factory.endswith(",Flat"):
+            return self.index_factory[:-len("Flat")] + codec
+        if self.index_factory.upper().startswith("HNSW") and "," not in self.index_factory:
+            return f"{self.index_factory},{codec}"
+        return self.index_factory
+
+    def _index_dim(self) -> int:
+        return self.coarse_dim or self.dimension
+
+    def _coarse(self, vectors: np.ndarray) -> np.ndarray:
+        """Vector đưa vào index: `coarse_dim` chiều đầu, chuẩn hoá lại (Matryoshka); nguyên vẹn nếu không rút gọn"""
+        if not self.coarse_dim:
+            return vectors
+        coarse = np.array(vectors[:, :self.coarse_dim], dtype=np.float32, order="C")
+        faiss.normalize_L2(coarse)
+        return coarse
+
+    def _new_index(self) -> faiss.Index:
+        dimension = self._index_dim()
+        if self._factory() == "Binary":
+            # Mỗi chiều là 1 bit dấu, tìm theo khoảng cách Hamming (IndexLSH không xoay / không train)
+            return faiss.IndexLSH(dimension, dimension, False, False)
+        return faiss.index_factory(dimension, self._factory(), faiss.METRIC_INNER_PRODUCT)
+
+    @staticmethod
+    def _with_ids(index: faiss.Index) -> faiss.Index:
+        """Cho index (rỗng) nhận id tuỳ ý: IVF dùng direct map dạng hashtable, loại khác bọc IndexIDMap2"""
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is not None:
+            ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+            return index
+        return faiss.IndexIDMap2(index)
+
+    def _base_index(self):
+        if isinstance(self.index, faiss.IndexIDMap2):
+            return faiss.downcast_index(self.index.index)
+        return self.index
+
+    def _required_train_size(self, index: faiss.Index) -> int:
+        if self.min_train_size is not None:
+            return self.min_train_size
+        if index.is_trained:
+            return 0
+        # FAISS khuyến nghị ~39 điểm cho mỗi centroid (IVF) / mỗi mã PQ 8 bit
+        size = 0
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is not None:
+            size = 39 * ivf.nlist
+        if "PQ" in self.index_factory.upper():
+            size = max(size, 39 * 256)
+        if "SQ8" in self._factory():
+            # SQ8 học min/max của từng chiều: train trên quá ít vector sẽ cắt mất giá trị ngoài khoảng
+            size = max(size, 1000)
+        return max(size, 1)
+
+    def _apply_search_params(self):
+        base = self._base_index()
+        if isinstance(base, MmapFlatIndex):
+            return
+        params = faiss.ParameterSpace()
+        if faiss.try_extract_index_ivf(base) is not None:
+            params.set_index_parameter(base, "nprobe", self.nprobe)
+        if "HNSW" in self.index_factory.upper() and not isinstance(base, faiss.IndexFlat):
+            params.set_index_parameter(base, "efSearch", self.ef_search)
+
+    def _index_ids(self) -> np.ndarray:
+        """Id của toàn bộ vector đang có trong index (theo thứ tự lưu)"""
+        if self.index.ntotal == 0:
+            return np.zeros(0, dtype=np.int64)
+        if isinstance(self.index, MmapFlatIndex):
+            return self.index.ids.copy()
+        if isinstance(self.index, faiss.IndexIDMap2):
+            ids = faiss.vector_to_array(self.index.id_map)
+            return ids[~np.isin(ids, self._tombstones)] if len(self._tombstones) else ids
+        ivf = faiss.extract_index_ivf(self.index)
+        return np.concatenate([
+            faiss.rev_swig_ptr(ivf.invlists.get_ids(list_no), ivf.invlists.list_size(list_no)).copy()
+            for list_no in range(ivf.nlist) if ivf.invlists.list_size(list_no)
+        ])
+
+    def _reconstruct_all(self):
+        """Trả về (ids, vectors) của toàn bộ index"""
+        if self.index.ntotal == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros((0, self.dimension), dtype=np.float32)
+        if isinstance(self.index, MmapFlatIndex):
+            return self.index.ids.copy(), np.array(self.index.vectors, dtype=np.float32)
+        ids = self._index_ids()
+        if self._rerank is not None:
+            # Index nhị phân / rút gọn chiều không khôi phục được vector gốc: lấy bản float32 đầy đủ
+            return ids, self._rerank.get(ids)
+        if isinstance(self.index, faiss.IndexIDMap2):
+            vectors = self._base_index().reconstruct_n(0, self.index.ntotal)
+            if len(self._tombstones):
+                vectors = vectors[~np.isin(faiss.vector_to_array(self.index.id_map), self._tombstones)]
+            return ids, vectors
+        return ids, np.vstack([self.index.reconstruct(int(i)) for i in ids])
+
+    def _set_tombstones(self, ids: np.ndarray):
+        self._tombstones = np.asarray(ids, dtype=np.int64)
+        self._tombstone_selector = None
+
+    @staticmethod
+    def _without_ids(index: faiss.IndexIDMap2, ids: np.ndarray) -> faiss.IndexIDMap2:
+        """Dựng lại index HNSW (bọc IndexIDMap2) từ các vector đang lưu, bỏ các id trong `ids`"""
+        base = faiss.downcast_index(index.index)
+        all_ids = faiss.vector_to_array(index.id_map)
+        keep = ~np.isin(all_ids, ids)
+        vectors = base.reconstruct_n(0, index.ntotal)[keep] if index.ntotal else None
+        rebuilt = faiss.clone_index(base)
+        rebuilt.reset()
+        rebuilt = faiss.IndexIDMap2(rebuilt)
+        if vectors is not None and len(vectors):
+            rebuilt.add_with_ids(vectors, all_ids[keep])
+        return rebuilt
+
+    def _purge_tombstones(self):
+        """Bỏ hẳn các vector đã xoá khỏi đồ thị HNSW (dựng lại đồ thị)"""
+        if not len(self._tombstones):
+            return
+        self.index = self._without_ids(self.index, self._tombstones)
+        self._set_tombstones(np.zeros(0, dtype=np.int64))
+        self._apply_search_params()
+
+    def _migrate_ids(self, index):
+        """Index lưu bằng phiên bản cũ không có id: id = vị trí 0..n-1 (khớp metadata cũ)"""
+        if isinstance(index, (MmapFlatIndex, faiss.IndexIDMap2)):
+            return index
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is not None:
+            # IVF đã lưu sẵn id; chỉ cần direct map để reconstruct/xoá theo id
+            if ivf.direct_map.type != faiss.DirectMap.Hashtable:
+                ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+                self._snapshot_outdated = True
+            return index
+        self._snapshot_outdated = True
+        vectors = index.reconstruct_n(0, index.ntotal) if index.ntotal else None
+        index.reset()
+        wrapped = faiss.IndexIDMap2(index)
+        if vectors is not None:
+            wrapped.add_with_ids(vectors, np.arange(len(vectors), dtype=np.int64))
+        return wrapped
+
+    def _ensure_writable(self):
+        """Chép index đang được memory map vào RAM trước khi thêm/xoá"""
+        if not self._index_mmapped:
+            return
+        if isinstance(self.index, MmapFlatIndex):
+            self.index = self.index.to_faiss()
+        else:
+            ivf = faiss.extract_index_ivf(self.index)
+            invlists = faiss.ArrayInvertedLists(ivf.nlist, ivf.code_size)
+            for list_no in range(ivf.nlist):
+                size = ivf.invlists.list_size(list_no)
+                if size:
+                    invlists.add_entries(list_no, size, ivf.invlists.get_ids(list_no),
+                                         ivf.invlists.get_codes(list_no))
+            ivf.replace_invlists(invlists, True)
+            invlists.this.disown()
+        self._index_mmapped = False
+
+    def _maybe_reduce_dim(self):
+        """Index đã lưu có nhiều chiều hơn `coarse_dim` (vd. index đầy đủ cũ): dựng lại trên vector rút gọn"""
+        if not self.coarse_dim or self.index.d == self.coarse_dim:
+            return
+        self._ensure_writable()
+        ids, vectors = self._reconstruct_all()
+        if self._rerank is None:
+            self._rerank = RerankVectors(self.dimension)
+            self._rerank.add(ids, vectors)
+        index = faiss.IndexIDMap2(faiss.IndexFlatIP(self.coarse_dim))
+        index.add_with_ids(self._coarse(vectors), ids)
+        self.index = index
+        self._set_tombstones(np.zeros(0, dtype=np.int64))
+        self._snapshot_outdated = True
+
+    def _maybe_build_ann(self):
+        """Chuyển index Flat sang loại index đã cấu hình khi đủ dữ liệu để train"""
+        if self._factory() == "Flat" or not isinstance(self._base_index(), faiss.IndexFlat):
+            return
+        target = self._new_index()
+        if self.index.ntotal < self._required_train_size(target):
+            return
+        ids, vectors = self._reconstruct_all()
+        index_vectors = self._coarse(vectors)
+        if not target.is_trained:
+            target.train(index_vectors)
+        if self._rerank is None and isinstance(target, faiss.IndexLSH):
+            self._rerank = RerankVectors(self.dimension)
+            self._rerank.add(ids, vectors)
+        target = self._with_ids(target)
+        target.add_with_ids(index_vectors, ids)
+        self.index = target
+        self._set_tombstones(np.zeros(0, dtype=np.int64))
+        self._snapshot_outdated = True
+        self._apply_search_params()
+
+    def _add(self, entries: List[Dict[str, Any]], embeddings: np.ndarray, ids: List[int]):
+        self._ensure_writable()
+        if len(self._tombstones) and np.isin(ids, self._tombstones).any():
+            # Id đang là tombstone (vd. replay sau khi bỏ vector thừa): xoá hẳn trước khi thêm lại
+            self._purge_tombstones()
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
         faiss.normalize_L2(embeddings)
-        self.index.add(embeddings)
-        for doc in documents:
-            self.metadata.append({
+        self.metadata.append(entries, ids)
+        self.index.add_with_ids(self._coarse(embeddings), np.array(ids, dtype=np.int64))
+        if self._rerank is not None:
+            self._rerank.add(ids, embeddings)
+        self._maybe_build_ann()
+
+    def _remove(self, sources: List[str]) -> int:
+        ids = self.metadata.ids_for_sources(sources)
+        if not ids:
+            return 0
+        ids = np.array(ids, dtype=np.int64)
+        self._remove_index_ids(ids)
+        self.metadata.remove_ids(ids.tolist())
+        return len(ids)
+
+    def _remove_index_ids(self, ids: np.ndarray):
+        """Xoá các vector theo id khỏi index (id không có trong index được bỏ qua)"""
+        self._ensure_writable()
+        base = self._base_index()
+        if faiss.try_extract_index_ivf(base) is not None:
+            # Direct map dạng hashtable chỉ xoá được với IDSelectorArray (tra từng id)
+            self.index.remove_ids(faiss.IDSelectorArray(ids))
+        elif isinstance(base, faiss.IndexFlatCodes):
+            self.index.remove_ids(faiss.IDSelectorBatch(ids))
+        else:
+            # HNSW không hỗ trợ xoá: đánh dấu tombstone, chi phí không phụ thuộc kích thước index.
+            # Đồ thị được dựng lại khi ghi snapshot, hoặc ngay khi phần lớn vector đã bị xoá
+            present = np.isin(ids, faiss.vector_to_array(self.index.id_map))
+            self._set_tombstones(np.union1d(self._tombstones, ids[present]))
+            if len(self._tombstones) > self.TOMBSTONE_PURGE_RATIO * self.index.ntotal:
+                self._purge_tombstones()
+        if self._rerank is not None:
+            self._rerank.remove(ids)
+
+    def _log(self, record: Dict[str, Any]):
+        """Ghi thay đổi vào delta log trước khi áp dụng (nếu đang bật WAL)"""
+        if self.delta_log is not None:
+            self.delta_log.append(record)
+
+    def _log_entries(self, record: Dict[str, Any], entries: List[Dict[str, Any]],
+                     embeddings: np.ndarray, ids: List[int]) -> Dict[str, Any]:
+        if self.delta_log is not None:
+            record.update(ids=ids, entries=entries, embeddings=DeltaLog.encode_vectors(embeddings))
+        return record
+
+    @staticmethod
+    def _entries(documents: List[Document]) -> List[Dict[str, Any]]:
+        return [
+            {
                 "content": doc.page_content,
                 "metadata": doc.metadata
-            })
+            }
+            for doc in documents
+        ]
+
+    def add_documents(self, documents: List[Document], embeddings: np.ndarray):
+        """Thêm document và embedding vào FAISS"""
+        with self._lock:
+            entries = self._entries(documents)
+            start = self.metadata.next_id()
+            ids = list(range(start, start + len(entries)))
+            self._log(self._log_entries({"op": "add"}, entries, embeddings, ids))
+            self._add(entries, embeddings, ids)
+            self.version += 1
+            self._maybe_compact()
+
+    def remove_sources(self, sources: List[str]) -> int:
+        """Xoá toàn bộ vector và metadata của các file nguồn, trả về số chunk đã xoá"""
+        with self._lock:
+            sources = list(sources)
+            if not self.metadata.ids_for_sources(sources):
+                return 0
+            self._log({"op": "remove", "sources": sources})
+            removed = self._remove(sources)
+            self.version += 1
+            self._maybe_compact()
+            return removed
+
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal - len(self._tombstones)
+
+    def export_sources(self, sources: List[str]):
+        """(documents, embeddings) hiện có của các file nguồn, dùng để chuyển CV sang store / shard khác"""
+        with self._lock:
+            ids = np.array(self.metadata.ids_for_sources(list(sources)), dtype=np.int64)
+            if not len(ids):
+                return [], np.zeros((0, self.dimension), dtype=np.float32)
+            all_ids, vectors = self._reconstruct_all()
+            order = np.argsort(all_ids)
+            rows = order[np.searchsorted(all_ids, ids, sorter=order)]
+            documents = [Document(page_content=entry["content"], metadata=entry["metadata"])
+                         for entry in self.metadata.get_many(ids.tolist())]
+            return documents, np.ascontiguousarray(vectors[rows], dtype=np.float32)
+
+    def source_chunks(self, source: str) -> List[Dict[str, Any]]:
+        """Các chunk đã lưu của một file nguồn theo thứ tự `chunk_id` (không đọc vector)"""
+        with self._lock:
+            entries = self.metadata.get_many(self.metadata.ids_for_sources([source]))
+        return sorted((entry for entry in entries if entry is not None),
+                      key=lambda entry: entry["metadata"].get("chunk_id", 0))
+
+    def remove_source(self, filename: str) -> int:
+        """Xoá một file CV khỏi index, trả về số chunk đã xoá"""
+        return self.remove_sources([filename])
+
+    def upsert_source(self, filename: str, documents: List[Document], embeddings: np.ndarray) -> int:
+        """Thay toàn bộ chunk của một file bằng các chunk mới (không tạo bản trùng khi upload lại)"""
+        with self._lock:
+            entries = self._entries(documents)
+            start = self.metadata.next_id()
+            ids = list(range(start, start + len(entries)))
+            self._log(self._log_entries({"op": "upsert", "source": filename}, entries, embeddings, ids))
+            removed = self._remove([filename])
+            if entries:
+                self._add(entries, embeddings, ids)
+            self.version += 1
+            self._maybe_compact()
+            return removed
+
+    def _replay(self, records: List[Dict[str, Any]]):
+        """Áp dụng lại delta log lên snapshot.
+
+        Các bản ghi có thể đã nằm một phần trong snapshot (process chết giữa lúc compaction),
+        nên replay phải idempotent: upsert/remove theo source, còn add bỏ qua các id đã có.
+        Nếu process chết sau khi thay file index nhưng trước khi thay metadata, index mới hơn
+        metadata: các vector không có metadata được bỏ khỏi index trước, để replay thêm lại đúng
+        một lần (metadata cũ cộng log vẫn đủ để dựng lại trạng thái mới).
+        """
+        orphans = np.setdiff1d(self._index_ids(), np.asarray(self.metadata.ids(), dtype=np.int64))
+        if len(orphans):
+            print(f"⚠️ Index có {len(orphans)} vector không có metadata (snapshot ghi dở), dựng lại từ delta log")
+            self._remove_index_ids(orphans)
+        for record in records:
+            if record["op"] == "remove":
+                self._remove(record["sources"])
+            elif record["op"] == "upsert":
+                self._remove([record["source"]])
+            if record["op"] in ("add", "upsert") and record["ids"]:
+                embeddings = DeltaLog.decode_vectors(record["embeddings"], self.dimension)
+                missing = [i for i, entry in enumerate(self.metadata.get_many(record["ids"])) if entry is None]
+                if missing:
+                    self._add([record["entries"][i] for i in missing], embeddings[missing],
+                              [record["ids"][i] for i in missing])
+
+    def _allowed_ids(self, filters: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """Id các chunk thoả `filters`; None nghĩa là không lọc"""
+        if not filters:
+            return None
+        sources = filters.get("sources")
+        after = filters.get("uploaded_after")
+        before = filters.get("uploaded_before")
+        if sources is None and after is None and before is None:
+            return None
+        source_index = self.metadata.source_index()
+        names = source_index if sources is None else [s for s in dict.fromkeys(sources) if s in source_index]
+        parts = [
+            source_index[name]["ids"] for name in names
+            if (after is None or source_index[name]["uploaded_at"] >= after)
+            and (before is None or source_index[name]["uploaded_at"] <= before)
+        ]
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+
+    def _search_params(self, selector: faiss.IDSelector) -> faiss.SearchParameters:
+        base = self._base_index()
+        if faiss.try_extract_index_ivf(base) is not None:
+            return faiss.SearchParametersIVF(sel=selector, nprobe=self.nprobe)
+        if isinstance(base, faiss.IndexHNSW):
+            return faiss.SearchParametersHNSW(sel=selector, efSearch=self.ef_search)
+        return faiss.SearchParameters(sel=selector)
+
+    def _search_rerank(self, queries: np.ndarray, k: int, allowed_ids: Optional[np.ndarray]):
+        """Index nhị phân / rút gọn chiều: shortlist `k * rerank_factor`, chấm lại bằng vector float32 đầy đủ"""
+        shortlist = k * self.rerank_factor
+        if self.index.ntotal == 0:
+            return _top_k(np.zeros((len(queries), 0), dtype=np.float32), np.zeros(0, dtype=np.int64), k)
+        if allowed_ids is not None and len(allowed_ids) <= max(self.filter_exact_max, shortlist):
+            return _top_k(queries @ self._rerank.get(allowed_ids).T, allowed_ids, k)
+        coarse_queries = self._coarse(queries)
+        labels = None
+        if allowed_ids is not None and not isinstance(self._base_index(), faiss.IndexLSH):
+            selector = faiss.IDSelectorBatch(allowed_ids)
+            try:
+                _, labels = self.index.search(coarse_queries, min(shortlist, self.index.ntotal),
+                                              params=self._search_params(selector))
+            except RuntimeError:
+                pass
+        if labels is None:
+            fetch = shortlist
+            if allowed_ids is not None:
+                # IndexLSH không nhận IDSelector: lấy shortlist lớn hơn theo tỉ lệ id hợp lệ rồi lọc
+                fetch = int(shortlist * self.index.ntotal / len(allowed_ids)) + 1
+            _, labels = self.index.search(coarse_queries, min(fetch, self.index.ntotal))
+        distances = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        result_labels = np.full((len(queries), k), -1, dtype=np.int64)
+        for row, (query, candidates) in enumerate(zip(queries, labels)):
+            candidates = candidates[candidates >= 0]
+            if len(self._tombstones):
+                candidates = candidates[~np.isin(candidates, self._tombstones)]
+            if allowed_ids is not None:
+                candidates = candidates[np.isin(candidates, allowed_ids)][:shortlist]
+            scores = self._rerank.get(candidates) @ query
+            distances[row:row + 1], result_labels[row:row + 1] = _top_k(scores[None, :], candidates, k)
+        return distances, result_labels
+
+    def _live_selector(self) -> faiss.IDSelector:
+        """IDSelector loại các tombstone (dựng lại khi tập tombstone thay đổi)"""
+        if self._tombstone_selector is None:
+            deleted = faiss.IDSelectorBatch(self._tombstones)
+            self._tombstone_selector = (faiss.IDSelectorNot(deleted), deleted)
+        return self._tombstone_selector[0]
+
+    def _search_index(self, queries: np.ndarray, k: int, allowed_ids: Optional[np.ndarray]):
+        if self._rerank is not None:
+            return self._search_rerank(queries, k, allowed_ids)
+        if allowed_ids is None:
+            if len(self._tombstones):
+                return self.index.search(queries, k, params=self._search_params(self._live_selector()))
+            return self.index.search(queries, k)
+        if isinstance(self.index, MmapFlatIndex):
+            return self.index.search(queries, k, allowed_ids=allowed_ids)
+        if len(allowed_ids) > self.filter_exact_max:
+            selector = faiss.IDSelectorBatch(allowed_ids)
+            try:
+                return self.index.search(queries, k, params=self._search_params(selector))
+            except RuntimeError:
+                # Loại index không nhận SearchParameters (vd. PQ không qua IVF): chấm điểm trực tiếp
+                pass
+        return _top_k(queries @ self.index.reconstruct_batch(allowed_ids).T, allowed_ids, k)
 
-    def search(self, query_embedding: np.ndarray, k: int = 5) -> List[Dict]:
+    def search(self, query_embedding: np.ndarray, k: int = 5,
+               filters: Optional[Dict[str, Any]] = None) -> List[Dict]:
         """Tìm kiếm văn bản gần giống"""
-        query_embedding = query_embedding.reshape(1, -1)
-        faiss.normalize_L2(query_embedding)
-        scores, indices = self.index.search(query_embedding, k)
-
-        results = []
-        for score, idx in zip(scores[0], indices[0]):
-            if idx < len(self.metadata):
-                results.append({
-                    "content": self.metadata[idx]["content"],
-                    "metadata": self.metadata[idx]["metadata"],
-                    "score": float(score)
-                })
-        return results
+        return self.search_batch(query_embedding.reshape(1, -1), k=k, filters=filters)[0]
+
+    def search_batch(self, query_embeddings: np.ndarray, k: int = 5,
+                     filters: Optional[Dict[str, Any]] = None) -> List[List[Dict]]:
+        """Tìm kiếm nhiều query trong một lần gọi FAISS, trả về kết quả theo thứ tự query.
+
+        `filters` giới hạn kết quả trong một tập CV: {"sources": [tên file],
+        "uploaded_after": unix time, "uploaded_before": unix time}.
+        """
+        with self._lock:
+            dimension = self._rerank.dimension if self._rerank is not None else self.index.d
+            queries = np.array(query_embeddings, dtype=np.float32).reshape(-1, dimension)
+            if len(queries) == 0:
+                return []
+            allowed_ids = self._allowed_ids(filters)
+            if allowed_ids is not None and len(allowed_ids) == 0:
+                return [[] for _ in queries]
+            faiss.normalize_L2(queries)
+            scores, labels = self._search_index(queries, k, allowed_ids)
+
+            # Chỉ đọc đúng các dòng metadata cần trả về, một truy vấn cho tất cả query
+            ids = sorted({int(label) for label in labels.ravel() if label >= 0})
+            entries = dict(zip(ids, self.metadata.get_many(ids)))
+
+            batch_results = []
+            for row_scores, row_labels in zip(scores, labels):
+                results = []
+                for score, label in zip(row_scores, row_labels):
+                    entry = entries.get(int(label))
+                    if entry is not None:
+                        results.append({
+                            "id": int(label),
+                            "content": entry["content"],
+                            "metadata": entry["metadata"],
+                            "score": float(score)
+                        })
+                batch_results.append(results)
+            return batch_results
+
+    def search_lexical(self, query: str, k: int = 5,
+                       filters: Optional[Dict[str, Any]] = None) -> List[Dict]:
+        """Tìm theo từ khoá (BM25) trên inverted index đi kèm, cùng định dạng kết quả với `search`"""
+        # Chờ inverted index (nếu đang nạp) mà không giữ lock của store, để search vector vẫn chạy
+        self.metadata.lexical_index()
+        with self._lock:
+            allowed_ids = self._allowed_ids(filters)
+            if allowed_ids is not None and len(allowed_ids) == 0:
+                return []
+            hits = self.metadata.lexical_index().search(query, k, allowed_ids=allowed_ids)
+            entries = self.metadata.get_many([chunk_id for chunk_id, _ in hits])
+            return [
+                {
+                    "id": chunk_id,
+                    "content": entry["content"],
+                    "metadata": entry["metadata"],
+                    "score": score
+                }
+                for (chunk_id, score), entry in zip(hits, entries) if entry is not None
+            ]
+
+    @staticmethod
+    def _write_flat_arrays(index_path: str, ids: np.ndarray, vectors: np.ndarray):
+        """Ghi vector và id của index Flat ra .npy để load bằng memory map.
+
+        Mỗi lần ghi dùng file tạm riêng (pid + uuid) nên nhiều process ghi cùng lúc không ghi đè
+        lên file tạm của nhau; cả hai file được ghi xong và fsync rồi mới cùng được thay thế.
+        Các dòng được ghi theo thứ tự id tăng dần (`_read_index` chỉ so id đầu/cuối với metadata).
+        """
+        order = np.argsort(ids, kind="stable")
+        ids, vectors = ids[order], vectors[order]
+        tag = f"{os.getpid()}.{uuid.uuid4().hex}"
+        published = []
+        try:
+            for suffix, array in ((".ids.npy", ids), (".vectors.npy", vectors)):
+                tmp_path = f"{index_path}{suffix}.{tag}.tmp"
+                published.append((tmp_path, f"{index_path}{suffix}"))
+                with open(tmp_path, "wb") as f:
+                    np.save(f, array)
+                    f.flush()
+                    os.fsync(f.fileno())
+            for tmp_path, path in published:
+                os.replace(tmp_path, path)
+        finally:
+            for tmp_path, _ in published:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+    def _snapshot(self):
+        """Chụp trạng thái hiện tại trong RAM (gọi khi đang giữ lock) để ghi ra file sau"""
+        self._ensure_writable()
+        flat_arrays = None
+        if (self.mmap and isinstance(self._base_index(), faiss.IndexFlat)) or self._rerank is not None:
+            flat_arrays = self._reconstruct_all()
+        return faiss.serialize_index(self.index), flat_arrays, self.metadata.copy(), self._tombstones.copy()
+
+    @staticmethod
+    def _fsync_dir(path: str):
+        """fsync thư mục chứa `path` để các lần os.replace không bị mất khi mất điện"""
+        if os.name != "posix":
+            return
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _write_snapshot(self, index_path: str, metadata_path: str, snapshot):
+        """Ghi file tạm, fsync rồi thay thế nguyên tử (reader đang mmap vẫn giữ bản cũ).
+
+        Index được thay trước metadata; nếu process chết ở giữa, `_replay` lúc load
+        dùng delta log (chưa bị xoá) để đưa index và metadata về cùng một trạng thái.
+        Tombstone của HNSW được bỏ hẳn khỏi bản ghi ra file (dựng lại đồ thị ở đây, ngoài lock).
+        """
+        index_bytes, flat_arrays, metadata, tombstones = snapshot
+        if len(tombstones):
+            index_bytes = faiss.serialize_index(self._without_ids(faiss.deserialize_index(index_bytes), tombstones))
+        with open(f"{index_path}.tmp", "wb") as f:
+            f.write(index_bytes.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        if flat_arrays is not None:
+            self._write_flat_arrays(index_path, *flat_arrays)
+        os.replace(f"{index_path}.tmp", index_path)
+        metadata.save(metadata_path)
+        metadata.close()
+        self._fsync_dir(index_path)
+
+    def _attach_log(self, index_path: str):
+        if not self.wal:
+            return
+        log_path = f"{index_path}.wal"
+        if self.delta_log is None or self.delta_log.path != log_path:
+            if self.delta_log is not None:
+                self.delta_log.close()
+            self.delta_log = DeltaLog(log_path)
+
+    def close_log(self):
+        """Ngừng ghi delta log (ví dụ khi store đã được thay bằng bản mới).
+
+        Chờ compaction đang chạy xong để store cũ không ghi đè snapshot sau khi đã bị thay.
+        """
+        with self._compact_lock, self._lock:
+            if self.delta_log is not None:
+                self.delta_log.close()
+                self.delta_log = None
+
+    def close(self):
+        """Đóng delta log và kết nối SQLite của metadata (store không còn được dùng)"""
+        self.close_log()
+        with self._lock:
+            self.metadata.close()
+
+    def snapshot_to(self, index_path: str, metadata_path: str):
+        """Ghi snapshot đầy đủ ra đường dẫn khác (vd. bản nháp để rebuild), không có delta log.
+
+        File và delta log store đang gắn không thay đổi; delta log cũ ở đường dẫn đích bị xoá.
+        """
+        with self._compact_lock:
+            with self._lock:
+                snapshot = self._snapshot()
+            for path in (f"{index_path}.wal", f"{index_path}.wal.compacting"):
+                if os.path.exists(path):
+                    os.remove(path)
+            self._write_snapshot(index_path, metadata_path, snapshot)
 
     def save(self, index_path: str, metadata_path: str):
-        """Lưu index FAISS và metadata"""
-        faiss.write_index(self.index, index_path)
-        with open(metadata_path, 'w', encoding='utf-8') as f:
-            json.dump(self.metadata, f, ensure_ascii=False, indent=2)
+        """Lưu snapshot đầy đủ của index FAISS và metadata, sau đó xoá delta log"""
+        with self._compact_lock, self._lock:
+            self._write_snapshot(index_path, metadata_path, self._snapshot())
+            self._snapshot_outdated = False
+            if self._rerank is not None:
+                self._rerank.attach(index_path)
+            self._snapshot_paths = (index_path, metadata_path)
+            self._attach_log(index_path)
+            if self.delta_log is not None:
+                self.delta_log.clear()
+
+    def commit(self, index_path: str, metadata_path: str):
+        """Đảm bảo các thay đổi đã được ghi bền.
+
+        Khi WAL đang gắn với đúng snapshot này thì thay đổi đã nằm trong delta log
+        (chi phí không phụ thuộc kích thước corpus); ngược lại lưu snapshot đầy đủ.
+        Index được chuyển đổi lúc load (hoặc Flat cũ chưa có file .npy cho mmap) cũng được lưu
+        đầy đủ một lần ở đây.
+        """
+        with self._lock:
+            if self.delta_log is not None and self._snapshot_paths == (index_path, metadata_path) \
+                    and not self._snapshot_outdated:
+                return
+        self.save(index_path, metadata_path)
+
+    def compact(self) -> bool:
+        """Gộp delta log vào snapshot. Chỉ giữ lock lúc chụp trạng thái, ghi file ở ngoài lock"""
+        with self._compact_lock:
+            return self._compact()
+
+    def _compact(self) -> bool:
+        with self._lock:
+            if self.delta_log is None or self._snapshot_paths is None:
+                return False
+            snapshot = self._snapshot()
+            self._snapshot_outdated = False
+            written = self._rerank.pending() if self._rerank is not None else None
+            self.delta_log.rotate()
+            index_path, metadata_path = self._snapshot_paths
+        self._write_snapshot(index_path, metadata_path, snapshot)
+        if written is not None:
+            with self._lock:
+                self._rerank.attach(index_path, written)
+        self.delta_log.drop_rotated()
+        return True
+
+    def _maybe_compact(self):
+        """Compaction nền khi delta log vượt `wal_compact_bytes`"""
+        if self.delta_log is None or self.delta_log.size() < self.wal_compact_bytes:
+            return
+        if not self._compact_lock.acquire(blocking=False):
+            return
+
+        def run():
+            try:
+                self._compact()
+            except Exception as e:
+                print(f"❌ Lỗi khi compaction delta log: {str(e)}")
+            finally:
+                self._compact_lock.release()
+
+        threading.Thread(target=run, name="faiss-compaction", daemon=True).start()
+
+    def _read_index(self, index_path: str):
+        """Đọc index, dùng memory map nếu bật mmap và loại index hỗ trợ.
+
+        Chỉ đọc, không ghi file: nhiều worker có thể load cùng một index cùng lúc.
+        """
+        self._index_mmapped = False
+        self._snapshot_outdated = False
+        if not self.mmap:
+            return self._migrate_ids(faiss.read_index(index_path))
+
+        vectors_path = f"{index_path}.vectors.npy"
+        if self._factory() == "Flat" and not self.coarse_dim and os.path.exists(vectors_path) \
+                and os.path.getmtime(vectors_path) >= os.path.getmtime(index_path):
+            index = MmapFlatIndex(vectors_path, f"{index_path}.ids.npy")
+            # Cặp .npy phải khớp tập id của metadata (không lấy nhầm file của snapshot khác).
+            # So số lượng và id đầu/cuối (file .ids.npy được ghi theo thứ tự id tăng dần) thay vì
+            # đọc toàn bộ id, để load không tốn O(n)
+            count, first, last = self.metadata.id_range()
+            if index.ntotal == len(index.ids) == count \
+                    and (count == 0 or (index.ids[0] == first and index.ids[-1] == last)):
+                self._index_mmapped = True
+                return index
+
+        index = self._migrate_ids(
+            faiss.read_index(index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        )
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is not None and ivf.ntotal > 0:
+            self._index_mmapped = True
+        elif isinstance(index, faiss.IndexIDMap2) and self._factory() == "Flat" \
+                and not self.coarse_dim and index.d == self.dimension \
+                and isinstance(faiss.downcast_index(index.index), faiss.IndexFlat):
+            # Chưa có file .npy (index cũ): được ghi ở lần save/commit tiếp theo của process ghi
+            self._snapshot_outdated = True
+        return index
 
     def load(self, index_path: str, metadata_path: str) -> bool:
-        """Tải lại index FAISS và metadata"""
-        if os.path.exists(index_path) and os.path.exists(metadata_path):
-            self.index = faiss.read_index(index_path)
-            with open(metadata_path, 'r', encoding='utf-8') as f:
-                self.metadata = json.load(f)
-            return True
-        return False
+        """Tải lại index FAISS và metadata (tự chuyển file metadata .json cũ sang SQLite)"""
+        with self._lock:
+            legacy_path = os.path.splitext(metadata_path)[0] + ".json"
+            if not os.path.exists(metadata_path) and legacy_path != metadata_path \
+                    and os.path.exists(legacy_path):
+                MetadataStore.from_json(legacy_path).save(metadata_path)
+
+            if os.path.exists(index_path) and os.path.exists(metadata_path):
+                if metadata_path.endswith(".json"):
+                    self.metadata = MetadataStore.from_json(metadata_path)
+                else:
+                    self.metadata = MetadataStore(metadata_path)
+                if self.lexical_preload:
+                    self.metadata.preload_lexical()
+                self.index = self._read_index(index_path)
+                self._set_tombstones(np.zeros(0, dtype=np.int64))
+                self._rerank = None
+                if self.index.d < self.dimension and not self.coarse_dim:
+                    self.coarse_dim = self.index.d
+                if self.index.d < self.dimension or isinstance(self._base_index(), faiss.IndexLSH):
+                    self._rerank = RerankVectors(self.dimension)
+                    self._rerank.attach(index_path)
+                self._maybe_reduce_dim()
+                self._apply_search_params()
+                self._snapshot_paths = (index_path, metadata_path)
+                self._attach_log(index_path)
+                if self.delta_log is not None:
+                    records = self.delta_log.read()
+                    if records:
+                        print(f"♻️ Áp dụng {len(records)} thay đổi từ delta log")
+                        self._replay(records)
+                self._maybe_build_ann()
+                self.version += 1
+                return True
+            return False
@@ -0,0 +1,425 @@
+import json
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from lexical_index import tokenize
+
+# Tăng khi luật trích xuất thay đổi: hồ sơ cũ hơn được trích xuất lại khi chạy `main.py`
+PROFILE_VERSION = 2
+
+# Tên hiển thị -> các cách viết được nhận là cùng một kỹ năng (so khớp theo cụm token)
+SKILLS: Dict[str, Tuple[str, ...]] = {
+    "Python": ("python", "python3"),
+    "Java": ("java",),
+    "JavaScript": ("javascript",),
+    "TypeScript": ("typescript",),
+    "C++": ("c++", "cpp"),
+    "C#": ("c#",),
+    "Go": ("golang",),
+    "PHP": ("php",),
+    "Ruby": ("ruby",),
+    "Kotlin": ("kotlin",),
+    "Swift": ("swift",),
+    "Rust": ("rust",),
+    "Scala": ("scala",),
+    "SQL": ("sql",),
+    "MySQL": ("mysql",),
+    "PostgreSQL": ("postgresql", "postgres"),
+    "MongoDB": ("mongodb",),
+    "Redis": ("redis",),
+    "Elasticsearch": ("elasticsearch",),
+    "HTML": ("html", "html5"),
+    "CSS": ("css", "css3"),
+    "React": ("react", "reactjs", "react.js"),
+    "Angular": ("angular", "angularjs"),
+    "Vue.js": ("vue", "vuejs", "vue.js"),
+    "Node.js": ("node.js", "nodejs"),
+    "Django": ("django",),
+    "Flask": ("flask",),
+    "FastAPI": ("fastapi",),
+    "Spring Boot": ("spring boot", "springboot"),
+    ".NET": ("asp.net", "dotnet", ".net core"),
+    "Laravel": ("laravel",),
+    "Docker": ("docker",),
+    "Kubernetes": ("kubernetes", "k8s"),
+    "AWS": ("aws", "amazon web services"),
+    "Azure": ("azure",),
+    "GCP": ("gcp", "google cloud"),
+    "Linux": ("linux",),
+    "Git": ("git", "github", "gitlab"),
+    "CI/CD": ("ci/cd", "cicd", "jenkins", "github actions"),
+    "Machine Learning": ("machine learning", "học máy"),
+    "Deep Learning": ("deep learning", "học sâu"),
+    "NLP": ("nlp", "natural language processing", "xử lý ngôn ngữ tự nhiên"),
+    "Computer Vision": ("computer vision", "thị giác máy tính"),
+    "TensorFlow": ("tensorflow",),
+    "PyTorch": ("pytorch",),
+    "scikit-learn": ("scikit-learn", "sklearn"),
+    "Pandas": ("pandas",),
+    "NumPy": ("numpy",),
+    "MLflow": ("mlflow",),
+    "Spark": ("spark", "pyspark"),
+    "Data Analysis": ("data analysis", "phân tích dữ liệu"),
+    "Excel": ("excel", "ms excel"),
+    "Power BI": ("power bi",),
+    "Tableau": ("tableau",),
+    "Project Management": ("project management", "quản lý dự án"),
+    "Agile/Scrum": ("agile", "scrum"),
+}
+# Cách viết trùng với từ tiếng Anh thông thường ("excel at", "swift delivery", "react to"):
+# chỉ nhận trong mục kỹ năng của CV
+AMBIGUOUS_SKILL_ALIASES = {"excel", "swift", "rust", "ruby", "spark", "flask", "react", "angular", "vue", "scala"}
+
+DEGREES: Dict[str, Tuple[str, ...]] = {
+    "Tiến sĩ": ("phd", "ph.d", "tiến sĩ", "doctor of philosophy"),
+    "Thạc sĩ": ("master", "masters", "thạc sĩ", "msc", "m.sc", "mba"),
+    "Cử nhân / Kỹ sư": ("bachelor", "bachelors", "cử nhân", "kỹ sư", "kĩ sư", "b.sc", "bsc"),
+}
+
+FIELDS: Dict[str, Tuple[str, ...]] = {
+    "Công nghệ thông tin": (
+        "information technology", "công nghệ thông tin", "cntt", "computer science",
+        "khoa học máy tính", "software engineering", "kỹ thuật phần mềm", "information systems",
+        "hệ thống thông tin", "computer engineering", "kỹ thuật máy tính", "data science",
+        "khoa học dữ liệu", "an toàn thông tin", "cyber security",
+        # "IT" một mình trùng với đại từ "it": chỉ nhận khi đi cùng từ chỉ bằng cấp / ngành học
+        "it degree", "degree in it", "bachelor of it", "bachelor in it", "major in it", "it major",
+        "bằng it", "ngành it", "cử nhân it", "kỹ sư it",
+    ),
+}
+
+COMPANY_MARKERS = re.compile(r"\b(company|bank|công ty|tập đoàn|ngân hàng)\b")
+# Hậu tố chỉ là tên công ty khi đứng sau tên riêng ("FPT Software", không phải "Software Engineer")
+COMPANY_SUFFIXES = re.compile(
+    r"\w\S*\s+(?:corp|corporation|jsc|ltd|inc|group|technology|technologies|software|solutions)\b"
+)
+JOB_TITLES = re.compile(
+    r"\b(engineer|developer|intern|manager|lead|leader|analyst|architect|consultant|specialist|designer"
+    r"|tester|scientist|administrator|thực tập sinh|lập trình viên|kỹ sư|nhân viên|trưởng nhóm|chuyên viên)\b"
+)
+EXPERIENCE_HEADINGS = ("experience", "employment", "work history", "kinh nghiệm", "quá trình làm việc")
+EDUCATION_HEADINGS = ("education", "học vấn", "academic")
+SKILL_HEADINGS = ("skill", "kỹ năng", "kĩ năng", "technolog", "tech stack", "tools", "công cụ", "competenc")
+
+_MONTHS = {name: i for i, name in enumerate(
+    ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"], 1)}
+_DATE = r"(?:(?:(?P<m{n}>\d{{1,2}})[/.\-]|(?P<mn{n}>[a-z]{{3}})[a-z]*\.?\s+))?(?P<y{n}>(?:19|20)\d{{2}})"
+DATE_RANGE = re.compile(
+    _DATE.format(n=1) + r"\s*(?:-|–|—|~|to|đến)\s*(?:" + _DATE.format(n=2)
+    + r"|(?P<now>present|now|current|hiện tại|nay))",
+    re.IGNORECASE,
+)
+EXPLICIT_YEARS = re.compile(r"(\d+(?:[.,]\d+)?)\+?\s*(?:years?|yrs?|năm)\s*(?:of\s+)?(?:experience|kinh nghiệm)")
+
+
+class _PhraseMatcher:
+    """Tìm các cụm token (đã tokenize như BM25) trong văn bản, trả về tên chuẩn và vị trí"""
+
+    def __init__(self, vocabulary: Dict[str, Tuple[str, ...]], exclude: Iterable[str] = ()):
+        self._phrases: Dict[str, List[Tuple[Tuple[str, ...], str]]] = {}
+        for name, aliases in vocabulary.items():
+            for alias in aliases:
+                if alias in exclude:
+                    continue
+                phrase = tuple(tokenize(alias))
+                self._phrases.setdefault(phrase[0], []).append((phrase, name))
+        for phrases in self._phrases.values():
+            phrases.sort(key=lambda item: len(item[0]), reverse=True)
+
+    def find(self, tokens: List[str]) -> List[Tuple[str, int, int]]:
+        """[(tên, token đầu, token cuối + 1)], ưu tiên cụm dài nhất tại mỗi vị trí"""
+        matches, i = [], 0
+        while i < len(tokens):
+            for phrase, name in self._phrases.get(tokens[i], ()):
+                if tuple(tokens[i:i + len(phrase)]) == phrase:
+                    matches.append((name, i, i + len(phrase)))
+                    i += len(phrase)
+                    break
+            else:
+                i += 1
+        return matches
+
+    def names(self, text: str) -> List[str]:
+        return list(dict.fromkeys(name for name, _, _ in self.find(tokenize(text))))
+
+
+SKILL_MATCHER = _PhraseMatcher(SKILLS)
+UNAMBIGUOUS_SKILL_MATCHER = _PhraseMatcher(SKILLS, exclude=AMBIGUOUS_SKILL_ALIASES)
+DEGREE_MATCHER = _PhraseMatcher(DEGREES)
+FIELD_MATCHER = _PhraseMatcher(FIELDS)
+
+
+def _sections(markdown: str) -> Tuple[Optional[str], Dict[str, str]]:
+    """(tiêu đề `# ...` đầu tiên, {heading `##` chữ thường: nội dung})"""
+    title, sections, current = None, {}, ""
+    for line in markdown.splitlines():
+        heading = re.match(r"^(#{1,2})\s+(.+?)\s*:?\s*$", line.strip())
+        if heading and len(heading.group(1)) == 1 and title is None:
+            title = heading.group(2).strip("* ")
+        elif heading:
+            current = heading.group(2).strip("* ").lower()
+            sections.setdefault(current, "")
+        else:
+            sections[current] = sections.get(current, "") + line + "\n"
+    return title, sections
+
+
+def _section_text(sections: Dict[str, str], keywords: Tuple[str, ...]) -> str:
+    return "\n".join(body for heading, body in sections.items() if any(k in heading for k in keywords))
+
+
+def _month_index(match: "re.Match", n: int, default_month: int) -> int:
+    month = match.group(f"m{n}")
+    name = match.group(f"mn{n}")
+    month = int(month) if month else _MONTHS.get(name.lower(), default_month) if name else default_month
+    return int(match.group(f"y{n}")) * 12 + min(max(month, 1), 12) - 1
+
+
+def explicit_years(text: str) -> Optional[float]:
+    """Số năm kinh nghiệm ghi rõ trong CV ("3 years of experience", "2 năm kinh nghiệm")"""
+    text = unicodedata.normalize("NFC", text).lower()
+    values = [float(value.replace(",", ".")) for value in EXPLICIT_YEARS.findall(text)]
+    return max(values) if values else None
+
+
+def experience_years(text: str, now: Optional[float] = None) -> Optional[float]:
+    """Số năm kinh nghiệm từ mục kinh nghiệm: hợp các khoảng thời gian (không đếm trùng), nếu không có thì số ghi rõ"""
+    text = unicodedata.normalize("NFC", text).lower()
+    current = time.localtime(now)
+    now_index = current.tm_year * 12 + current.tm_mon - 1
+    intervals = []
+    for match in DATE_RANGE.finditer(text):
+        # Chỉ có năm: bắt đầu từ tháng 1, kết thúc ở tháng 12 ("2019 - 2020" là 2 năm)
+        start = _month_index(match, 1, 1)
+        end = now_index if match.group("now") else min(_month_index(match, 2, 12), now_index)
+        if start <= end:
+            intervals.append((start, end + 1))
+    if intervals:
+        months, last_end = 0, None
+        for start, end in sorted(intervals):
+            if last_end is not None and start < last_end:
+                start = last_end
+            if end > start:
+                months += end - start
+                last_end = end
+        return round(months / 12, 1)
+    return explicit_years(text)
+
+
+def _companies(text: str) -> List[str]:
+    companies = {}
+    for line in text.splitlines():
+        line = re.sub(r"^[#\-\*\s]+|\*\*", "", line).strip()
+        line = DATE_RANGE.sub("", unicodedata.normalize("NFC", line))
+        for part in re.split(r"\s+[|–—-]\s+|\s+(?:at|tại)\s+|,|\(|\)", line):
+            part = part.strip(" :.")
+            lowered = part.lower()
+            if (part and len(part) <= 60 and not JOB_TITLES.search(lowered)
+                    and (COMPANY_MARKERS.search(lowered) or COMPANY_SUFFIXES.search(lowered))):
+                companies.setdefault(lowered, part)
+    return list(companies.values())
+
+
+def extract_profile(markdown: str, source: str, uploaded_at: Optional[float] = None) -> Dict[str, Any]:
+    """Hồ sơ có cấu trúc của một CV (markdown đã parse) bằng luật, không gọi LLM.
+
+    Kỹ năng lấy từ toàn bộ CV theo từ điển `SKILLS` (cách viết dễ nhầm với từ thường chỉ lấy trong
+    mục kỹ năng); bằng cấp / ngành chỉ từ mục học vấn (không có mục này thì để trống); số năm
+    kinh nghiệm và công ty từ mục kinh nghiệm (không có mục này thì chỉ dùng số năm ghi rõ trong CV).
+    """
+    markdown = unicodedata.normalize("NFC", markdown)
+    title, sections = _sections(markdown)
+    experience = _section_text(sections, EXPERIENCE_HEADINGS)
+    education = _section_text(sections, EDUCATION_HEADINGS)
+    skills = SKILL_MATCHER.names(_section_text(sections, SKILL_HEADINGS)) + UNAMBIGUOUS_SKILL_MATCHER.names(markdown)
+    return {
+        "source": source,
+        "name": title,
+        "skills": list(dict.fromkeys(skills)),
+        "years_experience": experience_years(experience) if experience.strip() else explicit_years(markdown),
+        "degrees": DEGREE_MATCHER.names(education),
+        "fields": FIELD_MATCHER.names(education),
+        "education": [line.strip("-*# ") for line in education.splitlines() if line.strip("-*# ")][:5],
+        "companies": _companies(experience),
+        "uploaded_at": uploaded_at,
+        "version": PROFILE_VERSION,
+    }
+
+
+class ProfileStore:
+    """Bảng hồ sơ ứng viên trong SQLite (`cv_profiles.db`), tra cứu theo index.
+
+    `profiles` giữ hồ sơ đầy đủ (JSON) và số năm kinh nghiệm (có index); `profile_terms` là
+    index ngược (loại, giá trị) -> CV cho kỹ năng, bằng cấp, ngành và công ty. Ghi thẳng xuống
+    file (WAL của SQLite) nên process build và process phục vụ dùng chung được.
+    """
+
+    def __init__(self, path: Optional[str] = "cv_profiles.db"):
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path or ":memory:", check_same_thread=False)
+        if path:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS profiles (
+                   source TEXT PRIMARY KEY,
+                   name TEXT,
+                   years_experience REAL,
+                   uploaded_at REAL,
+                   profile TEXT NOT NULL
+               )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_profiles_years ON profiles(years_experience)")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS profile_terms (
+                   kind TEXT NOT NULL,
+                   term TEXT NOT NULL,
+                   source TEXT NOT NULL,
+                   PRIMARY KEY (kind, term, source)
+               ) WITHOUT ROWID"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_profile_terms_source ON profile_terms(source)")
+        self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM profiles").fetchone()[0]
+
+    def sources(self) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT source FROM profiles")]
+
+    def outdated(self) -> List[str]:
+        """Các CV có hồ sơ trích xuất bằng luật cũ hơn `PROFILE_VERSION`"""
+        with self._lock:
+            return [row[0] for row in self._conn.execute(
+                "SELECT source FROM profiles WHERE COALESCE(json_extract(profile, '$.version'), 1) < ?",
+                (PROFILE_VERSION,))]
+
+    def upsert(self, profile: Dict[str, Any]):
+        source = profile["source"]
+        terms = [("skill", name.lower()) for name in profile["skills"]]
+        terms += [("degree", name.lower()) for name in profile["degrees"]]
+        terms += [("field", name.lower()) for name in profile["fields"]]
+        terms += [("company", name.lower()) for name in profile["companies"]]
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM profile_terms WHERE source = ?", (source,))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO profiles (source, name, years_experience, uploaded_at, profile) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (source, profile.get("name"), profile.get("years_experience"), profile.get("uploaded_at"),
+                 json.dumps(profile, ensure_ascii=False)),
+            )
+            self._conn.executemany("INSERT OR IGNORE INTO profile_terms (kind, term, source) VALUES (?, ?, ?)",
+                                   [(kind, term, source) for kind, term in terms])
+
+    def remove(self, sources: Iterable[str]):
+        sources = [(source,) for source in sources]
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM profile_terms WHERE source = ?", sources)
+            self._conn.executemany("DELETE FROM profiles WHERE source = ?", sources)
+
+    def get(self, source: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT profile FROM profiles WHERE source = ?", (source,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def find(self, terms: Iterable[Tuple[str, str]] = (),
+             min_years: Optional[float] = None,
+             filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Hồ sơ thoả mọi điều kiện (kind, tên) và số năm kinh nghiệm, nhiều năm kinh nghiệm hơn trước"""
+        where, params = [], []
+        for kind, name in terms:
+            where.append("source IN (SELECT source FROM profile_terms WHERE kind = ? AND term = ?)")
+            params += [kind, name.lower()]
+        if min_years is not None:
+            where.append("years_experience >= ?")
+            params.append(min_years)
+        filters = filters or {}
+        if filters.get("sources") is not None:
+            where.append(f"source IN ({','.join('?' * len(filters['sources']))})")
+            params += list(filters["sources"])
+        if filters.get("uploaded_after") is not None:
+            where.append("uploaded_at >= ?")
+            params.append(filters["uploaded_after"])
+        if filters.get("uploaded_before") is not None:
+            where.append("uploaded_at <= ?")
+            params.append(filters["uploaded_before"])
+        sql = "SELECT profile FROM profiles"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY COALESCE(years_experience, -1) DESC, source"
+        with self._lock:
+            return [json.loads(row[0]) for row in self._conn.execute(sql, params)]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# Từ để hỏi / từ nối được phép xuất hiện trong câu hỏi tra cứu hồ sơ (ngoài kỹ năng, bằng cấp, ngành)
+QUERY_WORDS = set(tokenize(
+    "có ứng viên nào ai biết về kinh nghiệm kỹ kĩ năng sử dụng dùng thành thạo tìm liệt kê cho tôi mình "
+    "những các người là được với và học vấn bằng ngành chuyên trình độ tốt nghiệp làm việc đã từng cv danh sách "
+    "hãy giúp ra hiện đang nắm vững trên hơn ít nhất tối thiểu "
+    "who which candidates candidate knows know has have with experience experienced in of skills skill list find "
+    "show me any the a an degree and does do anyone is are using use used worked work background studied cvs "
+    "people person someone at least over more than"
+))
+MIN_YEARS = re.compile(r"(\d+(?:[.,]\d+)?)\s*\+?\s*(?:năm|years?)")
+# "không" cuối câu hỏi dạng "có ... không?" chỉ là trợ từ để hỏi
+QUESTION_PARTICLE = re.compile(r"\s+không\s*[?.!]*\s*$")
+# Phủ định ("không biết Python") và cận trên ("ít hơn 3 năm") chưa được mô hình hoá trong bảng
+# hồ sơ: câu hỏi chứa chúng trả về None để đi qua RAG thay vì trả lời ngược nghĩa
+UNSUPPORTED = re.compile(r"\b(?:không|chưa|chẳng|ít hơn|dưới|tối đa|nhiều nhất|"
+                         r"not|no|without|never|less|fewer|under|below|at most|up to)\b")
+
+
+def parse_profile_query(query: str) -> Optional[Dict[str, Any]]:
+    """Nhận câu hỏi dạng "ai biết Python", "ứng viên có bằng CNTT", "trên 3 năm kinh nghiệm".
+
+    Trả về {"terms": [(kind, tên)], "min_years"} khi mọi từ trong câu đều là kỹ năng / bằng cấp /
+    ngành / số năm hoặc từ để hỏi; câu hỏi khác (so sánh, đánh giá, phủ định, cận trên) trả về None.
+    """
+    text = unicodedata.normalize("NFC", query).lower()
+    if re.search(r"\bcó\b", text):
+        text = QUESTION_PARTICLE.sub("", text)
+    if UNSUPPORTED.search(text):
+        return None
+    min_years = None
+    years = MIN_YEARS.search(text)
+    if years:
+        min_years = float(years.group(1).replace(",", "."))
+        text = text[:years.start()] + " " + text[years.end():]
+    tokens = tokenize(text)
+    terms, covered = [], set()
+    for kind, matcher in (("skill", SKILL_MATCHER), ("degree", DEGREE_MATCHER), ("field", FIELD_MATCHER)):
+        for name, start, end in matcher.find(tokens):
+            # Cụm chồng lên cụm đã nhận vẫn được tính nếu thêm token mới ("cử nhân it": bằng + ngành)
+            if not covered.issuperset(range(start, end)):
+                terms.append((kind, name))
+                covered.update(range(start, end))
+    rest = [token for i, token in enumerate(tokens) if i not in covered]
+    if not (terms or min_years is not None) or any(token not in QUERY_WORDS for token in rest):
+        return None
+    return {"terms": list(dict.fromkeys(terms)), "min_years": min_years}
+
+
+def format_profile(profile: Dict[str, Any]) -> str:
+    """Một dòng tóm tắt hồ sơ để hiển thị trong câu trả lời"""
+    parts = []
+    if profile.get("years_experience") is not None:
+        parts.append(f"{profile['years_experience']:g} năm kinh nghiệm")
+    education = ", ".join(profile.get("degrees", []) + profile.get("fields", []))
+    if education:
+        parts.append(education)
+    if profile.get("skills"):
+        parts.append("kỹ năng: " + ", ".join(profile["skills"]))
+    if profile.get("companies"):
+        parts.append("công ty: " + ", ".join(profile["companies"]))
+    name = f" ({profile['name']})" if profile.get("name") else ""
+    return f"**{profile['source']}**{name}: " + "; ".join(parts)
@@ -0,0 +1,154 @@
+import hashlib
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+DEFAULT_RERANK_MODEL = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"
+
+
+class CrossEncoderReranker:
+    """Chấm lại các chunk tìm được bằng cross-encoder chạy local trên CPU (sentence-transformers).
+
+    Các cặp (query, chunk) được chấm theo batch; điểm được cache theo (query chuẩn hoá, nội dung
+    chunk) nên query lặp lại không phải chạy lại model. Mỗi query có ngân sách `budget_ms`: trước
+    mỗi batch, thời gian dự kiến (theo tốc độ đo được) được so với phần ngân sách còn lại; nếu
+    không kịp thì giữ nguyên thứ tự FAISS. Khi chưa đo được tốc độ (lần chấm đầu tiên), một cặp được
+    chấm riêng trước để đo rồi mới xét các batch còn lại theo ngân sách. Model được load ở thread nền, trong lúc load (hoặc khi
+    không cài sentence-transformers) kết quả cũng giữ thứ tự FAISS.
+    """
+
+    def __init__(self,
+                 model_name: str = DEFAULT_RERANK_MODEL,
+                 batch_size: int = 16,
+                 budget_ms: float = 300.0,
+                 cache_size: int = 4096,
+                 max_length: int = 512,
+                 model: Optional[Any] = None):
+        self.model_name = model_name
+        self.batch_size = max(1, batch_size)
+        self.budget_ms = budget_ms
+        self.cache_size = cache_size
+        self.max_length = max_length
+        self._model = model
+        self._cache: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Thời gian chấm một cặp (ms), trung bình trượt, dùng để dự đoán batch tiếp theo
+        self._pair_ms: Optional[float] = None
+        self.hits = 0
+        self.misses = 0
+        self.fallbacks = 0
+        if model is None:
+            threading.Thread(target=self._load, name="reranker-load", daemon=True).start()
+
+    def _load(self):
+        try:
+            from sentence_transformers import CrossEncoder
+        except ImportError:
+            print("⚠️ Chưa cài sentence-transformers, bỏ qua bước rerank (pip install sentence-transformers)")
+            return
+        try:
+            start = time.perf_counter()
+            self._model = CrossEncoder(self.model_name, max_length=self.max_length, device="cpu")
+            print(f"✅ Load cross-encoder {self.model_name} trong {time.perf_counter() - start:.1f}s")
+        except Exception as e:
+            print(f"❌ Không load được cross-encoder {self.model_name}: {str(e)}")
+
+    @property
+    def ready(self) -> bool:
+        return self._model is not None
+
+    @staticmethod
+    def _key(query: str, content: str) -> str:
+        query = " ".join(unicodedata.normalize("NFC", query).lower().split())
+        return hashlib.sha1(f"{query}\x00{content}".encode("utf-8")).hexdigest()
+
+    def _cached(self, keys: List[str]) -> List[Optional[float]]:
+        with self._lock:
+            scores = []
+            for key in keys:
+                score = self._cache.get(key)
+                if score is not None:
+                    self._cache.move_to_end(key)
+                scores.append(score)
+            return scores
+
+    def _store(self, keys: List[str], scores: List[float]):
+        if self.cache_size <= 0:
+            return
+        with self._lock:
+            for key, score in zip(keys, scores):
+                self._cache[key] = score
+                self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _predict(self, pairs: List[Tuple[str, str]]) -> List[float]:
+        start = time.perf_counter()
+        scores = [float(s) for s in self._model.predict(pairs, batch_size=self.batch_size,
+                                                         show_progress_bar=False)]
+        pair_ms = (time.perf_counter() - start) * 1000 / len(pairs)
+        with self._lock:
+            self._pair_ms = pair_ms if self._pair_ms is None else 0.8 * self._pair_ms + 0.2 * pair_ms
+        return scores
+
+    def rerank(self, query: str, results: List[Dict], top_k: int) -> Tuple[List[Dict], Dict[str, Any]]:
+        """Top `top_k` chunk theo điểm cross-encoder (thêm `rerank_score`), kèm thống kê.
+
+        Nếu model chưa sẵn sàng hoặc vượt ngân sách thời gian thì trả về `top_k` chunk đầu theo
+        thứ tự FAISS (`rerank_fallback=True`); các điểm đã chấm vẫn được cache.
+        """
+        start = time.perf_counter()
+        stats = {"rerank_candidates": len(results), "rerank_cache_hits": 0,
+                 "rerank_scored": 0, "rerank_fallback": False}
+        if not results:
+            stats["rerank_ms"] = 0.0
+            return [], stats
+
+        keys = [self._key(query, result["content"]) for result in results]
+        scores = self._cached(keys)
+        missing = [i for i, score in enumerate(scores) if score is None]
+        stats["rerank_cache_hits"] = len(results) - len(missing)
+
+        fallback = bool(missing) and not self.ready
+        # Chưa biết tốc độ model: chấm thử một cặp để có số đo trước khi chạy cả batch
+        probe = missing[:1] if self._pair_ms is None else []
+        rest = missing[len(probe):]
+        batches = ([probe] if probe else []) + \
+            [rest[i:i + self.batch_size] for i in range(0, len(rest), self.batch_size)]
+        for batch in batches if not fallback else []:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            if self._pair_ms is not None and elapsed_ms + self._pair_ms * len(batch) > self.budget_ms:
+                fallback = True
+                break
+            batch_scores = self._predict([(query, results[i]["content"]) for i in batch])
+            self._store([keys[i] for i in batch], batch_scores)
+            for i, score in zip(batch, batch_scores):
+                scores[i] = score
+            stats["rerank_scored"] += len(batch)
+
+        with self._lock:
+            self.hits += stats["rerank_cache_hits"]
+            self.misses += len(missing)
+            self.fallbacks += int(fallback)
+        stats["rerank_fallback"] = fallback
+        stats["rerank_ms"] = (time.perf_counter() - start) * 1000
+        if fallback:
+            return results[:top_k], stats
+        order = sorted(range(len(results)), key=lambda i: scores[i], reverse=True)[:top_k]
+        return [{**results[i], "rerank_score": scores[i]} for i in order], stats
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "model": self.model_name,
+                "ready": self.ready,
+                "entries": len(self._cache),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "fallbacks": self.fallbacks,
+                "pair_ms": self._pair_ms,
+            }
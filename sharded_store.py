@@ -0,0 +1,412 @@
+import hashlib
+import heapq
+import json
+import multiprocessing
+import os
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain.schema import Document
+
+from process_store_class import FAISSVectorStore
+
+# Id trả về từ store nhiều shard: (shard_id << SHARD_ID_SHIFT) | id trong shard
+SHARD_ID_SHIFT = 40
+
+
+def _shard_worker(conn, threads: int):
+    """Vòng lặp của một process shard: nhận (method, args), gọi FAISSVectorStore, gửi lại (ok, kết quả)"""
+    import faiss
+
+    faiss.omp_set_num_threads(threads)
+    store = FAISSVectorStore()
+    queries = {
+        "sources": lambda: store.metadata.sources(),
+        "source_counts": lambda: store.metadata.source_counts(),
+        "count": lambda: len(store.metadata),
+        "ntotal": lambda: store.ntotal,
+    }
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        method, args = message
+        try:
+            result = queries[method]() if method in queries else getattr(store, method)(*args)
+            conn.send((True, result))
+        except Exception as e:
+            conn.send((False, f"{type(e).__name__}: {e}"))
+    store.close_log()
+
+
+class _Shard:
+    """Một process chứa FAISSVectorStore của shard, gọi qua Pipe (mỗi lần một request)"""
+
+    def __init__(self, shard_id: int, threads: int):
+        context = multiprocessing.get_context("spawn")
+        self.shard_id = shard_id
+        self.conn, child = context.Pipe()
+        self.process = context.Process(target=_shard_worker, args=(child, threads),
+                                       name=f"faiss-shard-{shard_id}", daemon=True)
+        self.process.start()
+        child.close()
+        self._lock = threading.Lock()
+
+    def call(self, method: str, *args):
+        with self._lock:
+            self.conn.send((method, args))
+            ok, result = self.conn.recv()
+        if not ok:
+            raise RuntimeError(f"Shard {self.shard_id}: {result}")
+        return result
+
+    def close(self):
+        with self._lock:
+            try:
+                self.conn.send(None)
+            except (OSError, ValueError):
+                pass
+            self.process.join(timeout=10)
+            if self.process.is_alive():
+                self.process.terminate()
+            self.conn.close()
+
+
+def _close_shards(shards: Dict[int, _Shard]):
+    for shard in list(shards.values()):
+        shard.close()
+
+
+class ShardedMetadata:
+    """Thông tin metadata gộp từ các shard (chỉ đọc: `sources()`, `source_counts()` và số chunk)"""
+
+    def __init__(self, store: "ShardedVectorStore"):
+        self._store = store
+
+    def sources(self) -> List[str]:
+        return [source for sources in self._store._fan_out("sources") for source in sources]
+
+    def source_counts(self) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for shard_counts in self._store._fan_out("source_counts"):
+            for source, count in shard_counts.items():
+                counts[source] = counts.get(source, 0) + count
+        return counts
+
+    def __len__(self) -> int:
+        return sum(self._store._fan_out("count"))
+
+    def __bool__(self) -> bool:
+        return len(self) > 0
+
+
+class ShardedVectorStore:
+    """Vector store chia chunk ra nhiều shard, mỗi shard là một FAISSVectorStore trong process riêng.
+
+    Mỗi file CV (`metadata.source`) thuộc đúng một shard, chọn bằng rendezvous hashing trên
+    (shard_id, source): thêm hoặc bỏ một shard chỉ chuyển các CV thuộc shard đó, các CV khác
+    giữ nguyên chỗ. Query được gửi song song tới các shard (chỉ các shard chứa CV trong
+    `filters["sources"]` nếu có) rồi gộp top-k theo điểm; điểm cosine của các shard so sánh được
+    trực tiếp, còn điểm BM25 dùng IDF của từng shard nên chỉ xấp xỉ so với một index chung.
+
+    Cùng interface với FAISSVectorStore (`add_documents`, `upsert_source`, `remove_sources`,
+    `search`, `search_batch`, `search_lexical`, `save`, `commit`, `load`). File của shard `n`
+    nằm cạnh `index_path` / `metadata_path` (`cv_index.shard{n}.faiss`, `cv_metadata.shard{n}.db`),
+    danh sách shard trong `cv_index.shards.json`.
+    """
+
+    def __init__(self, n_shards: int = 2, threads: Optional[int] = None):
+        self.n_shards = max(1, n_shards)
+        self.threads = threads or max(1, (os.cpu_count() or 1) // self.n_shards)
+        self.version = 0
+        self.metadata = ShardedMetadata(self)
+        self._lock = threading.RLock()
+        self._paths: Optional[Tuple[str, str]] = None
+        self._shards: Dict[int, _Shard] = {}
+        self._executor = ThreadPoolExecutor(max_workers=max(4, 2 * self.n_shards),
+                                            thread_name_prefix="faiss-shard-client")
+        # Dừng các process shard khi store không còn được dùng (ví dụ sau hot swap)
+        self._finalizer = weakref.finalize(self, _close_shards, self._shards)
+        self._start(range(self.n_shards))
+
+    # --- Quản lý shard ---
+
+    def _start(self, shard_ids):
+        shards = [_Shard(shard_id, self.threads) for shard_id in shard_ids if shard_id not in self._shards]
+        self._shards.update((shard.shard_id, shard) for shard in shards)
+
+    @staticmethod
+    def _weight(shard_id: int, source: str) -> bytes:
+        return hashlib.md5(f"{shard_id}:{source}".encode("utf-8")).digest()
+
+    def _owner(self, source: str, shard_ids: Optional[List[int]] = None) -> int:
+        return max(shard_ids if shard_ids is not None else self._shards,
+                   key=lambda shard_id: self._weight(shard_id, source))
+
+    def _shard_paths(self, shard_id: int, paths: Optional[Tuple[str, str]] = None) -> Tuple[str, str]:
+        index_path, metadata_path = paths or self._paths
+        index_stem, index_ext = os.path.splitext(index_path)
+        metadata_stem, metadata_ext = os.path.splitext(metadata_path)
+        return f"{index_stem}.shard{shard_id}{index_ext}", f"{metadata_stem}.shard{shard_id}{metadata_ext}"
+
+    @staticmethod
+    def _manifest_path(index_path: str) -> str:
+        return f"{os.path.splitext(index_path)[0]}.shards.json"
+
+    def _write_manifest(self, index_path: Optional[str] = None):
+        path = self._manifest_path(index_path or self._paths[0])
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            json.dump({"shards": sorted(self._shards)}, f)
+        os.replace(f"{path}.tmp", path)
+
+    def _fan_out(self, method: str, *args, shards: Optional[List[_Shard]] = None) -> List[Any]:
+        """Gọi `method` trên các shard song song, kết quả theo thứ tự shard"""
+        shards = list(self._shards.values()) if shards is None else shards
+        return list(self._executor.map(lambda shard: shard.call(method, *args), shards))
+
+    def _move(self, source_shard: _Shard, target_shard: _Shard, sources: List[str]) -> int:
+        """Chuyển các CV sang shard khác: ghi vào shard đích trước rồi mới xoá ở shard nguồn"""
+        if not sources:
+            return 0
+        documents, embeddings = source_shard.call("export_sources", sources)
+        groups: Dict[str, List[int]] = {}
+        for row, doc in enumerate(documents):
+            groups.setdefault(doc.metadata.get("source", ""), []).append(row)
+        for source, rows in groups.items():
+            target_shard.call("upsert_source", source, [documents[i] for i in rows], embeddings[rows])
+        source_shard.call("remove_sources", sources)
+        return len(documents)
+
+    def add_shard(self) -> int:
+        """Thêm một shard và chuyển sang đó các CV mà nó sở hữu; trả về số chunk đã chuyển"""
+        with self._lock:
+            shard_id = max(self._shards, default=-1) + 1
+            self._start([shard_id])
+            new_shard = self._shards[shard_id]
+            if self._paths is not None:
+                # Snapshot rỗng để shard mới có delta log ngay từ đầu
+                new_shard.call("save", *self._shard_paths(shard_id))
+            moved = 0
+            for shard in [s for s in self._shards.values() if s is not new_shard]:
+                sources = [source for source in shard.call("sources") if self._owner(source) == shard_id]
+                moved += self._move(shard, new_shard, sources)
+            if self._paths is not None:
+                self._write_manifest()
+            self.n_shards = len(self._shards)
+            self.version += 1
+            print(f"🧩 Thêm shard {shard_id}: chuyển {moved} chunks")
+            return moved
+
+    def remove_shard(self, shard_id: Optional[int] = None) -> int:
+        """Bỏ một shard (mặc định shard cuối), chuyển CV của nó sang các shard còn lại"""
+        with self._lock:
+            if len(self._shards) <= 1:
+                raise ValueError("Cần giữ lại ít nhất một shard")
+            shard_id = max(self._shards) if shard_id is None else shard_id
+            shard = self._shards[shard_id]
+            remaining = [i for i in self._shards if i != shard_id]
+            targets: Dict[int, List[str]] = {}
+            for source in shard.call("sources"):
+                targets.setdefault(self._owner(source, remaining), []).append(source)
+            moved = sum(self._move(shard, self._shards[target], sources) for target, sources in targets.items())
+            del self._shards[shard_id]
+            if self._paths is not None:
+                self._write_manifest()
+            shard.close()
+            self.n_shards = len(self._shards)
+            self.version += 1
+            print(f"🧩 Bỏ shard {shard_id}: chuyển {moved} chunks")
+            return moved
+
+    def close(self):
+        """Dừng toàn bộ process shard"""
+        self._finalizer()
+        self._executor.shutdown(wait=False)
+
+    # --- Thay đổi dữ liệu ---
+
+    def add_documents(self, documents: List[Document], embeddings: np.ndarray):
+        """Thêm document và embedding, mỗi chunk vào shard sở hữu CV của nó"""
+        with self._lock:
+            groups: Dict[int, List[int]] = {}
+            for row, doc in enumerate(documents):
+                groups.setdefault(self._owner(doc.metadata.get("source", "")), []).append(row)
+            embeddings = np.asarray(embeddings, dtype=np.float32)
+            list(self._executor.map(
+                lambda item: self._shards[item[0]].call(
+                    "add_documents", [documents[i] for i in item[1]], embeddings[item[1]]),
+                groups.items(),
+            ))
+            self.version += 1
+
+    def upsert_source(self, filename: str, documents: List[Document], embeddings: np.ndarray) -> int:
+        with self._lock:
+            removed = self._shards[self._owner(filename)].call("upsert_source", filename, documents, embeddings)
+            self.version += 1
+            return removed
+
+    def remove_sources(self, sources: List[str]) -> int:
+        with self._lock:
+            groups: Dict[int, List[str]] = {}
+            for source in sources:
+                groups.setdefault(self._owner(source), []).append(source)
+            removed = sum(self._executor.map(
+                lambda item: self._shards[item[0]].call("remove_sources", item[1]), groups.items()
+            ))
+            if removed:
+                self.version += 1
+            return removed
+
+    def remove_source(self, filename: str) -> int:
+        return self.remove_sources([filename])
+
+    def export_sources(self, sources: List[str]):
+        """(documents, embeddings) hiện có của các file nguồn, lấy từ shard sở hữu từng file"""
+        with self._lock:
+            groups: Dict[int, List[str]] = {}
+            for source in sources:
+                groups.setdefault(self._owner(source), []).append(source)
+            parts = [self._shards[shard_id].call("export_sources", names) for shard_id, names in groups.items()]
+        documents = [doc for docs, _ in parts for doc in docs]
+        embeddings = [vectors for _, vectors in parts if len(vectors)]
+        if not embeddings:
+            return [], np.zeros((0, 0), dtype=np.float32)
+        return documents, np.vstack(embeddings)
+
+    def source_chunks(self, source: str) -> List[Dict[str, Any]]:
+        """Các chunk đã lưu của một file nguồn, lấy từ shard sở hữu file"""
+        with self._lock:
+            shard = self._shards[self._owner(source)]
+        return shard.call("source_chunks", source)
+
+    # --- Tìm kiếm ---
+
+    @property
+    def ntotal(self) -> int:
+        return sum(self._fan_out("ntotal"))
+
+    def _target_shards(self, filters: Optional[Dict[str, Any]]) -> List[_Shard]:
+        shards = dict(self._shards)
+        sources = (filters or {}).get("sources")
+        if sources is None:
+            return list(shards.values())
+        owners = {self._owner(source, list(shards)) for source in sources}
+        return [shard for shard_id, shard in shards.items() if shard_id in owners]
+
+    @staticmethod
+    def _with_shard_ids(results: List[Dict], shard_id: int) -> List[Dict]:
+        return [{**result, "id": (shard_id << SHARD_ID_SHIFT) | result["id"]} for result in results]
+
+    def search(self, query_embedding: np.ndarray, k: int = 5,
+               filters: Optional[Dict[str, Any]] = None) -> List[Dict]:
+        return self.search_batch(np.asarray(query_embedding).reshape(1, -1), k=k, filters=filters)[0]
+
+    def search_batch(self, query_embeddings: np.ndarray, k: int = 5,
+                     filters: Optional[Dict[str, Any]] = None) -> List[List[Dict]]:
+        """Gửi query tới các shard song song rồi gộp top-k của từng query theo điểm"""
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        shards = self._target_shards(filters)
+        if not shards or len(queries) == 0:
+            return [[] for _ in queries]
+        per_shard = self._fan_out("search_batch", queries, k, filters, shards=shards)
+        return [
+            heapq.nlargest(k, (result for shard, results in zip(shards, per_shard)
+                               for result in self._with_shard_ids(results[row], shard.shard_id)),
+                           key=lambda r: r["score"])
+            for row in range(len(queries))
+        ]
+
+    def search_lexical(self, query: str, k: int = 5,
+                       filters: Optional[Dict[str, Any]] = None) -> List[Dict]:
+        shards = self._target_shards(filters)
+        if not shards:
+            return []
+        per_shard = self._fan_out("search_lexical", query, k, filters, shards=shards)
+        return heapq.nlargest(k, (result for shard, results in zip(shards, per_shard)
+                                  for result in self._with_shard_ids(results, shard.shard_id)),
+                              key=lambda r: r["score"])
+
+    # --- Lưu / load ---
+
+    def save(self, index_path: str, metadata_path: str):
+        """Lưu snapshot của mọi shard (song song) và danh sách shard"""
+        with self._lock:
+            self._paths = (index_path, metadata_path)
+            list(self._executor.map(lambda shard: shard.call("save", *self._shard_paths(shard.shard_id)),
+                                    list(self._shards.values())))
+            self._write_manifest()
+
+    def commit(self, index_path: str, metadata_path: str):
+        """Đảm bảo thay đổi đã ghi bền ở mọi shard (qua delta log của shard nếu có)"""
+        with self._lock:
+            self._paths = (index_path, metadata_path)
+            list(self._executor.map(lambda shard: shard.call("commit", *self._shard_paths(shard.shard_id)),
+                                    list(self._shards.values())))
+            self._write_manifest()
+
+    def close_log(self):
+        self._fan_out("close_log")
+
+    def snapshot_to(self, index_path: str, metadata_path: str):
+        """Ghi snapshot của mọi shard và danh sách shard ra đường dẫn khác, không đổi file đang gắn"""
+        with self._lock:
+            paths = (index_path, metadata_path)
+            list(self._executor.map(
+                lambda shard: shard.call("snapshot_to", *self._shard_paths(shard.shard_id, paths)),
+                list(self._shards.values())))
+            self._write_manifest(index_path)
+
+    def load(self, index_path: str, metadata_path: str) -> bool:
+        """Load các shard theo `cv_index.shards.json`, rồi thêm/bỏ shard cho khớp `n_shards`.
+
+        Nếu chỉ có index một store (chưa chia shard) thì chia CV của nó ra các shard và lưu lại.
+        """
+        with self._lock:
+            manifest_path = self._manifest_path(index_path)
+            self._paths = (index_path, metadata_path)
+            if not os.path.exists(manifest_path):
+                return self._migrate(index_path, metadata_path)
+
+            with open(manifest_path, encoding="utf-8") as f:
+                shard_ids = json.load(f)["shards"]
+            for shard_id in [i for i in self._shards if i not in shard_ids]:
+                self._shards.pop(shard_id).close()
+            self._start(shard_ids)
+            list(self._executor.map(lambda shard: shard.call("load", *self._shard_paths(shard.shard_id)),
+                                    list(self._shards.values())))
+            while len(self._shards) < self.n_shards:
+                self.add_shard()
+            while len(self._shards) > self.n_shards:
+                self.remove_shard()
+            self.n_shards = len(self._shards)
+            self.version += 1
+            return True
+
+    def _migrate(self, index_path: str, metadata_path: str) -> bool:
+        single = FAISSVectorStore(wal=False)
+        if not single.load(index_path, metadata_path):
+            return False
+        print(f"🧩 Chia index hiện có ra {len(self._shards)} shard")
+        groups: Dict[int, List[str]] = {}
+        for source in single.metadata.sources():
+            groups.setdefault(self._owner(source), []).append(source)
+        for shard_id, sources in groups.items():
+            documents, embeddings = single.export_sources(sources)
+            self._shards[shard_id].call("add_documents", documents, embeddings)
+        self.save(index_path, metadata_path)
+        self.version += 1
+        return True
+
+
+def create_vector_store():
+    """FAISSVectorStore, hoặc ShardedVectorStore khi FAISS_SHARDS > 1"""
+    n_shards = int(os.getenv("FAISS_SHARDS", "1"))
+    if n_shards > 1:
+        return ShardedVectorStore(n_shards)
+    return FAISSVectorStore()
@@ -27,5 +27,5 @@ for filename in os.listdir(cv_folder):
         vector_store.add_documents(docs, embeddings)
 
 # 5. Lưu FAISS và metadata
-vector_store.save("cv_index.faiss", "cv_metadata.json")
+vector_store.save("cv_index.faiss", "cv_metadata.db")
 
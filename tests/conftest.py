@@ -0,0 +1,73 @@
+import os
+import sys
+
+# Các module nằm ở thư mục gốc của repo (không phải package)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GOOGLE_API_KEY", "test")
+os.environ.setdefault("EMBED_CACHE_PATH", "")
+os.environ.setdefault("PARSE_CACHE_DIR", "")
+
+import hashlib
+
+import numpy as np
+import pytest
+
+CVS = {
+    "a.pdf": ["# Nguyễn Văn A\n## Skills\nPython, Django, Docker, PostgreSQL",
+              "## Work Experience\nBackend developer tại FPT Software, xây dựng REST API bằng Django",
+              "## Education\nKỹ sư Công nghệ thông tin, Đại học Bách Khoa"],
+    "b.pdf": ["# Trần Thị B\n## Skills\nJava, Spring Boot, Kubernetes, AWS",
+              "## Work Experience\nJava developer tại Viettel, vận hành Kubernetes trên AWS"],
+    "c.pdf": ["# Lê Văn C\n## Skills\nReact, TypeScript, Figma",
+              "## Work Experience\nFrontend developer, thiết kế giao diện React với Figma"],
+}
+
+
+def bag_of_words(texts, dim):
+    """Embedding giả: túi từ băm vào `dim` chiều, câu có từ chung thì gần nhau"""
+    from lexical_index import tokenize
+
+    out = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for token in tokenize(text):
+            out[row, int(hashlib.md5(token.encode("utf-8")).hexdigest()[:8], 16) % (dim - 1)] += 1.0
+        out[row, dim - 1] = 0.01
+    return out
+
+
+@pytest.fixture
+def make_chatbot(tmp_path, monkeypatch):
+    """CVChatBot trên một store nhỏ (CVS) với embedding giả; Gemini được thay bằng hàm đếm số lần gọi"""
+    from langchain.schema import Document
+
+    from model_infer import CVChatBot
+    from process_store_class import FAISSVectorStore
+
+    def make(**env):
+        for key, value in env.items():
+            monkeypatch.setenv(key, value)
+        paths = {name: str(tmp_path / name) for name in ("cv_index.faiss", "cv_metadata.db", "cv_profiles.db")}
+        store = FAISSVectorStore(wal=False)
+        for upload, (source, chunks) in enumerate(CVS.items()):
+            documents = [Document(page_content=text, metadata={"source": source, "chunk_id": i,
+                                                               "uploaded_at": 1000.0 * (upload + 1)})
+                         for i, text in enumerate(chunks)]
+            store.add_documents(documents, bag_of_words(chunks, store.dimension))
+        store.save(paths["cv_index.faiss"], paths["cv_metadata.db"])
+        store.close()
+
+        bot = CVChatBot(paths["cv_index.faiss"], paths["cv_metadata.db"], profile_path=paths["cv_profiles.db"])
+        dimension = bot.vector_store.dimension
+        monkeypatch.setattr(bot.cv_processor, "get_embeddings", lambda texts: bag_of_words(texts, dimension))
+        bot.generated = []
+
+        def generate_answer(query, context):
+            bot.generated.append(query)
+            return f"answer {len(bot.generated)}"
+
+        monkeypatch.setattr(bot, "generate_answer", generate_answer)
+        monkeypatch.setattr(bot, "generate_answer_stream",
+                            lambda query, context: iter([generate_answer(query, context)]))
+        return bot
+
+    return make
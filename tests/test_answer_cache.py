@@ -0,0 +1,55 @@
+import numpy as np
+from langchain.schema import Document
+
+from answer_cache import AnswerCache
+from conftest import bag_of_words
+
+
+def test_exact_semantic_and_scope():
+    cache = AnswerCache(similarity_threshold=0.9)
+    embedding = np.array([1.0, 0.0, 0.0])
+    cache.put("Ai biết Python?", 5, 1, {"answer": "a"}, embedding)
+    assert cache.get("ai  biết python", 5, 1, exact_only=True) == {"answer": "a"}
+    assert cache.get("Ứng viên nào dùng Python", 5, 1, np.array([0.99, 0.1, 0.0])) == {"answer": "a"}
+    assert cache.get("Ứng viên nào dùng Java", 5, 1, np.array([0.0, 1.0, 0.0])) is None
+    assert cache.get("Ai biết Python?", 3, 1) is None
+    assert cache.get("Ai biết Python?", 5, 1, scope='{"sources": ["a.pdf"]}') is None
+    assert cache.stats()["exact_hits"] == 1 and cache.stats()["semantic_hits"] == 1
+
+
+def test_index_change_invalidates_and_stale_put_is_dropped():
+    cache = AnswerCache()
+    cache.put("q", 5, 1, {"answer": "old"})
+    assert cache.get("q", 5, 2) is None
+    cache.put("q", 5, 1, {"answer": "computed on version 1"})
+    assert cache.get("q", 5, 2) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_chat_answers_from_cache_until_index_changes(make_chatbot):
+    bot = make_chatbot(STRUCTURED_ANSWERS="0")
+    first = bot.chat("kinh nghiệm Django", top_k=2)
+    again = bot.chat("Kinh nghiệm   Django?", top_k=2)
+    assert again["answer"] == first["answer"] and again["stats"]["cached"]
+    assert bot.generated == ["kinh nghiệm Django"]
+
+    store = bot.vector_store
+    store.add_documents([Document(page_content="Django REST framework", metadata={"source": "d.pdf"})],
+                        bag_of_words(["Django REST framework"], store.dimension))
+    assert "cached" not in bot.chat("kinh nghiệm Django", top_k=2)["stats"]
+    assert len(bot.generated) == 2
+
+
+def test_answer_is_not_cached_when_index_changes_during_generation(make_chatbot, monkeypatch):
+    bot = make_chatbot(STRUCTURED_ANSWERS="0")
+    store = bot.vector_store
+
+    def generate_while_uploading(query, context):
+        store.remove_source("b.pdf")
+        bot.generated.append(query)
+        return "answer computed before the delete"
+
+    monkeypatch.setattr(bot, "generate_answer", generate_while_uploading)
+    bot.chat("kinh nghiệm Kubernetes", top_k=2)
+    assert "cached" not in bot.chat("kinh nghiệm Kubernetes", top_k=2)["stats"]
+    assert len(bot.generated) == 2
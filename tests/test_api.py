@@ -0,0 +1,77 @@
+import os
+
+import benchmark
+
+
+def test_load_test_against_stub_api(capsys):
+    benchmark.bench_load_test("", [1, 4], requests_per_user=2, chat_latency=0.01)
+    output = capsys.readouterr().out
+    assert "  1 users: p50" in output and "  4 users: p50" in output
+
+
+def test_chat_stream_sse_events(make_chatbot, monkeypatch):
+    import json
+
+    from fastapi.testclient import TestClient
+
+    import api
+
+    monkeypatch.setattr(api, "chatbot", make_chatbot(STRUCTURED_ANSWERS="0"))
+    with TestClient(api.app) as client:
+        response = client.post("/chat/stream", json={"query": "kinh nghiệm Django", "top_k": 2})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [json.loads(block.split("data: ", 1)[1]) for block in response.text.strip().split("\n\n")]
+    assert [event["type"] for event in events] == ["sources", "token", "done"]
+    assert events[0]["sources"][0]["metadata"]["source"] == "a.pdf"
+    assert events[2]["answer"] == events[1]["text"] == "answer 1"
+
+
+def test_chat_stream_matches_chat(make_chatbot):
+    bot = make_chatbot(STRUCTURED_ANSWERS="0", ANSWER_CACHE_MAX_ENTRIES="0")
+    events = list(bot.chat_stream("kinh nghiệm Kubernetes", top_k=2))
+    result = bot.chat("kinh nghiệm Kubernetes", top_k=2)
+    assert events[0]["context"] == result["context"]
+    assert "".join(event["text"] for event in events if event["type"] == "token") == events[-1]["answer"]
+    assert events[-1]["stats"]["first_token_ms"] >= 0
+
+
+def test_upload_job_holds_index_lock_only_to_write(make_chatbot, monkeypatch, tmp_path):
+    import api
+    from conftest import bag_of_words
+    from jobs import IngestionJob
+    from process_store_class import CVProcessor
+
+    bot = make_chatbot()
+    holder = bot.index_holder
+    holds = []
+
+    class FakeProcessor(CVProcessor):
+        def __init__(self):
+            super().__init__(parse_cache_dir="")
+
+        def parse_cv_to_markdown(self, filepath):
+            holds.append(holder.lock._readers)
+            with open(filepath, encoding="utf-8") as f:
+                return f.read()
+
+        def get_embeddings(self, texts):
+            holds.append(holder.lock._readers)
+            return bag_of_words(texts, self.embedding_dim)
+
+    monkeypatch.setattr(api, "chatbot", bot)
+    monkeypatch.setattr(api, "CVProcessor", FakeProcessor)
+    workdir = tmp_path / "workdir"
+    (workdir / "cv").mkdir(parents=True)
+    (workdir / "cv" / "d.pdf").write_text("# Phạm Văn D\n## Skills\nGo, Rust", encoding="utf-8")
+    (workdir / "cv" / "empty.pdf").write_text("", encoding="utf-8")
+    monkeypatch.chdir(workdir)
+
+    result = api.ingest_uploaded_cvs(IngestionJob("upload", ["d.pdf", "empty.pdf"]))
+    assert result == {"indexed": 1, "failed": ["empty.pdf"]}
+    assert holds and not any(holds)
+    assert not (workdir / "cv" / "empty.pdf").exists()
+    # Commit ghi vào file của holder, không phải cv_index.faiss trong thư mục hiện tại
+    assert not os.path.exists("cv_index.faiss") and not os.path.exists("cv_metadata.db")
+    assert "d.pdf" in holder.current.metadata.sources()
+    assert os.path.getsize(holder.index_path + ".wal") > 0
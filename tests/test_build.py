@@ -0,0 +1,104 @@
+import hashlib
+import os
+
+import numpy as np
+
+import main
+from manifest import IndexManifest
+from process_store_class import CVProcessor, FAISSVectorStore
+
+
+class FakeProcessor(CVProcessor):
+    """CVProcessor đọc "PDF" là file text và sinh embedding từ hash, không gọi Gemini / Ollama"""
+
+    parsed = []
+
+    def __init__(self):
+        super().__init__(parse_cache_dir="")
+        self.embedding_cache = None
+
+    def parse_cv_to_markdown(self, filepath):
+        FakeProcessor.parsed.append(os.path.basename(filepath))
+        with open(filepath, encoding="utf-8") as f:
+            return f.read()
+
+    def get_embeddings(self, texts):
+        rows = [np.random.default_rng(int(hashlib.md5(t.encode()).hexdigest()[:8], 16))
+                .standard_normal(self.embedding_dim) for t in texts]
+        return np.array(rows, dtype=np.float32).reshape(len(texts), self.embedding_dim)
+
+
+def write_cv(folder, name, text):
+    with open(os.path.join(folder, name), "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def build(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "CVProcessor", FakeProcessor)
+    FakeProcessor.parsed = []
+    paths = {name: str(tmp_path / name) for name in
+             ("cv_index.faiss", "cv_metadata.db", "cv_manifest.json", "cv_profiles.db")}
+    assert main.build_vector_store(str(tmp_path / "cv"), paths["cv_index.faiss"], paths["cv_metadata.db"],
+                                   paths["cv_manifest.json"], paths["cv_profiles.db"], parse_workers=2)
+    store = FAISSVectorStore()
+    assert store.load(paths["cv_index.faiss"], paths["cv_metadata.db"])
+    return store
+
+
+def test_manifest_diff(tmp_path):
+    for name in ("a.pdf", "b.pdf", "c.pdf"):
+        write_cv(tmp_path, name, name)
+    manifest = IndexManifest(str(tmp_path / "manifest.json"))
+    for name in ("a.pdf", "b.pdf", "c.pdf"):
+        manifest.record(str(tmp_path), name)
+    write_cv(tmp_path, "b.pdf", "changed")
+    os.utime(tmp_path / "a.pdf", (0, 12345))  # mtime đổi nhưng nội dung giữ nguyên
+    write_cv(tmp_path, "d.pdf", "new")
+    changed, unchanged, deleted = manifest.diff(str(tmp_path), ["a.pdf", "b.pdf", "d.pdf"])
+    assert sorted(changed) == ["b.pdf", "d.pdf"]
+    assert unchanged == ["a.pdf"]
+    assert deleted == ["c.pdf"]
+    assert manifest.files["a.pdf"]["mtime"] == 12345
+
+
+def test_incremental_build_only_processes_changed_files(tmp_path, monkeypatch):
+    folder = tmp_path / "cv"
+    folder.mkdir()
+    for name in ("a.pdf", "b.pdf", "c.pdf"):
+        write_cv(folder, name, f"# {name}\n## Skills\nPython, Docker\n")
+    store = build(tmp_path, monkeypatch)
+    assert sorted(FakeProcessor.parsed) == ["a.pdf", "b.pdf", "c.pdf"]
+    assert sorted(store.metadata.sources()) == ["a.pdf", "b.pdf", "c.pdf"]
+
+    write_cv(folder, "b.pdf", "# b.pdf\n## Skills\nJava\n")
+    os.remove(folder / "c.pdf")
+    store = build(tmp_path, monkeypatch)
+    assert FakeProcessor.parsed == ["b.pdf"]
+    assert sorted(store.metadata.sources()) == ["a.pdf", "b.pdf"]
+    assert store.ntotal == len(store.metadata)
+    assert "Java" in store.metadata[store.metadata.ids_for_sources(["b.pdf"])[0]]["content"]
+
+
+def test_missing_profiles_are_rebuilt_from_stored_chunks(tmp_path, monkeypatch):
+    from profiles import ProfileStore
+
+    folder = tmp_path / "cv"
+    folder.mkdir()
+    filler = "\n".join(f"Dự án {i}: phát triển hệ thống quản lý nội bộ cho khách hàng" for i in range(40))
+    write_cv(folder, "a.pdf", f"# a.pdf\n## Skills\nPython, Docker\n## Projects\n{filler}\n## Tools\nKubernetes\n")
+    store = build(tmp_path, monkeypatch)
+    assert len(store.metadata.ids_for_sources(["a.pdf"])) > 1
+    os.remove(tmp_path / "cv_profiles.db")
+
+    build(tmp_path, monkeypatch)
+    assert FakeProcessor.parsed == []
+    profile = ProfileStore(str(tmp_path / "cv_profiles.db")).find([("skill", "Kubernetes")])[0]
+    assert profile["source"] == "a.pdf"
+    assert {"Python", "Docker", "Kubernetes"} <= set(profile["skills"])
+
+
+def test_join_chunks_removes_overlap():
+    chunks = [{"content": "Python, Docker và Kubernetes"}, {"content": "Docker và Kubernetes trên AWS"},
+              {"content": "Học vấn"}]
+    assert main.join_chunks(chunks, overlap_chars=100) == "Python, Docker và Kubernetes trên AWS\nHọc vấn"
+    assert main.join_chunks([], overlap_chars=100) == ""
@@ -0,0 +1,44 @@
+import pytest
+
+from candidates import aggregate_candidates, interleave_candidates
+
+
+def chunk(source, score, chunk_id=0):
+    return {"content": f"{source}-{chunk_id}", "score": score,
+            "metadata": {"source": source, "chunk_id": chunk_id}}
+
+
+RESULTS = [chunk("long.pdf", 0.6, i) for i in range(5)] + [chunk("short.pdf", 0.9), chunk("other.pdf", 0.5)]
+
+
+def test_aggregate_max_and_sum():
+    by_max = aggregate_candidates(RESULTS, top_n=3, chunks_per_candidate=2, score_mode="max")
+    assert [c["source"] for c in by_max] == ["short.pdf", "long.pdf", "other.pdf"]
+    assert [len(c["chunks"]) for c in by_max] == [1, 2, 1]
+
+    # "sum" chỉ cộng tối đa chunks_per_candidate chunk nên CV dài không thắng chỉ nhờ số lượng
+    by_sum = aggregate_candidates(RESULTS, top_n=2, chunks_per_candidate=2, score_mode="sum")
+    assert [c["source"] for c in by_sum] == ["long.pdf", "short.pdf"]
+    assert by_sum[0]["score"] == pytest.approx(1.2)
+    with pytest.raises(ValueError):
+        aggregate_candidates(RESULTS, top_n=2, score_mode="mean")
+
+
+def test_interleave_puts_every_candidate_first():
+    candidates = aggregate_candidates(RESULTS, top_n=3, chunks_per_candidate=2)
+    ordered = interleave_candidates(candidates)
+    assert [c["metadata"]["source"] for c in ordered] == ["short.pdf", "long.pdf", "other.pdf", "long.pdf"]
+    assert [c["candidate_rank"] for c in ordered] == [1, 2, 3, 2]
+    assert ordered[1]["candidate_score"] == candidates[1]["score"]
+    assert interleave_candidates([]) == []
+
+
+def test_search_candidates_returns_distinct_cvs(make_chatbot):
+    bot = make_chatbot(CANDIDATE_OVERFETCH="1", CANDIDATE_CHUNKS="1")
+    candidates = bot.search_candidates("Python Django Java React", top_n=3)
+    assert sorted(c["source"] for c in candidates) == ["a.pdf", "b.pdf", "c.pdf"]
+    assert all(len(c["chunks"]) == 1 for c in candidates)
+
+    context, sources = bot.search_relevant_context("kinh nghiệm developer", top_k=3, group_by_candidate=True)
+    assert {s["metadata"]["source"] for s in sources} == {"a.pdf", "b.pdf", "c.pdf"}
+    assert all(f"### {name}" in context for name in ("a.pdf", "b.pdf", "c.pdf"))
@@ -0,0 +1,35 @@
+from context_builder import ContextBuilder, estimate_tokens
+
+
+def _chunk(source, chunk_id, content, score):
+    return {"content": content, "score": score, "metadata": {"source": source, "chunk_id": chunk_id}}
+
+
+def test_budget_counts_headers_and_separators():
+    # Nhiều chunk ngắn từ nhiều CV: header "### ... (Score: ...)" chiếm phần lớn context
+    results = [_chunk(f"candidate_{i:03d}_curriculum_vitae.pdf", j * 2, f"Skill {i}-{j}: python sql docker", 1.0 - i / 1000)
+               for i in range(60) for j in range(3)]
+    for max_tokens in (50, 200, 1000):
+        context, selected, stats = ContextBuilder(max_tokens=max_tokens).build(results)
+        assert selected
+        assert len(context) <= max_tokens * 4
+        assert estimate_tokens(context) <= max_tokens
+        assert stats["context_tokens"] <= max_tokens
+
+
+def test_adjacent_chunks_are_merged_without_overlap():
+    first = "Kinh nghiệm: 3 năm phát triển backend với Python và FastAPI tại công ty ABC"
+    second = "Python và FastAPI tại công ty ABC, sau đó chuyển sang làm data engineer"
+    results = [_chunk("a.pdf", 0, first, 0.9), _chunk("a.pdf", 1, second, 0.8)]
+    context, selected, stats = ContextBuilder(max_tokens=1000).build(results)
+    assert len(selected) == 2
+    assert "\n...\n" not in context
+    assert stats["overlap_chars_removed"] > 0
+    assert context.count("Python và FastAPI") == 1
+
+
+def test_oversized_first_chunk_is_truncated_to_budget():
+    results = [_chunk("a.pdf", 0, "x " * 2000, 0.9)]
+    context, selected, _ = ContextBuilder(max_tokens=100).build(results)
+    assert len(selected) == 1
+    assert len(context) <= 400
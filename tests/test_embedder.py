@@ -0,0 +1,57 @@
+import threading
+
+import numpy as np
+
+from process_store_class import BatchEmbedder
+
+
+class FakeClient:
+    """Thay ollama.Client: embedding của text "t<i>" là [i, 1, 0, 0]"""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.batches = []
+        self._lock = threading.Lock()
+
+    def embed(self, model, input):
+        with self._lock:
+            self.batches.append(list(input))
+            if self.failures:
+                self.failures -= 1
+                raise ConnectionError("ollama unavailable")
+        return {"embeddings": [[float(text[1:]), 1.0, 0.0, 0.0] for text in input]}
+
+
+def make_embedder(client, **kwargs):
+    embedder = BatchEmbedder(dimension=4, retry_backoff=0, **kwargs)
+    embedder.client = client
+    return embedder
+
+
+def test_batches_keep_input_order():
+    client = FakeClient()
+    embedder = make_embedder(client, batch_size=3, max_workers=4)
+    texts = [f"t{i}" for i in range(10)]
+    embeddings = embedder.embed(texts)
+    assert embeddings.shape == (10, 4)
+    assert embeddings.dtype == np.float32
+    assert embeddings[:, 0].tolist() == list(range(10))
+    assert sorted(len(batch) for batch in client.batches) == [1, 3, 3, 3]
+
+
+def test_failed_batch_is_retried():
+    client = FakeClient(failures=1)
+    embeddings = make_embedder(client, batch_size=8, max_retries=3).embed(["t1", "t2"])
+    assert embeddings[:, 0].tolist() == [1, 2]
+    assert len(client.batches) == 2
+
+
+def test_batch_that_keeps_failing_returns_zero_vectors():
+    client = FakeClient(failures=10)
+    embeddings = make_embedder(client, batch_size=8, max_retries=2).embed(["t1", "t2"])
+    assert not embeddings.any()
+    assert len(client.batches) == 2
+
+
+def test_empty_input():
+    assert make_embedder(FakeClient()).embed([]).shape == (0, 4)
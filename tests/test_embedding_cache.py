@@ -0,0 +1,92 @@
+import numpy as np
+
+from embedding_cache import EmbeddingCache
+
+
+def vectors(n, dim=4, seed=0):
+    return np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+
+
+def test_hits_are_returned_by_position():
+    cache = EmbeddingCache(path=None)
+    stored = vectors(2)
+    cache.put_many("m", ["a", "b"], stored)
+    found = cache.get_many("m", ["b", "x", "a", "b"])
+    assert sorted(found) == [0, 2, 3]
+    np.testing.assert_array_equal(found[0], stored[1])
+    np.testing.assert_array_equal(found[2], stored[0])
+    assert cache.get_many("other-model", ["a"]) == {}
+    assert cache.stats()["hits"] == 3
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    stored = vectors(3)
+    EmbeddingCache(path=path).put_many("m", ["a", "b", "c"], stored)
+    found = EmbeddingCache(path=path).get_many("m", ["a", "b", "c"])
+    np.testing.assert_array_equal(np.stack([found[i] for i in range(3)]), stored)
+
+
+def test_memory_tier_is_lru():
+    cache = EmbeddingCache(path=None, max_memory_items=2)
+    cache.put_many("m", ["a", "b"], vectors(2))
+    cache.get_many("m", ["a"])
+    cache.put_many("m", ["c"], vectors(1))
+    assert sorted(cache.get_many("m", ["a", "b", "c"])) == [0, 2]
+
+
+def test_disk_tier_evicts_least_recently_used(tmp_path):
+    cache = EmbeddingCache(path=str(tmp_path / "cache.sqlite"), max_memory_items=0, max_disk_items=10)
+    for i in range(12):
+        cache.put_many("m", [f"t{i}"], vectors(1, seed=i))
+    rows = cache._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+    assert rows <= 10
+    assert 11 in cache.get_many("m", [f"t{i}" for i in range(12)])
+
+
+class CountingEmbedder:
+    def __init__(self, dim):
+        self.dim = dim
+        self.calls = []
+
+    def embed(self, texts):
+        self.calls.append(list(texts))
+        return np.stack([np.full(self.dim, len(text), dtype=np.float32) for text in texts])
+
+
+def test_processor_embeds_only_cache_misses():
+    from process_store_class import CVProcessor
+
+    cache = EmbeddingCache(path=None)
+    processor = CVProcessor(embedding_cache=cache, parse_cache_dir="")
+    processor.embedder = CountingEmbedder(processor.embedding_dim)
+    processor.get_embeddings(["a", "bb"])
+    embeddings = processor.get_embeddings(["bb", "ccc", "a"])
+    assert processor.embedder.calls == [["a", "bb"], ["ccc"]]
+    assert embeddings[:, 0].tolist() == [2, 3, 1]
+
+
+def test_changing_embed_dim_misses_the_cache(monkeypatch):
+    from process_store_class import CVProcessor
+
+    cache = EmbeddingCache(path=None)
+    processor = CVProcessor(embedding_cache=cache, parse_cache_dir="")
+    processor.embedder = CountingEmbedder(processor.embedding_dim)
+    processor.get_embeddings(["a"])
+
+    monkeypatch.setenv("EMBED_DIM", "8")
+    smaller = CVProcessor(embedding_cache=cache, parse_cache_dir="")
+    smaller.embedder = CountingEmbedder(8)
+    assert smaller.get_embeddings(["a"]).shape == (1, 8)
+    assert smaller.embedder.calls == [["a"]]
+
+
+def test_disk_count_is_tracked_without_recounting(tmp_path):
+    cache = EmbeddingCache(path=str(tmp_path / "cache.sqlite"), max_memory_items=0, max_disk_items=10)
+    cache.put_many("m", ["a", "b"], vectors(2))
+    cache.put_many("m", ["b", "c"], vectors(2, seed=1))
+    assert cache._disk_items == 3
+    assert EmbeddingCache(path=str(tmp_path / "cache.sqlite"))._disk_items == 3
+    for i in range(12):
+        cache.put_many("m", [f"t{i}"], vectors(1, seed=i))
+    assert cache._disk_items == cache._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0] <= 10
@@ -0,0 +1,65 @@
+import pytest
+from langchain.schema import Document
+
+from conftest import CVS, bag_of_words
+from process_store_class import FAISSVectorStore
+
+DIM = 64
+
+
+def make_store(filter_exact_max, **config):
+    store = FAISSVectorStore(dimension=DIM, wal=False, **config)
+    store.filter_exact_max = filter_exact_max
+    for upload, (source, chunks) in enumerate(CVS.items()):
+        documents = [Document(page_content=text, metadata={"source": source, "chunk_id": i,
+                                                           "uploaded_at": 1000.0 * (upload + 1)})
+                     for i, text in enumerate(chunks)]
+        store.add_documents(documents, bag_of_words(chunks, DIM))
+    return store
+
+
+# filter_exact_max=0 buộc đi qua IDSelector của FAISS, 4096 chấm điểm trực tiếp tập id nhỏ
+@pytest.mark.parametrize("filter_exact_max", [0, 4096])
+@pytest.mark.parametrize("config", [{"index_factory": "Flat"}, {"index_factory": "HNSW32"},
+                                    {"index_factory": "IVF2,Flat", "min_train_size": 4}])
+def test_filtered_search_returns_only_matching_chunks(filter_exact_max, config):
+    store = make_store(filter_exact_max, **config)
+    query = bag_of_words(["Python Django"], DIM)[0]
+    cases = [
+        ({"sources": ["b.pdf", "c.pdf"]}, {"b.pdf", "c.pdf"}),
+        ({"uploaded_after": 2000.0}, {"b.pdf", "c.pdf"}),
+        ({"uploaded_before": 1500.0}, {"a.pdf"}),
+        ({"sources": ["a.pdf", "c.pdf"], "uploaded_after": 1500.0, "uploaded_before": 3500.0}, {"c.pdf"}),
+    ]
+    for filters, expected in cases:
+        results = store.search(query, k=10, filters=filters)
+        assert {r["metadata"]["source"] for r in results} == expected
+        assert len(results) == sum(len(CVS[source]) for source in expected)
+    assert store.search(query, k=10, filters={"sources": ["missing.pdf"]}) == []
+
+
+def test_filters_follow_source_changes():
+    store = make_store(4096)
+    query = bag_of_words(["Java Spring Boot"], DIM)[0]
+    store.remove_source("b.pdf")
+    assert store.search(query, k=10, filters={"sources": ["b.pdf"]}) == []
+    chunks = ["# Trần Thị B\nJava, Spring Boot"]
+    store.upsert_source("b.pdf", [Document(page_content=chunks[0], metadata={"source": "b.pdf",
+                                                                             "uploaded_at": 5000.0})],
+                        bag_of_words(chunks, DIM))
+    assert [r["metadata"]["source"] for r in store.search(query, k=10, filters={"uploaded_after": 4000.0})] \
+        == ["b.pdf"]
+
+
+def test_api_builds_filters_from_dates():
+    from fastapi import HTTPException
+
+    import api
+
+    assert api.build_filters() is None
+    filters = api.build_filters(["a.pdf"], "2024-05-01", "1714521600")
+    assert filters["sources"] == ["a.pdf"]
+    assert filters["uploaded_before"] == 1714521600.0
+    assert isinstance(filters["uploaded_after"], float)
+    with pytest.raises(HTTPException):
+        api.build_filters(uploaded_after="not a date")
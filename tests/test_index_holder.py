@@ -0,0 +1,69 @@
+import numpy as np
+from langchain.schema import Document
+
+from index_holder import IndexHolder
+from process_store_class import FAISSVectorStore
+
+DIM = 8
+
+
+def documents(source, n):
+    return [Document(page_content=f"{source}{i}", metadata={"source": source}) for i in range(n)]
+
+
+def vectors(n, seed):
+    return np.random.default_rng(seed).standard_normal((n, DIM)).astype(np.float32)
+
+
+def make_store():
+    return FAISSVectorStore(dimension=DIM, wal=True)
+
+
+def test_changes_during_rebuild_are_kept(tmp_path):
+    index_path, metadata_path = str(tmp_path / "cv_index.faiss"), str(tmp_path / "cv_metadata.db")
+    store = make_store()
+    store.add_documents(documents("a.pdf", 3), vectors(3, 0))
+    store.add_documents(documents("b.pdf", 3), vectors(3, 1))
+    store.save(index_path, metadata_path)
+    holder = IndexHolder(index_path, metadata_path, store_factory=make_store, retire_seconds=0)
+    old = holder.current
+
+    def build(staging_index, staging_metadata):
+        assert (staging_index, staging_metadata) != (index_path, metadata_path)
+        # Upload / xoá qua API trong lúc build không bị chặn bởi rebuild
+        with holder.modifying(["c.pdf"]) as current:
+            current.upsert_source("c.pdf", documents("c.pdf", 2), vectors(2, 2))
+        with holder.modifying(["a.pdf"]) as current:
+            current.remove_source("a.pdf")
+        staged = make_store()
+        assert staged.load(staging_index, staging_metadata)
+        staged.upsert_source("d.pdf", documents("d.pdf", 4), vectors(4, 3))
+        staged.save(staging_index, staging_metadata)
+        staged.close_log()
+        return True
+
+    assert holder.rebuild(build)
+    assert holder.generation == 1 and holder.current is not old
+    assert old.delta_log is None
+    assert sorted(holder.current.metadata.sources()) == ["b.pdf", "c.pdf", "d.pdf"]
+
+    # Store mới được lưu vào đường dẫn chính
+    holder.current.close_log()
+    reloaded = make_store()
+    assert reloaded.load(index_path, metadata_path)
+    assert sorted(reloaded.metadata.source_counts().items()) == [("b.pdf", 3), ("c.pdf", 2), ("d.pdf", 4)]
+
+
+def test_failed_build_keeps_current_store(tmp_path):
+    index_path, metadata_path = str(tmp_path / "cv_index.faiss"), str(tmp_path / "cv_metadata.db")
+    store = make_store()
+    store.add_documents(documents("a.pdf", 3), vectors(3, 0))
+    store.save(index_path, metadata_path)
+    holder = IndexHolder(index_path, metadata_path, store_factory=make_store, retire_seconds=0)
+    current = holder.current
+
+    assert not holder.rebuild(lambda *paths: False)
+    assert holder.current is current and holder.generation == 0
+    with holder.modifying(["b.pdf"]) as store:
+        store.add_documents(documents("b.pdf", 1), vectors(1, 1))
+    assert holder._touched is None
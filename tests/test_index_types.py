@@ -0,0 +1,62 @@
+import faiss
+import numpy as np
+import pytest
+from langchain.schema import Document
+
+from process_store_class import FAISSVectorStore
+
+DIM = 16
+
+
+def add(store, n, seed=0, source="a"):
+    embeddings = np.random.default_rng(seed).standard_normal((n, DIM)).astype(np.float32)
+    store.add_documents([Document(page_content=f"{source}{i}", metadata={"source": source}) for i in range(n)],
+                        embeddings)
+    return embeddings
+
+
+@pytest.mark.parametrize("factory", ["Flat", "HNSW32", "IVF4,Flat", "IVF4,PQ4x4"])
+def test_search_finds_stored_vector(factory):
+    store = FAISSVectorStore(dimension=DIM, index_factory=factory, min_train_size=300, wal=False)
+    embeddings = add(store, 400)
+    hits = [store.search(embeddings[i], k=5) for i in range(0, 400, 40)]
+    found = sum(i * 40 in [hit["id"] for hit in row] for i, row in enumerate(hits))
+    assert found >= 9
+    assert hits[0][0]["content"].startswith("a")
+
+
+def test_ivf_stays_flat_until_enough_training_data(tmp_path):
+    store = FAISSVectorStore(dimension=DIM, index_factory="IVF4,Flat", min_train_size=100, nprobe=4, wal=False)
+    add(store, 60)
+    assert isinstance(store._base_index(), faiss.IndexFlat)
+    add(store, 60, seed=1, source="b")
+    assert faiss.try_extract_index_ivf(store.index) is not None
+    assert store.index.ntotal == 120
+
+    # Index Flat lưu trước đó được chuyển sang IVF khi load với cấu hình mới
+    flat = FAISSVectorStore(dimension=DIM, wal=False)
+    embeddings = add(flat, 120)
+    paths = str(tmp_path / "cv_index.faiss"), str(tmp_path / "cv_metadata.db")
+    flat.save(*paths)
+    loaded = FAISSVectorStore(dimension=DIM, index_factory="IVF4,Flat", min_train_size=100, nprobe=4, wal=False)
+    assert loaded.load(*paths)
+    assert faiss.try_extract_index_ivf(loaded.index) is not None
+    assert loaded.search(embeddings[7], k=1)[0]["id"] == 7
+
+
+@pytest.mark.parametrize("quantization", ["sq8", "fp16", "binary"])
+def test_quantized_store_finds_stored_vector(tmp_path, quantization):
+    store = FAISSVectorStore(dimension=DIM, quantization=quantization, wal=False)
+    # SQ8 chỉ được train khi có đủ 1000 vector
+    embeddings = add(store, 1000)
+    flat = FAISSVectorStore(dimension=DIM, wal=False)
+    add(flat, 1000)
+    assert faiss.serialize_index(store.index).nbytes < faiss.serialize_index(flat.index).nbytes
+    for i in range(0, 1000, 100):
+        assert store.search(embeddings[i], k=5)[0]["id"] == i
+
+    paths = str(tmp_path / "cv_index.faiss"), str(tmp_path / "cv_metadata.db")
+    store.save(*paths)
+    loaded = FAISSVectorStore(dimension=DIM, quantization=quantization, wal=False)
+    assert loaded.load(*paths)
+    assert loaded.search(embeddings[7], k=5)[0]["id"] == 7
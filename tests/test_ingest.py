@@ -0,0 +1,55 @@
+import os
+
+import numpy as np
+
+from ingest import IngestionPipeline
+from process_store_class import CVProcessor, FAISSVectorStore
+
+
+class FakeProcessor(CVProcessor):
+    """Parse "PDF" là file text (file rỗng coi như parse lỗi), embedding ngẫu nhiên"""
+
+    def __init__(self):
+        super().__init__(parse_cache_dir="")
+
+    def parse_cv_to_markdown(self, filepath):
+        with open(filepath, encoding="utf-8") as f:
+            return f.read()
+
+    def get_embeddings(self, texts):
+        return np.random.default_rng(len(texts)).standard_normal((len(texts), self.embedding_dim)).astype(np.float32)
+
+
+def test_parse_cache_skips_parsing(tmp_path, monkeypatch):
+    processor = CVProcessor(parse_cache_dir=str(tmp_path / "cache"))
+    pdf = tmp_path / "a.pdf"
+    pdf.write_bytes(b"%PDF-fake")
+    calls = []
+    monkeypatch.setattr(processor, "parse_local", lambda path: calls.append(path) or "# A\nPython")
+    assert processor.parse_cv_to_markdown(str(pdf)) == "# A\nPython"
+    assert processor.parse_cv_to_markdown(str(pdf)) == "# A\nPython"
+    assert len(calls) == 1
+    assert len(os.listdir(tmp_path / "cache")) == 1
+
+
+def test_pipeline_indexes_files_and_reports_failures(tmp_path):
+    for i in range(6):
+        (tmp_path / f"cv{i}.pdf").write_text(f"# CV {i}\n" + "kinh nghiệm Python " * 100, encoding="utf-8")
+    (tmp_path / "empty.pdf").write_text("", encoding="utf-8")
+    store = FAISSVectorStore(wal=False)
+    pipeline = IngestionPipeline(FakeProcessor(), store, parse_workers=3, embed_batch_size=5)
+    stages, indexed = {}, []
+    files = [f"cv{i}.pdf" for i in range(6)] + ["empty.pdf"]
+    count = pipeline.run(str(tmp_path), files, on_indexed=indexed.append,
+                         on_progress=lambda filename, stage: stages.setdefault(filename, []).append(stage))
+    assert count == 6
+    assert sorted(indexed) == sorted(files[:6])
+    assert pipeline.failed == ["empty.pdf"]
+    assert stages["empty.pdf"] == ["failed"]
+    assert stages["cv0.pdf"] == ["parsed", "chunked", "embedded", "indexed"]
+    assert sorted(store.metadata.sources()) == sorted(files[:6])
+
+    # Chạy lại cùng file: chunk cũ được thay, không nhân đôi
+    total = len(store.metadata)
+    pipeline.run(str(tmp_path), ["cv0.pdf"])
+    assert len(store.metadata) == total
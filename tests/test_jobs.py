@@ -0,0 +1,62 @@
+import threading
+import time
+
+from jobs import JobQueue
+
+
+def wait(job, timeout=5.0):
+    deadline = time.time() + timeout
+    while job.status in ("queued", "running") and time.time() < deadline:
+        time.sleep(0.01)
+    return job
+
+
+def test_submit_returns_immediately_and_reports_file_progress():
+    queue = JobQueue(workers=1)
+    release = threading.Event()
+
+    def handler(job):
+        job.update_file("a.pdf", "parsed")
+        release.wait(5)
+        job.update_file("a.pdf", "indexed")
+        job.update_file("b.pdf", "failed")
+        job.update_file("b.pdf", "indexed")
+        return {"indexed": 1}
+
+    job = queue.submit("upload", handler, ["a.pdf", "b.pdf"])
+    assert job.status in ("queued", "running")
+    assert queue.active("upload") is job
+    release.set()
+
+    state = wait(job).to_dict()
+    assert state["status"] == "completed"
+    assert state["result"] == {"indexed": 1}
+    assert state["files"] == {"a.pdf": "indexed", "b.pdf": "failed"}
+    assert state["progress"]["done"] == state["progress"]["total"] == 2
+    assert queue.active("upload") is None
+
+
+def test_job_fails_when_handler_raises_or_every_file_fails():
+    queue = JobQueue(workers=2)
+
+    def boom(job):
+        raise RuntimeError("boom")
+
+    def all_failed(job):
+        for filename in job.files:
+            job.update_file(filename, "failed")
+
+    raised = wait(queue.submit("rebuild", boom))
+    failed = wait(queue.submit("upload", all_failed, ["a.pdf"]))
+    assert raised.status == "failed" and raised.error == "boom"
+    assert failed.status == "failed" and failed.error is None
+
+
+def test_only_recent_finished_jobs_are_kept():
+    queue = JobQueue(workers=1, history=2)
+    jobs = [wait(queue.submit("upload", lambda job: None)) for _ in range(4)]
+    deadline = time.time() + 5
+    while len(queue.list()) > 2 and time.time() < deadline:
+        time.sleep(0.01)
+    assert queue.get(jobs[0].id) is None
+    assert [job.id for job in queue.list()] == [jobs[3].id, jobs[2].id]
@@ -0,0 +1,83 @@
+import json
+import sqlite3
+
+from metadata_store import MetadataStore
+
+WORDS = "python docker kinh nghiệm dự án backend java react sql aws".split()
+
+
+def legacy_db(path, n):
+    """File metadata cũ: cột `position`, chưa có bảng postings"""
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE chunks (position INTEGER PRIMARY KEY, source TEXT, content TEXT, metadata TEXT)")
+    conn.executemany(
+        "INSERT INTO chunks VALUES (?, ?, ?, ?)",
+        [(i, f"cv_{i // 10}.pdf", " ".join(WORDS[(i + j) % len(WORDS)] for j in range(20)),
+          json.dumps({"source": f"cv_{i // 10}.pdf"})) for i in range(n)],
+    )
+    conn.commit()
+    conn.close()
+
+
+def test_legacy_file_is_migrated_once(tmp_path):
+    path = str(tmp_path / "cv_metadata.db")
+    legacy_db(path, 50)
+
+    store = MetadataStore(path)
+    assert store._readonly
+    assert len(store) == 50 and store.ids() == list(range(50))
+    store.close()
+
+    conn = sqlite3.connect(path)
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(chunks)")]
+    conn.close()
+    assert "postings" in tables and "id" in columns
+
+    reopened = MetadataStore(path)
+    assert reopened._readonly and not reopened._needs_migration()
+    assert len(reopened.lexical_index()) == 50
+
+
+def test_background_lexical_load_keeps_concurrent_changes(tmp_path, monkeypatch):
+    path = str(tmp_path / "cv_metadata.db")
+    legacy_db(path, 200)
+    monkeypatch.setattr(MetadataStore, "LEXICAL_LOAD_BATCH", 20)
+
+    store = MetadataStore(path)
+    store.preload_lexical()
+    store.remove_ids(list(range(190, 200)))
+    store.append([{"content": "kafka golang", "metadata": {"source": "new.pdf"}}] * 3)
+    store.remove_ids([5])
+
+    index = store.lexical_index()
+    assert len(index) == len(store) == 192
+    assert sorted(chunk_id for chunk_id, _ in index.search("kafka", 5)) == [200, 201, 202]
+    assert all(chunk_id != 5 for chunk_id, _ in index.search("python docker", 300))
+
+
+def test_ids_of_removed_rows_are_not_reused(tmp_path):
+    store = MetadataStore()
+    ids = store.append([{"content": f"a{i}", "metadata": {"source": "a"}} for i in range(3)])
+    store.remove_ids(ids[1:])
+    assert store.next_id() == 3
+    path = str(tmp_path / "meta.db")
+    store.save(path)
+    loaded = MetadataStore(path)
+    assert loaded.next_id() == 3
+    assert loaded.append([{"content": "b", "metadata": {"source": "b"}}]) == [3]
+
+
+def test_file_is_not_changed_until_save(tmp_path):
+    path = str(tmp_path / "meta.db")
+    store = MetadataStore()
+    store.append([{"content": "a", "metadata": {"source": "a.pdf"}}])
+    store.save(path)
+
+    opened = MetadataStore(path)
+    assert opened._readonly and opened[0]["metadata"]["source"] == "a.pdf"
+    opened.append([{"content": "b", "metadata": {"source": "b.pdf"}}])
+    assert opened.ids_for_sources(["b.pdf"]) == [1]
+    assert MetadataStore(path).sources() == ["a.pdf"]
+    opened.save(path)
+    assert sorted(MetadataStore(path).sources()) == ["a.pdf", "b.pdf"]
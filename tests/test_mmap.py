@@ -0,0 +1,81 @@
+import os
+
+import numpy as np
+import pytest
+from langchain.schema import Document
+
+from process_store_class import FAISSVectorStore, MmapFlatIndex
+
+DIM = 8
+
+
+def add(store, source, n, seed):
+    embeddings = np.random.default_rng(seed).standard_normal((n, DIM)).astype(np.float32)
+    store.add_documents([Document(page_content=f"{source}{i}", metadata={"source": source}) for i in range(n)],
+                        embeddings)
+    return embeddings
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return str(tmp_path / "cv_index.faiss"), str(tmp_path / "cv_metadata.db")
+
+
+@pytest.mark.parametrize("config", [{"index_factory": "Flat"}, {"index_factory": "IVF2,Flat", "min_train_size": 8}])
+def test_mmap_load_matches_ram_load(paths, config):
+    store = FAISSVectorStore(dimension=DIM, mmap=True, wal=False, **config)
+    embeddings = add(store, "a", 20, 0)
+    store.save(*paths)
+    files = sorted(os.listdir(os.path.dirname(paths[0])))
+
+    mapped = FAISSVectorStore(dimension=DIM, mmap=True, wal=False, **config)
+    assert mapped.load(*paths)
+    assert mapped._index_mmapped
+    assert sorted(os.listdir(os.path.dirname(paths[0]))) == files  # load không ghi file nào
+    in_ram = FAISSVectorStore(dimension=DIM, mmap=False, wal=False, **config)
+    assert in_ram.load(*paths)
+    for query in embeddings[:5]:
+        assert [hit["id"] for hit in mapped.search(query, k=3)] == [hit["id"] for hit in in_ram.search(query, k=3)]
+
+
+def test_first_write_copies_mapped_index_to_ram(paths):
+    store = FAISSVectorStore(dimension=DIM, mmap=True, wal=False)
+    add(store, "a", 10, 0)
+    store.save(*paths)
+
+    mapped = FAISSVectorStore(dimension=DIM, mmap=True, wal=False)
+    assert mapped.load(*paths)
+    assert isinstance(mapped.index, MmapFlatIndex)
+    new = add(mapped, "b", 3, 1)
+    assert not mapped._index_mmapped and not isinstance(mapped.index, MmapFlatIndex)
+    assert mapped.search(new[0], k=1)[0]["metadata"]["source"] == "b"
+    mapped.remove_source("a")
+    assert mapped.ntotal == 3
+
+
+def test_mismatched_arrays_are_not_used(paths):
+    store = FAISSVectorStore(dimension=DIM, mmap=True, wal=False)
+    add(store, "a", 10, 0)
+    store.save(*paths)
+    # .npy của snapshot khác (ít dòng hơn) nhưng mới hơn file index
+    np.save(f"{paths[0]}.ids.npy", np.arange(4, dtype=np.int64))
+    np.save(f"{paths[0]}.vectors.npy", np.zeros((4, DIM), dtype=np.float32))
+
+    mapped = FAISSVectorStore(dimension=DIM, mmap=True, wal=False)
+    assert mapped.load(*paths)
+    assert not isinstance(mapped.index, MmapFlatIndex)
+    assert mapped.ntotal == 10
+
+
+def test_arrays_with_other_ids_are_not_used(paths):
+    store = FAISSVectorStore(dimension=DIM, mmap=True, wal=False)
+    add(store, "a", 10, 0)
+    store.save(*paths)
+    # Cùng số dòng nhưng là id của snapshot khác
+    np.save(f"{paths[0]}.ids.npy", np.arange(5, 15, dtype=np.int64))
+    np.save(f"{paths[0]}.vectors.npy", np.zeros((10, DIM), dtype=np.float32))
+
+    mapped = FAISSVectorStore(dimension=DIM, mmap=True, wal=False)
+    assert mapped.load(*paths)
+    assert not isinstance(mapped.index, MmapFlatIndex)
+    assert mapped.ntotal == 10
@@ -0,0 +1,49 @@
+from types import SimpleNamespace
+
+from parser import LocalPDFParser
+from process_store_class import CVProcessor
+
+PAGE = """Nguyen Van A
+Backend developer, Hà Nội
+SKILLS
+• Python, Django, PostgreSQL
+• Docker, Kubernetes
+Work Experience:
+- FPT Software (2020 - 2023): xây dựng REST API cho hệ thống thanh toán, tối ưu truy vấn SQL
+Education
+Đại học Bách Khoa Hà Nội, Kỹ sư Công nghệ thông tin
+"""
+
+
+def test_markdown_headings_and_bullets():
+    markdown = LocalPDFParser().to_markdown([PAGE])
+    lines = markdown.splitlines()
+    assert lines[0] == "# Nguyen Van A"
+    assert "## SKILLS" in lines and "## Work Experience" in lines and "## Education" in lines
+    assert "- Python, Django, PostgreSQL" in lines
+
+
+def test_quality_penalises_garbled_text():
+    parser = LocalPDFParser(min_chars_per_page=100)
+    good = parser.to_markdown([PAGE])
+    assert parser.quality(good, 1) > 0.6
+    assert parser.quality("(cid:12)(cid:34) � " * 20, 1) < 0.6
+    assert parser.quality("\n".join("a b c d e f g h".split()) * 10, 1) < 0.6
+    assert parser.quality("", 1) == 0.0
+
+
+def test_gemini_only_called_when_local_text_is_poor(tmp_path, monkeypatch):
+    processor = CVProcessor(parse_cache_dir="", local_parse_min_quality=0.6)
+    calls = []
+    monkeypatch.setattr(processor.client.models, "generate_content",
+                        lambda **kwargs: calls.append(kwargs) or SimpleNamespace(text="# Gemini"))
+    pdf = tmp_path / "a.pdf"
+    pdf.write_bytes(b"%PDF-fake")
+
+    monkeypatch.setattr(processor.local_parser, "parse", lambda path: ("# Local", 0.9))
+    assert processor.parse_cv_to_markdown(str(pdf)) == "# Local"
+    assert calls == []
+
+    monkeypatch.setattr(processor.local_parser, "parse", lambda path: ("(cid:1)", 0.1))
+    assert processor.parse_cv_to_markdown(str(pdf)) == "# Gemini"
+    assert len(calls) == 1
@@ -0,0 +1,94 @@
+from profiles import ProfileStore, extract_profile, parse_profile_query
+
+IT_CV = """# Nguyễn Văn A
+## Technical Skills
+- Python, Django, PostgreSQL, Docker, Swift, Excel
+## Work Experience
+### Senior Software Engineer | FPT Software
+03/2021 - 06/2022
+- Built REST APIs with Django
+### AI Engineer at ABC Technology JSC (Jul 2022 - Present)
+## Education
+### Đại học Bách Khoa Hà Nội
+Kỹ sư Công nghệ thông tin, 2016 - 2021
+"""
+
+# Không có mục học vấn / kỹ năng; "it", "excel", "swift", "rust" chỉ là từ thường
+PROSE_CV = """# Tran B
+## Summary
+I excel at delivering swift results and made it my goal to keep legacy systems free of rust.
+Master of ceremonies at the company year-end party.
+## Kinh nghiệm làm việc
+- Software Engineer, 2019 - 2020
+- Nhân viên kinh doanh tại Công ty TNHH XYZ, 2020 - 2021
+"""
+
+BUSINESS_CV = """# Le C
+## Học vấn
+Cử nhân Quản trị kinh doanh - Đại học Kinh tế (2015 - 2019)
+## Kỹ năng
+Excel, Power BI
+"""
+
+
+def test_skills_education_and_companies():
+    profile = extract_profile(IT_CV, "a.pdf")
+    assert {"Python", "Django", "Docker", "Swift", "Excel"} <= set(profile["skills"])
+    assert profile["degrees"] == ["Cử nhân / Kỹ sư"]
+    assert profile["fields"] == ["Công nghệ thông tin"]
+    assert profile["companies"] == ["FPT Software", "ABC Technology JSC"]
+
+
+def test_common_words_are_not_skills_degrees_or_fields():
+    profile = extract_profile(PROSE_CV, "b.pdf")
+    assert not {"Excel", "Swift", "Rust"} & set(profile["skills"])
+    assert profile["degrees"] == []
+    assert profile["fields"] == []
+    assert profile["education"] == []
+    assert profile["companies"] == ["Công ty TNHH XYZ"]
+
+
+def test_it_is_only_a_field_next_to_a_degree_word():
+    assert parse_profile_query("Is it Python?") is None
+    assert parse_profile_query("who has an IT degree")["terms"] == [("field", "Công nghệ thông tin")]
+    assert parse_profile_query("Ai có bằng cử nhân IT?")["terms"] == [
+        ("degree", "Cử nhân / Kỹ sư"), ("field", "Công nghệ thông tin")]
+
+
+def test_queries_return_matching_candidates():
+    store = ProfileStore(None)
+    for source, markdown in (("a.pdf", IT_CV), ("b.pdf", PROSE_CV), ("c.pdf", BUSINESS_CV)):
+        store.upsert(extract_profile(markdown, source))
+
+    def find(query):
+        parsed = parse_profile_query(query)
+        return [profile["source"] for profile in store.find(parsed["terms"], parsed["min_years"])]
+
+    assert find("who has an IT degree") == ["a.pdf"]
+    assert find("Ai có học vấn về công nghệ thông tin?") == ["a.pdf"]
+    assert sorted(find("who knows excel")) == ["a.pdf", "c.pdf"]
+    assert find("Ai biết Python và Docker?") == ["a.pdf"]
+    assert sorted(find("Ai có bằng cử nhân?")) == ["a.pdf", "c.pdf"]
+    assert parse_profile_query("So sánh kinh nghiệm Python của các ứng viên") is None
+
+
+def test_profiles_from_older_rules_are_outdated():
+    store = ProfileStore(None)
+    old = {**extract_profile(IT_CV, "a.pdf"), "fields": ["Công nghệ thông tin"]}
+    del old["version"]
+    store.upsert(old)
+    store.upsert(extract_profile(BUSINESS_CV, "c.pdf"))
+    assert store.outdated() == ["a.pdf"]
+
+
+def test_negation_and_upper_bounds_are_not_answered_from_profiles():
+    assert parse_profile_query("Ứng viên nào không biết Python?") is None
+    assert parse_profile_query("Ai không có kinh nghiệm Docker") is None
+    assert parse_profile_query("ai có ít hơn 3 năm kinh nghiệm") is None
+    assert parse_profile_query("Ai chưa dùng Docker?") is None
+    assert parse_profile_query("candidates with less than 2 years of experience") is None
+    assert parse_profile_query("who has under 5 years experience") is None
+    # "có ... không?" chỉ là câu hỏi
+    assert parse_profile_query("Có ai biết Python không?")["terms"] == [("skill", "Python")]
+    assert parse_profile_query("ai có ít nhất 3 năm kinh nghiệm")["min_years"] == 3.0
+    assert parse_profile_query("Ai biết Python không?") is None
@@ -0,0 +1,74 @@
+import time
+
+from reranker import CrossEncoderReranker
+
+
+class SlowModel:
+    """Cross-encoder giả: điểm = số lần "python" xuất hiện, mỗi cặp tốn `pair_ms`"""
+
+    def __init__(self, pair_ms):
+        self.pair_ms = pair_ms
+        self.batches = []
+
+    def predict(self, pairs, batch_size, show_progress_bar):
+        self.batches.append(len(pairs))
+        time.sleep(self.pair_ms * len(pairs) / 1000)
+        return [content.lower().count("python") for _, content in pairs]
+
+
+def results(n):
+    return [{"content": f"chunk {i} " + "python " * (i % 4), "score": 1.0 - i / 100} for i in range(n)]
+
+
+def test_cold_start_times_one_pair_before_a_batch():
+    model = SlowModel(pair_ms=20)
+    reranker = CrossEncoderReranker(batch_size=16, budget_ms=100, model=model)
+    ranked, stats = reranker.rerank("python", results(16), top_k=3)
+    # Cặp đầu được chấm riêng để đo; batch 15 cặp (~300ms) vượt ngân sách nên không chạy
+    assert model.batches == [1]
+    assert stats["rerank_fallback"] and stats["rerank_scored"] == 1
+    assert [r["content"] for r in ranked] == [r["content"] for r in results(3)]
+    assert reranker.stats()["pair_ms"] >= 20
+
+
+def test_rerank_orders_by_model_score_and_caches():
+    model = SlowModel(pair_ms=0)
+    reranker = CrossEncoderReranker(batch_size=4, model=model)
+    ranked, stats = reranker.rerank("Python", results(8), top_k=2)
+    assert [r["rerank_score"] for r in ranked] == [3, 3]
+    assert not stats["rerank_fallback"] and stats["rerank_scored"] == 8
+    assert model.batches == [1, 4, 3]
+
+    # Query chỉ khác hoa/thường và khoảng trắng: toàn bộ lấy từ cache
+    again, stats = reranker.rerank("  python ", results(8), top_k=2)
+    assert again == ranked
+    assert stats["rerank_cache_hits"] == 8 and model.batches == [1, 4, 3]
+
+
+def test_budget_exceeded_keeps_faiss_order():
+    model = SlowModel(pair_ms=5)
+    reranker = CrossEncoderReranker(batch_size=8, budget_ms=30, model=model)
+    reranker.rerank("warm up", results(1), top_k=1)
+    ranked, stats = reranker.rerank("python", results(16), top_k=3)
+    assert stats["rerank_fallback"] and stats["rerank_scored"] == 0
+    assert ranked == results(3)
+    assert reranker.stats()["fallbacks"] == 1
+
+
+def test_model_not_loaded_keeps_faiss_order():
+    class Loading(CrossEncoderReranker):
+        def _load(self):
+            pass
+
+    reranker = Loading(model=None)
+    ranked, stats = reranker.rerank("python", results(5), top_k=2)
+    assert ranked == results(2) and stats["rerank_fallback"]
+
+
+def test_chatbot_reranks_overfetched_chunks(make_chatbot):
+    bot = make_chatbot()
+    bot.reranker = CrossEncoderReranker(model=SlowModel(pair_ms=0))
+    context, sources = bot.search_relevant_context("python", top_k=1)
+    assert sources[0]["metadata"]["source"] == "a.pdf"
+    assert sources[0]["rerank_score"] == 1
+    assert bot.reranker.stats()["misses"] == bot.rerank_factor
@@ -0,0 +1,20 @@
+import numpy as np
+
+from conftest import bag_of_words
+
+
+def test_search_batch_matches_single_queries(make_chatbot):
+    store = make_chatbot().vector_store
+    queries = bag_of_words(["python django", "kubernetes aws", "react figma"], store.dimension)
+    batch = store.search_batch(queries, k=3)
+    assert [[hit["id"] for hit in row] for row in batch] == \
+        [[hit["id"] for hit in store.search(query, k=3)] for query in queries]
+    assert [row[0]["metadata"]["source"] for row in batch] == ["a.pdf", "b.pdf", "c.pdf"]
+    assert store.search_batch(np.zeros((0, store.dimension), dtype=np.float32)) == []
+
+
+def test_search_many_matches_search_relevant_context(make_chatbot):
+    bot = make_chatbot()
+    queries = ["Ai biết Django?", "kinh nghiệm Kubernetes", "thiết kế giao diện"]
+    assert bot.search_many(queries, top_k=2) == [bot.search_relevant_context(query, top_k=2) for query in queries]
+    assert bot.search_many([]) == []
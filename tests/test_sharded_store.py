@@ -0,0 +1,19 @@
+import numpy as np
+from langchain.schema import Document
+
+from sharded_store import ShardedVectorStore
+
+
+def test_metadata_is_merged_across_shards():
+    store = ShardedVectorStore(n_shards=2, threads=1)
+    try:
+        documents = [Document(page_content=f"{source}{i}", metadata={"source": source})
+                     for source, n in (("a.pdf", 2), ("b.pdf", 3), ("c.pdf", 1), ("d.pdf", 4)) for i in range(n)]
+        embeddings = np.random.default_rng(0).standard_normal((len(documents), 1024)).astype(np.float32)
+        store.add_documents(documents, embeddings)
+        assert store.metadata.source_counts() == {"a.pdf": 2, "b.pdf": 3, "c.pdf": 1, "d.pdf": 4}
+        assert sorted(store.metadata.sources()) == ["a.pdf", "b.pdf", "c.pdf", "d.pdf"]
+        assert len(store.metadata) == 10
+        assert [chunk["content"] for chunk in store.source_chunks("d.pdf")] == ["d.pdf0", "d.pdf1", "d.pdf2", "d.pdf3"]
+    finally:
+        store.close()
@@ -0,0 +1,205 @@
+import os
+
+import numpy as np
+import pytest
+from langchain.schema import Document
+
+from delta_log import DeltaLog
+from metadata_store import MetadataStore
+from process_store_class import FAISSVectorStore
+
+DIM = 8
+CONFIGS = [
+    {"index_factory": "Flat"},
+    {"index_factory": "HNSW32"},
+    {"index_factory": "IVF2,Flat", "min_train_size": 4},
+    {"index_factory": "Flat", "quantization": "binary"},
+    {"index_factory": "Flat", "coarse_dim": 4},
+]
+
+
+def documents(source, n):
+    return [Document(page_content=f"{source}{i}", metadata={"source": source}) for i in range(n)]
+
+
+def vectors(n, seed):
+    return np.random.default_rng(seed).standard_normal((n, DIM)).astype(np.float32)
+
+
+def make_store(config):
+    return FAISSVectorStore(dimension=DIM, wal=True, **config)
+
+
+def assert_consistent(store):
+    """Index và metadata chứa đúng cùng một tập id, không có vector trùng"""
+    ids = store._index_ids()
+    assert len(ids) == len(set(ids.tolist()))
+    assert sorted(ids.tolist()) == store.metadata.ids()
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return str(tmp_path / "cv_index.faiss"), str(tmp_path / "cv_metadata.db")
+
+
+@pytest.mark.parametrize("config", CONFIGS)
+def test_delta_log_replayed_on_load(paths, config):
+    store = make_store(config)
+    store.add_documents(documents("a", 4), vectors(4, 0))
+    store.save(*paths)
+    store.upsert_source("a", documents("a", 3), vectors(3, 1))
+    store.add_documents(documents("b", 2), vectors(2, 2))
+    store.commit(*paths)
+    store.close_log()
+
+    loaded = make_store(config)
+    assert loaded.load(*paths)
+    assert len(loaded.metadata) == 5
+    assert_consistent(loaded)
+
+
+@pytest.mark.parametrize("config", CONFIGS)
+def test_crash_between_index_and_metadata_replace(paths, config, monkeypatch):
+    """Process chết trong compact() sau khi thay file index, trước khi thay file metadata"""
+    store = make_store(config)
+    store.add_documents(documents("a", 4), vectors(4, 0))
+    store.add_documents(documents("b", 4), vectors(4, 1))
+    store.save(*paths)
+    new_b = vectors(7, 2)
+    store.upsert_source("b", documents("b", 7), new_b)
+    store.remove_source("a")
+    store.add_documents(documents("c", 2), vectors(2, 3))
+    store.commit(*paths)
+
+    def crash(self, path):
+        raise RuntimeError("crash")
+
+    monkeypatch.setattr(MetadataStore, "save", crash)
+    with pytest.raises(RuntimeError):
+        store.compact()
+    monkeypatch.undo()
+    store.close_log()
+
+    loaded = make_store(config)
+    assert loaded.load(*paths)
+    assert loaded.ntotal == len(loaded.metadata) == 9
+    assert sorted(loaded.metadata.sources()) == ["b", "c"]
+    assert_consistent(loaded)
+    contents = [r["content"] for r in loaded.search(new_b[:1].copy(), k=4)]
+    assert contents[0] == "b0"
+    assert len(contents) == len(set(contents))
+
+
+def test_compaction_clears_log_and_keeps_state(paths):
+    store = make_store({"index_factory": "Flat"})
+    store.add_documents(documents("a", 4), vectors(4, 0))
+    store.save(*paths)
+    store.upsert_source("a", documents("a", 2), vectors(2, 1))
+    assert store.compact()
+    assert store.delta_log.read() == []
+    store.close_log()
+
+    loaded = make_store({"index_factory": "Flat"})
+    assert loaded.load(*paths)
+    assert loaded.ntotal == len(loaded.metadata) == 2
+    assert_consistent(loaded)
+
+
+def test_removed_ids_are_not_reused_after_reload(paths):
+    store = make_store({"index_factory": "Flat"})
+    store.add_documents(documents("a", 3), vectors(3, 0))
+    store.add_documents(documents("b", 2), vectors(2, 1))
+    store.save(*paths)
+    store.remove_source("b")
+    store.commit(*paths)
+    store.close_log()
+
+    loaded = make_store({"index_factory": "Flat"})
+    assert loaded.load(*paths)
+    loaded.add_documents(documents("c", 1), vectors(1, 2))
+    assert loaded.metadata.ids_for_sources(["c"]) == [5]
+    assert_consistent(loaded)
+
+
+def test_hnsw_remove_marks_tombstones_without_rebuilding(paths):
+    store = make_store({"index_factory": "HNSW32"})
+    store.add_documents(documents("a", 10), vectors(10, 0))
+    store.add_documents(documents("b", 10), vectors(10, 1))
+    graph = store.index
+    store.remove_source("a")
+    assert store.index is graph
+    assert store.ntotal == 10
+    assert_consistent(store)
+    results = store.search(vectors(1, 0)[0], k=20)
+    assert {r["metadata"]["source"] for r in results} == {"b"}
+
+    store.upsert_source("b", documents("b", 3), vectors(3, 2))
+    assert store.ntotal == 3
+    assert_consistent(store)
+
+
+def test_hnsw_tombstones_are_purged_in_snapshot(paths):
+    store = make_store({"index_factory": "HNSW32"})
+    store.add_documents(documents("a", 10), vectors(10, 0))
+    store.add_documents(documents("b", 10), vectors(10, 1))
+    store.remove_source("a")
+    store.save(*paths)
+    store.close_log()
+
+    loaded = make_store({"index_factory": "HNSW32"})
+    assert loaded.load(*paths)
+    assert loaded.index.ntotal == loaded.ntotal == 10
+    assert len(loaded._tombstones) == 0
+    assert_consistent(loaded)
+
+
+def test_reading_log_with_torn_tail_does_not_modify_it(tmp_path):
+    path = str(tmp_path / "cv_index.faiss.wal")
+    log = DeltaLog(path)
+    log.append({"op": "remove", "ids": [1]})
+    log.close()
+    with open(path, "ab") as f:
+        f.write(b'{"op": "rem')
+    size = os.path.getsize(path)
+
+    log = DeltaLog(path)
+    assert log.read() == [{"op": "remove", "ids": [1]}]
+    assert os.path.getsize(path) == size
+    log.append({"op": "remove", "ids": [2]})
+    assert log.read() == [{"op": "remove", "ids": [1]}, {"op": "remove", "ids": [2]}]
+    log.clear()
+    assert os.path.getsize(path) == 0
+    log.close()
+
+
+def test_index_converted_on_load_is_written_by_commit(tmp_path, paths):
+    import json
+
+    import faiss
+
+    # Định dạng cũ: index không có id + cv_metadata.json
+    legacy = faiss.IndexFlatIP(DIM)
+    legacy.add(vectors(5, 0))
+    faiss.write_index(legacy, paths[0])
+    with open(tmp_path / "cv_metadata.json", "w", encoding="utf-8") as f:
+        json.dump([{"content": f"a{i}", "metadata": {"source": "a"}} for i in range(5)], f)
+
+    store = make_store({"index_factory": "Flat"})
+    assert store.load(*paths)
+    assert store._snapshot_outdated
+    store.commit(*paths)
+    store.close_log()
+    assert isinstance(faiss.read_index(paths[0]), faiss.IndexIDMap2)
+
+    loaded = make_store({"index_factory": "Flat"})
+    assert loaded.load(*paths)
+    assert not loaded._snapshot_outdated
+    assert_consistent(loaded)
+
+    # Index Flat được chuyển sang loại index đã cấu hình lúc load cũng được ghi lại
+    loaded.close_log()
+    ivf = make_store({"index_factory": "IVF2,Flat", "min_train_size": 4})
+    assert ivf.load(*paths)
+    ivf.commit(*paths)
+    ivf.close_log()
+    assert faiss.try_extract_index_ivf(faiss.read_index(paths[0])) is not None